@@ -0,0 +1,143 @@
+import argparse
+import asyncio
+from contextlib import asynccontextmanager
+from typing import Any, Dict, List, Optional
+
+import uvicorn
+from fastapi import Depends, FastAPI, HTTPException
+from fastapi.responses import PlainTextResponse
+from pydantic import BaseModel, Field
+
+from dependencies import async_query_service
+from milvus.async_service import AsyncQueryService, close_async_query_service
+from milvus.question_answering import best_answer
+from milvus.search_profiles import get_search_profiles
+from milvus.tracing import trace_request
+from milvus.warmup import is_ready, warm_up, warmup_report
+from myLogger.Logger import getLogger as GetLogger
+from utils.metrics import CONTENT_TYPE, REGISTRY
+from config import APP_NAME, API_HOST, API_PORT, API_WORKERS, API_MAX_BATCH_SIZE, QA_WARMUP
+
+log = GetLogger(__name__)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # uvicorn accepts connections only after the startup part returned
+    if QA_WARMUP:
+        await asyncio.get_running_loop().run_in_executor(None, warm_up)
+    try:
+        yield
+    finally:
+        close_async_query_service()
+
+
+app = FastAPI(title=APP_NAME, description="Question answering over Milvus and MySQL", lifespan=lifespan)
+
+
+class Answer(BaseModel):
+    id: str
+    question: str
+    answer: str
+    distance: float
+
+
+class AnswerRequest(BaseModel):
+    question: str = Field(..., min_length=1)
+    explain: bool = False
+    profile: Optional[str] = Field(None, description='search profile: "fast", "balanced" or "accurate"')
+
+
+class AnswerResponse(BaseModel):
+    question: str
+    answer: str
+    answers: List[Answer]
+    explain: Optional[Dict[str, Any]] = None
+
+
+class SearchRequest(BaseModel):
+    questions: List[str] = Field(..., min_length=1)
+    profile: Optional[str] = Field(None, description='search profile: "fast", "balanced" or "accurate"')
+
+
+class SearchResponse(BaseModel):
+    results: List[AnswerResponse]
+
+
+def check_profile(profile: Optional[str], service: AsyncQueryService) -> None:
+    profiles = get_search_profiles().names(service.service.collection_name)
+    if profile is not None and profile not in profiles:
+        raise HTTPException(status_code=400, detail=f'Unknown search profile "{profile}", expected one of {profiles}')
+
+
+@app.get("/health")
+async def health():
+    return {"status": "ok"}
+
+
+@app.get("/ready")
+async def ready():
+    """
+    Readiness probe: 200 once the warm-up completed, 503 before
+    """
+    if not is_ready():
+        raise HTTPException(status_code=503, detail="Warming up")
+    return {"status": "ready", "warmup_s": warmup_report()}
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """
+    Prometheus text-format metrics of this worker process
+    """
+    return PlainTextResponse(REGISTRY.render(), media_type=CONTENT_TYPE)
+
+
+@app.post("/answer", response_model=AnswerResponse)
+async def answer(request: AnswerRequest, service: AsyncQueryService = Depends(async_query_service)):
+    """
+    Answers a single question with the best answer and the ranked candidates; with ``explain`` the
+    response also carries the per-stage latency breakdown, cache hits and top-k similarities
+    """
+    check_profile(request.profile, service)
+    with trace_request(request.question) as trace:
+        answers = await service.search_answers(request.question, profile=request.profile)
+        best = best_answer(answers)
+    return AnswerResponse(question=request.question, answer=best, answers=answers,
+                          explain=trace.to_dict() if request.explain else None)
+
+
+@app.post("/search", response_model=SearchResponse)
+async def search(request: SearchRequest, service: AsyncQueryService = Depends(async_query_service)):
+    """
+    Answers many questions with one batched encode, search and metadata fetch
+    """
+    if len(request.questions) > API_MAX_BATCH_SIZE:
+        raise HTTPException(status_code=413,
+                            detail=f"At most {API_MAX_BATCH_SIZE} questions per request")
+    check_profile(request.profile, service)
+    results = await service.search_answers_batch(request.questions, profile=request.profile)
+    return SearchResponse(results=[AnswerResponse(question=question, answer=best_answer(answers), answers=answers)
+                                   for question, answers in zip(request.questions, results)])
+
+
+def serve(host: str = API_HOST, port: int = API_PORT, workers: int = API_WORKERS) -> None:
+    """
+    Runs the API with ``workers`` uvicorn worker processes; each worker owns its own pools and encoder
+
+    :param host: bind address
+    :param port: bind port
+    :param workers: number of worker processes
+    :return: None
+    """
+    log.info(f"Starting API on {host}:{port} with {workers} worker(s)")
+    uvicorn.run("api:app", host=host, port=port, workers=workers)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Question answering API")
+    parser.add_argument("--host", default=API_HOST)
+    parser.add_argument("--port", type=int, default=API_PORT)
+    parser.add_argument("--workers", type=int, default=API_WORKERS)
+    args = parser.parse_args()
+    serve(host=args.host, port=args.port, workers=args.workers)
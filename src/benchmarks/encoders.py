@@ -0,0 +1,238 @@
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, Sequence
+
+import numpy as np
+from sklearn.preprocessing import normalize
+
+from benchmarks.serving import git_revision, load_corpus, sample_queries, summarize, synthetic_corpus
+from milvus.ingestion import encode_bucketed, token_budget_batches, token_lengths
+from utils.encoder_backends import BACKENDS, apply_backend
+from utils.models import default_factories
+from myLogger.Logger import getLogger as GetLogger
+from config import DATASET_PATH, MODEL_DEFAULT, QA_INGEST_TOKEN_BUDGET
+
+log = GetLogger(__name__)
+
+########################################################################################################################
+# Encoder benchmark
+#
+# Compares the encoder backends (see ``utils.encoder_backends``) with the fp32 model on the same texts: batched
+# throughput and speedup, single-query latency, the cosine similarity of every embedding with its fp32 embedding,
+# and how many of the fp32 top-k neighbours of a query each backend still retrieves. With --ingest it also compares
+# fixed-size ingestion batches with the token-budget batches of ``milvus.ingestion``.
+#
+#   cd src && python -m benchmarks.encoders --texts 1000 --ingest --output ../encoders.json
+########################################################################################################################
+
+
+def encode(model: Any, texts: Sequence[str], batch_size: int) -> np.ndarray:
+    embeddings = np.asarray(model.encode(list(texts), batch_size=batch_size), dtype=np.float32)
+    return normalize(embeddings.reshape(len(texts), -1))
+
+
+def agreement(reference: np.ndarray, candidate: np.ndarray, reference_queries: np.ndarray,
+              candidate_queries: np.ndarray, k: int = 5) -> Dict[str, float]:
+    """
+    Agreement of a backend's embeddings with the fp32 ones
+
+    :param reference: normalized fp32 embeddings of the corpus
+    :param candidate: normalized backend embeddings of the same corpus
+    :param reference_queries: normalized fp32 embeddings of the queries
+    :param candidate_queries: normalized backend embeddings of the same queries
+    :param k: neighbours per query
+    :return: cosine statistics and recall@k of the fp32 neighbours
+    """
+    cosine = np.sum(reference * candidate, axis=1)
+    k = min(k, len(reference))
+    exact = np.argsort(-(reference_queries @ reference.T), axis=1)[:, :k]
+    found = np.argsort(-(candidate_queries @ candidate.T), axis=1)[:, :k]
+    recall = np.mean([len(set(e).intersection(f)) / k for e, f in zip(exact, found)])
+    return {
+        "cosine_mean": round(float(cosine.mean()), 6),
+        "cosine_min": round(float(cosine.min()), 6),
+        "cosine_p01": round(float(np.percentile(cosine, 1)), 6),
+        f"recall_at_{k}": round(float(recall), 4),
+    }
+
+
+def bench_encoder(model: Any, texts: Sequence[str], queries: Sequence[str], batch_size: int,
+                  repeats: int = 1) -> Dict[str, Any]:
+    """
+    Batched throughput over the corpus and per-query latency of one encoder
+
+    :param model: encoder
+    :param texts: corpus texts
+    :param queries: queries, encoded one at a time
+    :param batch_size: encoder batch size of the corpus
+    :param repeats: timed passes over the corpus, the fastest counts
+    :return: {"texts_per_s", "query": latency summary, "embeddings", "query_embeddings"}
+    """
+    encode(model, texts[:batch_size], batch_size)
+    best = None
+    for _ in range(max(1, repeats)):
+        started = time.perf_counter()
+        embeddings = encode(model, texts, batch_size)
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    latencies, query_embeddings = [], []
+    started = time.perf_counter()
+    for query in queries:
+        query_started = time.perf_counter()
+        query_embeddings.append(encode(model, [query], 1)[0])
+        latencies.append(time.perf_counter() - query_started)
+    return {
+        "texts_per_s": round(len(texts) / best, 2) if best > 0 else 0.0,
+        "query": summarize(latencies, len(queries), time.perf_counter() - started),
+        "embeddings": embeddings,
+        "query_embeddings": np.stack(query_embeddings) if query_embeddings else np.zeros((0, embeddings.shape[1])),
+    }
+
+
+def compare_encoders(encoders: Dict[str, Callable[[], Any]], texts: Sequence[str], queries: Sequence[str],
+                     batch_size: int = 32, k: int = 5, repeats: int = 1,
+                     reference: str = "fp32") -> Dict[str, Dict[str, Any]]:
+    """
+    Benchmarks every encoder and measures its agreement with the reference encoder
+
+    :param encoders: {name: callable returning the encoder}; encoders are built one at a time
+    :param texts: corpus texts
+    :param queries: queries
+    :param batch_size: encoder batch size of the corpus
+    :param k: neighbours per query of the retrieval agreement
+    :param repeats: timed passes over the corpus
+    :param reference: name of the reference encoder, benchmarked first
+    :return: per encoder, throughput, speedup, query latency and agreement
+    """
+    names = [reference] + [name for name in encoders if name != reference]
+    results, baseline = {}, None
+    for name in names:
+        log.info(f"Benchmarking the {name} encoder")
+        started = time.perf_counter()
+        model = encoders[name]()
+        build_s = time.perf_counter() - started
+        result = bench_encoder(model, texts, queries, batch_size, repeats=repeats)
+        del model
+        embeddings, query_embeddings = result.pop("embeddings"), result.pop("query_embeddings")
+        if baseline is None:
+            baseline = (embeddings, query_embeddings, result["texts_per_s"], result["query"]["p50_ms"])
+        result["build_s"] = round(build_s, 3)
+        result["speedup"] = round(result["texts_per_s"] / baseline[2], 3) if baseline[2] else None
+        result["query_speedup"] = round(baseline[3] / result["query"]["p50_ms"], 3) \
+            if result["query"]["p50_ms"] else None
+        result["agreement"] = agreement(baseline[0], embeddings, baseline[1], query_embeddings, k=k)
+        results[name] = result
+    return results
+
+
+def bench_ingestion(model: Any, texts: Sequence[str], batch_size: int = 32,
+                    max_tokens: int = QA_INGEST_TOKEN_BUDGET, repeats: int = 1) -> Dict[str, Any]:
+    """
+    Bulk encoding as before, one ``encode`` call with fixed-size batches (which a sentence transformer cuts from
+    the texts sorted by character length), against token-length sorted, token-budget batches
+
+    :param model: encoder
+    :param texts: corpus texts
+    :param batch_size: texts per fixed-size batch; token-budget batches hold up to 8 times as many
+    :param max_tokens: padded tokens per token-budget batch
+    :param repeats: timed passes, the fastest counts
+    :return: throughput and padding efficiency of both, and the speedup
+    """
+    lengths = token_lengths(model, texts)
+    by_characters = np.argsort([-len(str(text)) for text in texts], kind="stable")
+    fixed = [by_characters[start:start + batch_size] for start in range(0, len(texts), batch_size)]
+    bucketed = token_budget_batches(lengths, max_tokens=max_tokens, max_batch_size=max(batch_size, 1) * 8)
+
+    def efficiency(batches):
+        return round(float(lengths.sum()) / sum(len(b) * int(lengths[b].max()) for b in batches), 4)
+
+    def fastest(fn):
+        best = None
+        for _ in range(max(1, repeats)):
+            started = time.perf_counter()
+            fn()
+            elapsed = time.perf_counter() - started
+            best = elapsed if best is None else min(best, elapsed)
+        return best
+
+    encode(model, texts[:batch_size], batch_size)
+    fixed_s = fastest(lambda: model.encode(list(texts), batch_size=batch_size))
+    bucketed_s = fastest(lambda: encode_bucketed(model, texts, max_tokens=max_tokens,
+                                                 max_batch_size=max(batch_size, 1) * 8))
+    return {
+        "fixed": {"batches": len(fixed), "texts_per_s": round(len(texts) / fixed_s, 2),
+                  "padding_efficiency": efficiency(fixed)},
+        "bucketed": {"batches": len(bucketed), "texts_per_s": round(len(texts) / bucketed_s, 2),
+                     "padding_efficiency": efficiency(bucketed), "max_tokens": max_tokens},
+        "speedup": round(fixed_s / bucketed_s, 3) if bucketed_s > 0 else None,
+    }
+
+
+def main(argv: Sequence[str] = None) -> Dict[str, Any]:
+    parser = argparse.ArgumentParser(description="Encoder backend benchmark: speedup and agreement with fp32")
+    parser.add_argument("--model", default=MODEL_DEFAULT, help="registry model (config.MODEL_PATHS)")
+    parser.add_argument("--backends", nargs="+", default=list(BACKENDS), choices=BACKENDS)
+    parser.add_argument("--dataset", default=DATASET_PATH if os.path.isfile(DATASET_PATH) else None,
+                        help="CSV with question/answer columns, defaults to a synthetic corpus")
+    parser.add_argument("--texts", type=int, default=512, help="corpus texts encoded in batches")
+    parser.add_argument("--queries", type=int, default=100, help="queries encoded one at a time")
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--ingest", action="store_true",
+                        help="also compare fixed-size with token-budget ingestion batches (fp32)")
+    parser.add_argument("--max-tokens", type=int, default=QA_INGEST_TOKEN_BUDGET)
+    parser.add_argument("--threads", type=int, default=0, help="torch intra-op threads, 0 keeps the default")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default=None, help="write the JSON report to this file")
+    args = parser.parse_args(argv)
+
+    import torch
+    if args.threads > 0:
+        torch.set_num_threads(args.threads)
+    if args.dataset:
+        questions, answers = load_corpus(args.dataset, args.texts)
+    else:
+        questions, answers = synthetic_corpus(args.texts, seed=args.seed)
+    queries = sample_queries(questions, args.queries, seed=args.seed + 1)
+    load = default_factories("fp32")[args.model]
+    encoders = {backend: (lambda backend=backend: apply_backend(load(), backend, inplace=True))
+                for backend in dict.fromkeys(["fp32"] + list(args.backends))}
+    results = compare_encoders(encoders, answers, queries, batch_size=args.batch_size, k=args.k,
+                               repeats=args.repeats)
+    ingestion = bench_ingestion(load(), answers, batch_size=args.batch_size, max_tokens=args.max_tokens,
+                                repeats=args.repeats) if args.ingest else None
+    report = {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "git_revision": git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "torch": torch.__version__,
+            "torch_threads": torch.get_num_threads(),
+            "model": args.model,
+            "dataset": args.dataset or "synthetic",
+            "texts": len(answers),
+            "queries": len(queries),
+            "batch_size": args.batch_size,
+        },
+        "results": results,
+    }
+    if ingestion is not None:
+        report["ingestion"] = ingestion
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    sys.stdout.write(text + "\n")
+    return report
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,370 @@
+import argparse
+import functools
+import json
+import logging
+import os
+import platform
+import subprocess
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+from sklearn.preprocessing import normalize
+
+from benchmarks.stand_ins import HashingEncoder, NumpyCollection, SQLitePool
+from milvus.batching import QueryBatcher
+from milvus.cache import SemanticCache
+from milvus.collection_state import get_collection_state
+from milvus.ingestion import encode_bucketed
+from milvus.query_service import QueryService
+from utils.models import get_model
+from myLogger.Logger import getLogger as GetLogger
+from config import MILVUS_DIMENSION, QA_BATCH_WINDOW_MS, QA_BATCH_MAX_SIZE
+
+log = GetLogger(__name__)
+
+########################################################################################################################
+# Serving benchmark
+#
+# Runs ``QueryService`` end to end against in-process stand-ins: a NumPy vector store for Milvus, SQLite for
+# MySQL and a hashing encoder (or a real sentence transformer with --model). Reports p50/p95/p99 latency and
+# QPS per scenario as JSON, so runs can be compared across commits with --baseline.
+#
+#   cd src && python -m benchmarks.serving --queries 2000 --clients 16 --output ../benchmark.json
+########################################################################################################################
+SCENARIOS = ("single", "batched", "concurrent", "microbatched")
+TABLE_NAME = "qa_benchmark"
+
+
+def synthetic_corpus(size: int, seed: int = 0, vocabulary: int = 2000) -> Tuple[List[str], List[str]]:
+    """
+    Generates question/answer pairs whose answers share most words with their questions
+
+    :param size: number of pairs
+    :param seed: random seed
+    :param vocabulary: number of distinct topic words
+    :return: questions, answers
+    """
+    rng = np.random.default_rng(seed)
+    words = np.array([f"term{i}" for i in range(vocabulary)])
+    openers = ["what is", "how do i", "can i", "why does", "when should i", "where can i find"]
+    questions, answers = [], []
+    for i in range(size):
+        topic = " ".join(rng.choice(words, size=4, replace=False))
+        questions.append(f"{openers[i % len(openers)]} {topic}")
+        answers.append(f"about {topic}: " + " ".join(rng.choice(words, size=12)))
+    return questions, answers
+
+
+def load_corpus(path: str, size: int = None) -> Tuple[List[str], List[str]]:
+    """
+    Reads question/answer pairs from a CSV with ``question`` and ``answer`` columns
+
+    :param path: CSV path
+    :param size: optional maximum number of rows
+    :return: questions, answers
+    """
+    data = pd.read_csv(path, nrows=size)
+    return data["question"].astype(str).tolist(), data["answer"].astype(str).tolist()
+
+
+def sample_queries(questions: Sequence[str], count: int, seed: int = 1) -> List[str]:
+    """
+    Draws questions from the corpus and drops one word from each, so queries are near but not exact matches
+
+    :param questions: corpus questions
+    :param count: number of queries
+    :param seed: random seed
+    :return: queries
+    """
+    rng = np.random.default_rng(seed)
+    queries = []
+    for i in rng.integers(0, len(questions), size=count):
+        words = questions[i].split()
+        if len(words) > 2:
+            del words[rng.integers(0, len(words))]
+        queries.append(" ".join(words))
+    return queries
+
+
+def build_service(questions: Sequence[str], answers: Sequence[str], model: Any,
+                  caches: bool = False, batch_size: int = 64, hybrid: bool = False) -> QueryService:
+    """
+    Indexes the corpus into the stand-ins and wraps them in a ``QueryService``; like the ingestion path,
+    the answers are embedded and their row ids are the vector ids
+
+    :param questions: corpus questions
+    :param answers: corpus answers
+    :param model: encoder
+    :param caches: keep the embedding, answer and semantic caches; off measures the uncached path
+    :param batch_size: maximum encoder batch size for indexing
+    :param hybrid: fuse a BM25 search over the questions with the dense search
+    :return: query service
+    """
+    embeddings = normalize(encode_bucketed(model, list(answers), max_batch_size=batch_size))
+    collection = NumpyCollection(TABLE_NAME, embeddings)
+    get_collection_state(collection).mark_loaded()
+    pool = SQLitePool()
+    with pool.cursor() as cursor:
+        cursor.execute(f"CREATE TABLE {TABLE_NAME} (id VARCHAR(128) PRIMARY KEY, question TEXT NOT NULL, "
+                       f"answer TEXT NOT NULL);")
+        cursor.executemany("insert into " + TABLE_NAME + " (id, question, answer) values (%s, %s, %s);",
+                           [(str(i), q, a) for i, q, a in zip(collection.ids, questions, answers)])
+    service = QueryService(collection=collection, table_name=TABLE_NAME, model=model, pool=pool, hybrid=hybrid)
+    if not caches:
+        service.embedding_cache = service.answer_cache = service.semantic_cache = None
+    elif service.semantic_cache is not None and service.semantic_cache.dim != embeddings.shape[1]:
+        # e.g. a small model with fewer dimensions than MILVUS_DIMENSION
+        service.semantic_cache = SemanticCache(capacity=service.semantic_cache.capacity, dim=embeddings.shape[1],
+                                               threshold=service.semantic_cache.threshold)
+    return service
+
+
+def summarize(latencies: Sequence[float], questions: int, elapsed: float) -> Dict[str, Any]:
+    """
+    Latency percentiles and throughput of a scenario
+
+    :param latencies: seconds per request
+    :param questions: questions answered
+    :param elapsed: wall time of the scenario in seconds
+    :return: summary dict, latencies in milliseconds
+    """
+    ms = np.asarray(latencies) * 1000.0
+    return {
+        "requests": len(ms),
+        "questions": questions,
+        "elapsed_s": round(elapsed, 4),
+        "qps": round(questions / elapsed, 2) if elapsed > 0 else 0.0,
+        "mean_ms": round(float(ms.mean()), 3),
+        "p50_ms": round(float(np.percentile(ms, 50)), 3),
+        "p95_ms": round(float(np.percentile(ms, 95)), 3),
+        "p99_ms": round(float(np.percentile(ms, 99)), 3),
+        "max_ms": round(float(ms.max()), 3),
+    }
+
+
+def _timed(fn, *args) -> float:
+    started = time.perf_counter()
+    fn(*args)
+    return time.perf_counter() - started
+
+
+def bench_single(service: QueryService, queries: Sequence[str]) -> Dict[str, Any]:
+    """One client, one question per request"""
+    started = time.perf_counter()
+    latencies = [_timed(service.search_answers, q) for q in queries]
+    return summarize(latencies, len(queries), time.perf_counter() - started)
+
+
+def bench_batched(service: QueryService, queries: Sequence[str], batch_size: int) -> Dict[str, Any]:
+    """One client, ``batch_size`` questions per request"""
+    batches = [list(queries[i:i + batch_size]) for i in range(0, len(queries), batch_size)]
+    started = time.perf_counter()
+    latencies = [_timed(service.search_answers_batch, batch) for batch in batches]
+    result = summarize(latencies, len(queries), time.perf_counter() - started)
+    result["batch_size"] = batch_size
+    return result
+
+
+def _run_clients(ask, queries: Sequence[str], clients: int) -> Tuple[List[float], float]:
+    latencies: List[List[float]] = [[] for _ in range(clients)]
+    errors: List[BaseException] = []
+
+    def client(index: int) -> None:
+        try:
+            for q in queries[index::clients]:
+                latencies[index].append(_timed(ask, q))
+        except BaseException as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=client, args=(i,), name=f"bench-client-{i}") for i in range(clients)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    if errors:
+        raise errors[0]
+    return [latency for per_client in latencies for latency in per_client], elapsed
+
+
+def bench_concurrent(service: QueryService, queries: Sequence[str], clients: int) -> Dict[str, Any]:
+    """``clients`` threads, one question per request, each request served on its own"""
+    latencies, elapsed = _run_clients(service.search_answers, queries, clients)
+    result = summarize(latencies, len(queries), elapsed)
+    result["clients"] = clients
+    return result
+
+
+def bench_microbatched(service: QueryService, queries: Sequence[str], clients: int,
+                       window_ms: float = QA_BATCH_WINDOW_MS,
+                       max_batch_size: int = QA_BATCH_MAX_SIZE) -> Dict[str, Any]:
+    """``clients`` threads whose questions are merged by a ``QueryBatcher``"""
+    batcher = QueryBatcher(handler=functools.partial(service.search_answers_batch, lookup_cache=False),
+                           window_ms=window_ms, max_batch_size=max_batch_size, name="bench-batcher")
+    try:
+        latencies, elapsed = _run_clients(batcher, queries, clients)
+    finally:
+        batcher.stop()
+    result = summarize(latencies, len(queries), elapsed)
+    result.update(clients=clients, window_ms=window_ms, mean_batch_size=round(batcher.stats()["mean_batch_size"], 2))
+    return result
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), timeout=5).stdout.strip() or None
+    except Exception:
+        return None
+
+
+def run_benchmark(corpus_size: int = 10000,
+                  queries: int = 1000,
+                  batch_size: int = 32,
+                  clients: int = 8,
+                  scenarios: Sequence[str] = SCENARIOS,
+                  model: Any = None,
+                  dataset: str = None,
+                  caches: bool = False,
+                  hybrid: bool = False,
+                  window_ms: float = QA_BATCH_WINDOW_MS,
+                  warmup: int = 20,
+                  seed: int = 0) -> Dict[str, Any]:
+    """
+    Runs the selected scenarios and returns the report
+
+    :param corpus_size: number of indexed question/answer pairs
+    :param queries: questions per scenario
+    :param batch_size: questions per request of the batched scenario
+    :param clients: client threads of the concurrent scenarios
+    :param scenarios: scenarios to run, see ``SCENARIOS``
+    :param model: encoder, defaults to a ``HashingEncoder``
+    :param dataset: optional CSV with question/answer columns instead of the synthetic corpus
+    :param caches: keep the query service caches enabled
+    :param hybrid: hybrid dense plus BM25 retrieval
+    :param window_ms: micro-batching window
+    :param warmup: untimed questions before the first scenario
+    :param seed: random seed of the corpus and the queries
+    :return: report dict with "meta" and per-scenario "results"
+    """
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown:
+        raise ValueError(f"Unknown scenarios: {sorted(unknown)}, expected some of {SCENARIOS}")
+    model = model if model is not None else HashingEncoder(dim=int(MILVUS_DIMENSION))
+    if dataset:
+        corpus_questions, corpus_answers = load_corpus(dataset, corpus_size)
+    else:
+        corpus_questions, corpus_answers = synthetic_corpus(corpus_size, seed=seed)
+    started = time.perf_counter()
+    service = build_service(corpus_questions, corpus_answers, model, caches=caches, hybrid=hybrid)
+    index_s = time.perf_counter() - started
+    questions = sample_queries(corpus_questions, queries, seed=seed + 1)
+    try:
+        for q in sample_queries(corpus_questions, warmup, seed=seed + 2):
+            service.search_answers(q)
+        results = {}
+        for scenario in scenarios:
+            log.info(f"Running scenario {scenario}")
+            if scenario == "single":
+                results[scenario] = bench_single(service, questions)
+            elif scenario == "batched":
+                results[scenario] = bench_batched(service, questions, batch_size)
+            elif scenario == "concurrent":
+                results[scenario] = bench_concurrent(service, questions, clients)
+            elif scenario == "microbatched":
+                results[scenario] = bench_microbatched(service, questions, clients, window_ms=window_ms)
+    finally:
+        service.close()
+    return {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "git_revision": git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "encoder": type(model).__name__,
+            "dataset": dataset or "synthetic",
+            "corpus_size": len(corpus_questions),
+            "queries": queries,
+            "caches": caches,
+            "hybrid": hybrid,
+            "seed": seed,
+            "index_s": round(index_s, 3),
+        },
+        "results": results,
+    }
+
+
+def compare(report: Dict[str, Any], baseline: Dict[str, Any]) -> Dict[str, Dict[str, float]]:
+    """
+    Relative change of every scenario's latency percentiles and QPS against a baseline report
+
+    :param report: current report
+    :param baseline: earlier report
+    :return: per scenario, {metric: change as a fraction, e.g. -0.1 for 10% lower}
+    """
+    changes = {}
+    for scenario, result in report["results"].items():
+        before = baseline.get("results", {}).get(scenario)
+        if not before:
+            continue
+        changes[scenario] = {metric: round((result[metric] - before[metric]) / before[metric], 4)
+                             for metric in ("p50_ms", "p95_ms", "p99_ms", "qps") if before.get(metric)}
+    return changes
+
+
+def main(argv: Sequence[str] = None) -> Dict[str, Any]:
+    parser = argparse.ArgumentParser(description="Offline benchmark of the question answering serving path")
+    parser.add_argument("--corpus-size", type=int, default=10000)
+    parser.add_argument("--queries", type=int, default=1000)
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--clients", type=int, default=8)
+    parser.add_argument("--scenarios", nargs="+", default=list(SCENARIOS), choices=SCENARIOS)
+    parser.add_argument("--model", default=None,
+                        help="registry model (config.MODEL_PATHS) to use instead of the hashing encoder")
+    parser.add_argument("--encoder-cost-ms", type=float, default=0.0,
+                        help="simulated fixed cost of a forward pass of the hashing encoder")
+    parser.add_argument("--encoder-text-cost-ms", type=float, default=0.0,
+                        help="simulated per-text cost of the hashing encoder")
+    parser.add_argument("--dataset", default=None, help="CSV with question and answer columns")
+    parser.add_argument("--caches", action="store_true", help="keep the query service caches enabled")
+    parser.add_argument("--hybrid", action="store_true", help="hybrid dense plus BM25 retrieval")
+    parser.add_argument("--window-ms", type=float, default=QA_BATCH_WINDOW_MS)
+    parser.add_argument("--warmup", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default=None, help="write the JSON report to this file")
+    parser.add_argument("--baseline", default=None, help="earlier JSON report to compare against")
+    parser.add_argument("--verbose", action="store_true", help="keep the pipeline's info logging")
+    args = parser.parse_args(argv)
+
+    if not args.verbose:
+        # per-query info logging would dominate the stand-ins' latency
+        logging.disable(logging.INFO)
+    if args.model:
+        model = get_model(args.model)
+    else:
+        model = HashingEncoder(dim=int(MILVUS_DIMENSION), cost_ms=args.encoder_cost_ms,
+                               cost_per_text_ms=args.encoder_text_cost_ms)
+    report = run_benchmark(corpus_size=args.corpus_size, queries=args.queries, batch_size=args.batch_size,
+                           clients=args.clients, scenarios=args.scenarios, model=model, dataset=args.dataset,
+                           caches=args.caches, hybrid=args.hybrid, window_ms=args.window_ms, warmup=args.warmup, seed=args.seed)
+    report["meta"]["encoder"] = args.model or report["meta"]["encoder"]
+    if args.baseline:
+        with open(args.baseline) as f:
+            report["baseline"] = {"file": args.baseline, "changes": compare(report, json.load(f))}
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    sys.stdout.write(text + "\n")
+    return report
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,196 @@
+import re
+import sqlite3
+import threading
+import time
+import uuid
+import zlib
+from contextlib import contextmanager
+from typing import Any, Iterable, List, Sequence
+
+import numpy as np
+
+from myLogger.Logger import getLogger as GetLogger
+
+log = GetLogger(__name__)
+
+########################################################################################################################
+# In-process stand-ins for the serving dependencies
+#
+# They implement just the parts of the pymilvus ``Collection``, the ``MySQLConnectionPool`` and the
+# ``SentenceTransformer`` interfaces the query path uses, so ``QueryService`` runs unchanged without servers.
+########################################################################################################################
+_TOKEN = re.compile(r"\w+")
+
+
+class Hit:
+    """A search hit: primary key and inner-product similarity"""
+    __slots__ = ("id", "distance")
+
+    def __init__(self, id: int, distance: float):
+        self.id = id
+        self.distance = distance
+
+    def __repr__(self):
+        return f"Hit(id={self.id}, distance={self.distance:.4f})"
+
+
+class NumpyCollection:
+    """
+    Brute-force inner-product vector store standing in for a loaded Milvus collection
+    """
+
+    def __init__(self, name: str, embeddings: np.ndarray, ids: Sequence[int] = None, using: str = None):
+        self.name = name
+        # a connection alias of its own, so load state is never shared with another stand-in of the same name
+        self._using = using or f"benchmark-{uuid.uuid4().hex}"
+        self.embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
+        self.ids = np.asarray(ids if ids is not None else np.arange(len(self.embeddings)), dtype=np.int64)
+
+    @property
+    def num_entities(self) -> int:
+        return len(self.embeddings)
+
+    @property
+    def is_empty(self) -> bool:
+        return self.num_entities == 0
+
+    def load(self, *args, **kwargs) -> None:
+        pass
+
+    def release(self, *args, **kwargs) -> None:
+        pass
+
+    def search(self, data, anns_field: str = "embedding", param: dict = None, limit: int = 5,
+               **kwargs) -> List[List[Hit]]:
+        """
+        Exact top-``limit`` search by inner product, best first
+
+        :param data: query vectors
+        :param anns_field: ignored
+        :param param: ignored, the search is exhaustive
+        :param limit: hits per query
+        :return: one list of hits per query vector
+        """
+        queries = np.asarray(data, dtype=np.float32).reshape(len(data), -1)
+        scores = queries @ self.embeddings.T
+        limit = min(limit, scores.shape[1])
+        top = np.argpartition(-scores, limit - 1, axis=1)[:, :limit]
+        results = []
+        for row, candidates in zip(scores, top):
+            ranked = candidates[np.argsort(-row[candidates])]
+            results.append([Hit(int(self.ids[i]), float(row[i])) for i in ranked])
+        return results
+
+
+class SQLiteCursor:
+    """
+    DB-API cursor wrapper accepting the ``%s`` placeholders of pymysql
+    """
+
+    def __init__(self, cursor: sqlite3.Cursor):
+        self._cursor = cursor
+
+    @staticmethod
+    def _translate(sql: str) -> str:
+        return sql.replace("%s", "?")
+
+    def execute(self, sql: str, args: Iterable[Any] = None) -> int:
+        self._cursor.execute(self._translate(sql), tuple(args) if args is not None else ())
+        return self._cursor.rowcount
+
+    def executemany(self, sql: str, rows: Iterable[Sequence[Any]]) -> int:
+        self._cursor.executemany(self._translate(sql), [tuple(row) for row in rows])
+        return self._cursor.rowcount
+
+    def fetchone(self):
+        return self._cursor.fetchone()
+
+    def fetchall(self):
+        return self._cursor.fetchall()
+
+    def close(self) -> None:
+        self._cursor.close()
+
+
+class SQLitePool:
+    """
+    Stand-in for ``MySQLConnectionPool`` over a shared in-memory SQLite database, one connection per thread
+    """
+
+    def __init__(self, name: str = None):
+        self.uri = f"file:{name or uuid.uuid4().hex}?mode=memory&cache=shared"
+        # the in-memory database lives as long as one connection to it is open
+        self._keeper = self._connect()
+        self._local = threading.local()
+        self._connections: List[sqlite3.Connection] = []
+        self._lock = threading.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.uri, uri=True, isolation_level=None, check_same_thread=False)
+
+    def _connection(self) -> sqlite3.Connection:
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = self._local.connection = self._connect()
+            with self._lock:
+                self._connections.append(connection)
+        return connection
+
+    @contextmanager
+    def connection(self):
+        yield self._connection()
+
+    @contextmanager
+    def cursor(self):
+        cursor = SQLiteCursor(self._connection().cursor())
+        try:
+            yield cursor
+        finally:
+            cursor.close()
+
+    def warm(self, count: int = None) -> int:
+        self._connection().execute("SELECT 1")
+        return 1
+
+    def close(self) -> None:
+        with self._lock:
+            connections, self._connections = self._connections, []
+        for connection in connections:
+            connection.close()
+        self._keeper.close()
+
+
+class HashingEncoder:
+    """
+    Deterministic bag-of-words encoder (feature hashing) standing in for a sentence transformer.
+
+    Texts sharing words get similar vectors, so thresholds and caches behave plausibly. ``cost_ms`` and
+    ``cost_per_text_ms`` simulate the fixed and the per-text cost of a forward pass, so batching pays off
+    the way it does with a real model.
+    """
+
+    def __init__(self, dim: int = 768, cost_ms: float = 0.0, cost_per_text_ms: float = 0.0,
+                 max_seq_length: int = 384):
+        self.dim = dim
+        self.cost_ms = cost_ms
+        self.cost_per_text_ms = cost_per_text_ms
+        self.max_seq_length = max_seq_length
+
+    def get_sentence_embedding_dimension(self) -> int:
+        return self.dim
+
+    def _embed(self, text: str) -> np.ndarray:
+        vector = np.zeros(self.dim, dtype=np.float32)
+        for token in _TOKEN.findall(str(text).lower())[:self.max_seq_length]:
+            h = zlib.crc32(token.encode("utf-8"))
+            vector[h % self.dim] += 1.0 if (h >> 16) & 1 else -1.0
+        return vector
+
+    def encode(self, sentences, batch_size: int = 32, **kwargs) -> np.ndarray:
+        single = isinstance(sentences, str)
+        texts = [sentences] if single else list(sentences)
+        cost_ms = self.cost_ms + self.cost_per_text_ms * len(texts)
+        if cost_ms > 0:
+            time.sleep(cost_ms / 1000.0)
+        embeddings = np.stack([self._embed(text) for text in texts]) if texts else np.zeros((0, self.dim), np.float32)
+        return embeddings[0] if single else embeddings
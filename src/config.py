@@ -2,7 +2,6 @@ import json
 
 import dotenv
 import os
-from sentence_transformers import SentenceTransformer
 from myLogger.Logger import getLogger as GetLogger
 
 log = GetLogger(__name__)
@@ -22,6 +21,19 @@ APP_PORT = os.getenv("APP_PORT", "8000")
 APP_SOURCE = os.getenv("APP_SOURCE", ".").strip()
 APP_LOG_LEVEL = os.getenv("APP_LOG_LEVEL", True)
 
+# API Configuration Options
+API_HOST = os.getenv("API_HOST", "0.0.0.0")
+API_PORT = int(os.getenv("API_PORT", 8001))
+API_WORKERS = int(os.getenv("API_WORKERS", 1))
+API_MAX_BATCH_SIZE = int(os.getenv("API_MAX_BATCH_SIZE", 256))
+PREFORK_WORKERS = int(os.getenv("PREFORK_WORKERS", os.cpu_count() or 1))
+TORCH_THREADS_PER_WORKER = int(os.getenv("TORCH_THREADS_PER_WORKER", 0))  # 0: cpu count / workers
+PREFORK_RESTART_DELAY = float(os.getenv("PREFORK_RESTART_DELAY", 1.0))  # doubled after every startup failure
+PREFORK_RESTART_MAX_DELAY = float(os.getenv("PREFORK_RESTART_MAX_DELAY", 60.0))
+PREFORK_MAX_STARTUP_FAILURES = int(os.getenv("PREFORK_MAX_STARTUP_FAILURES", 5))
+PREFORK_MIN_UPTIME = float(os.getenv("PREFORK_MIN_UPTIME", 10.0))  # exits sooner count as startup failures
+METRICS_PORT = int(os.getenv("METRICS_PORT", 0))  # 0: metrics only on the API's /metrics
+
 # MySQL Configuration Options
 MYSQL_HOST = os.getenv("MYSQL_HOST", "0.0.0.0")
 MYSQL_PORT = os.getenv("MYSQL_PORT", "3306")
@@ -29,6 +41,7 @@ MYSQL_USER = os.getenv("MYSQL_USER", "milvus")
 MYSQL_PASSWORD = os.getenv("MYSQL_PASSWORD", "developer")
 MYSQL_DATABASE = os.getenv("MYSQL_DATABASE", "milvus_meta")
 MYSQL_DATABASE_TABLE_NAME = os.getenv("MYSQL_DATABASE_TABLE_NAME", "question_answering")
+MYSQL_POOL_SIZE = int(os.getenv("MYSQL_POOL_SIZE", 4))
 
 # Milvus Configuration Options
 MILVUS_USER = os.getenv("MILVUS_USER", "milvus")
@@ -40,10 +53,16 @@ MILVUS_CONNECTION_ALIAS = os.getenv("MILVUS_CONNECTION_ALIAS", "default")
 MILVUS_DIMENSION = os.getenv("MILVUS_DIMENSION", 768)
 MILVUS_INDEX_FILE_SIZE = os.getenv("MILVUS_INDEX_FILE_SIZE", 1024)
 MILVUS_METRIC_TYPE = os.getenv("MILVUS_METRIC_TYPE", "L2")
-MILVUS_INDEX_TYPE = os.getenv("MILVUS_INDEX_TYPE", "IVF_FLAT")
-MILVUS_NLIST = os.getenv("MILVUS_NLIST", 16384)
+# AUTO lets the index advisor pick the index type; MILVUS_NLIST 0 sizes nlist from the row count
+MILVUS_INDEX_TYPE = os.getenv("MILVUS_INDEX_TYPE", "AUTO").upper()
+MILVUS_NLIST = int(os.getenv("MILVUS_NLIST", 0))
+MILVUS_INDEX_MEMORY_BUDGET_MB = float(os.getenv("MILVUS_INDEX_MEMORY_BUDGET_MB", 2048))
+MILVUS_EXPECTED_ROWS = int(os.getenv("MILVUS_EXPECTED_ROWS", 100000))
 MILVUS_TOP_K = os.getenv("MILVUS_TOP_K", 10)
 MILVUS_SEARCH_PARAM = {"nprobe": 16}
+MILVUS_SEARCH_PROFILES_PATH = os.getenv("MILVUS_SEARCH_PROFILES_PATH",
+                                        f'{os.getcwd()}/Resources/search_profiles.json')
+QA_SEARCH_PROFILE = os.getenv("QA_SEARCH_PROFILE", "balanced")
 # Milvus Timeout Configuration Options
 MILVUS_TIMEOUT = 60
 MILVUS_SEARCH_TIMEOUT = 60
@@ -63,6 +82,38 @@ MILVUS_GET_PARTITION_STATS_TIMEOUT = 60
 MILVUS_GET_COLLECTION_STATS_TIMEOUT = 60
 MILVUS_CALCULATE_DISTANCE_TIMEOUT = 60
 
+# Query Serving Configuration Options
+QA_MAX_CONCURRENCY = int(os.getenv("QA_MAX_CONCURRENCY", 32))
+QA_ENCODER_WORKERS = int(os.getenv("QA_ENCODER_WORKERS", 2))
+QA_IO_WORKERS = int(os.getenv("QA_IO_WORKERS", 8))
+QA_MICRO_BATCHING = os.getenv("QA_MICRO_BATCHING", "false").lower() in ("1", "true", "yes")
+QA_BATCH_WINDOW_MS = float(os.getenv("QA_BATCH_WINDOW_MS", 5))
+QA_BATCH_MAX_SIZE = int(os.getenv("QA_BATCH_MAX_SIZE", 32))
+QA_EMBEDDING_CACHE_BYTES = int(os.getenv("QA_EMBEDDING_CACHE_BYTES", 32 * 1024 * 1024))
+QA_EMBEDDING_CACHE_CLEAN_TEXT = os.getenv("QA_EMBEDDING_CACHE_CLEAN_TEXT", "false").lower() in ("1", "true", "yes")
+# On-disk embeddings of ingested texts, keyed by model and content hash; empty disables the store
+QA_EMBEDDING_STORE_PATH = os.getenv("QA_EMBEDDING_STORE_PATH", f'{os.getcwd()}/Resources/embedding_store')
+QA_ANSWER_CACHE_SIZE = int(os.getenv("QA_ANSWER_CACHE_SIZE", 4096))
+QA_ANSWER_CACHE_TTL = float(os.getenv("QA_ANSWER_CACHE_TTL", 300))
+QA_ANSWER_CACHE_NEGATIVE_TTL = float(os.getenv("QA_ANSWER_CACHE_NEGATIVE_TTL", 30))
+QA_CORPUS_POLL_SECONDS = float(os.getenv("QA_CORPUS_POLL_SECONDS", 5))  # 0: changes of other processes only expire
+QA_SEMANTIC_CACHE_SIZE = int(os.getenv("QA_SEMANTIC_CACHE_SIZE", 1024))
+QA_SEMANTIC_CACHE_THRESHOLD = float(os.getenv("QA_SEMANTIC_CACHE_THRESHOLD", 0.95))
+QA_SCORE_THRESHOLD = float(os.getenv("QA_SCORE_THRESHOLD", 0.5))
+QA_SCORE_MARGIN = float(os.getenv("QA_SCORE_MARGIN", 0.1))
+QA_SLOW_QUERY_MS = float(os.getenv("QA_SLOW_QUERY_MS", 500))
+QA_HYBRID_SEARCH = os.getenv("QA_HYBRID_SEARCH", "false").lower() in ("1", "true", "yes")
+QA_LEXICAL_TOP_K = int(os.getenv("QA_LEXICAL_TOP_K", 10))
+QA_LEXICAL_MIN_MATCH = float(os.getenv("QA_LEXICAL_MIN_MATCH", 0.5))
+QA_LEXICAL_WORKERS = int(os.getenv("QA_LEXICAL_WORKERS", 2))
+QA_RRF_K = float(os.getenv("QA_RRF_K", 60))
+QA_WARMUP = os.getenv("QA_WARMUP", "true").lower() in ("1", "true", "yes")
+QA_WARMUP_SEQUENCE_LENGTHS = [int(n) for n in os.getenv("QA_WARMUP_SEQUENCE_LENGTHS", "8,64,256").split(",") if n]
+QA_WARMUP_BATCH_SIZES = [int(n) for n in os.getenv("QA_WARMUP_BATCH_SIZES", "1,8").split(",") if n]
+# Ingestion batches hold at most this many (padded) tokens
+QA_INGEST_TOKEN_BUDGET = int(os.getenv("QA_INGEST_TOKEN_BUDGET", 16384))
+QA_INGEST_MAX_BATCH_SIZE = int(os.getenv("QA_INGEST_MAX_BATCH_SIZE", 256))
+
 # Dataset Configuration Options
 DATASET_PATH = os.getenv("DATASET_PATH", f'{os.getcwd()}/Resources/datasets/questions_answers.csv')
 DATASET_NAME = os.getenv("DATASET_NAME", "questions_answers")
@@ -72,7 +123,25 @@ MODEL_PATHS = {
 }
 
 # Models Configuration Options
-MODEL_SELECTION = {"sentence_transformers": SentenceTransformer(model_name_or_path='all-mpnet-base-v2')}
+# Models are loaded on first use by utils.models.get_model, this only names them.
+# MODEL_NAMES are the hub repositories ``python -m utils.models download`` fetches into MODEL_PATHS,
+# MODEL_REVISIONS pins the revision every local copy must have been downloaded at (empty: any).
+MODEL_DEFAULT = os.getenv("MODEL_DEFAULT", "sentence_transformers")
+MODEL_NAMES = {
+    "sentence_transformers": os.getenv("MODEL_SENTENCE_TRANSFORMERS", "sentence-transformers/all-mpnet-base-v2"),
+}
+MODEL_REVISIONS = {
+    "sentence_transformers": os.getenv("MODEL_SENTENCE_TRANSFORMERS_REVISION", ""),
+}
+# Load strictly from MODEL_PATHS, never from the hub
+MODEL_OFFLINE = os.getenv("MODEL_OFFLINE", "true").lower() in ("1", "true", "yes")
+# CPU inference backend of the encoders: fp32, int8, traced or int8-traced (see utils.encoder_backends)
+MODEL_BACKEND = os.getenv("MODEL_BACKEND", "fp32").lower()
+# Truncation length of the encoders in tokens, 0 keeps each model's own max_seq_length
+MODEL_MAX_SEQ_LENGTH = int(os.getenv("MODEL_MAX_SEQ_LENGTH", 0))
+MODEL_VERIFY_CHECKSUMS = os.getenv("MODEL_VERIFY_CHECKSUMS", "true").lower() in ("1", "true", "yes")
+# Encoder per collection, e.g. "question_answering=sentence_transformers,articles=bert"
+MODEL_COLLECTIONS = dict(pair.split("=", 1) for pair in os.getenv("MODEL_COLLECTIONS", "").split(",") if "=" in pair)
 
 
 # Log all configuration options for debugging purposes
@@ -83,12 +152,24 @@ log.debug(
         "APP_PORT": APP_PORT,
         "APP_SOURCE": APP_SOURCE,
         "APP_LOG_LEVEL": APP_LOG_LEVEL,
+        "API_HOST": API_HOST,
+        "API_PORT": API_PORT,
+        "API_WORKERS": API_WORKERS,
+        "API_MAX_BATCH_SIZE": API_MAX_BATCH_SIZE,
+        "PREFORK_WORKERS": PREFORK_WORKERS,
+        "TORCH_THREADS_PER_WORKER": TORCH_THREADS_PER_WORKER,
+        "PREFORK_RESTART_DELAY": PREFORK_RESTART_DELAY,
+        "PREFORK_RESTART_MAX_DELAY": PREFORK_RESTART_MAX_DELAY,
+        "PREFORK_MAX_STARTUP_FAILURES": PREFORK_MAX_STARTUP_FAILURES,
+        "PREFORK_MIN_UPTIME": PREFORK_MIN_UPTIME,
+        "METRICS_PORT": METRICS_PORT,
         "MYSQL_HOST": MYSQL_HOST,
         "MYSQL_PORT": MYSQL_PORT,
         "MYSQL_USER": MYSQL_USER,
         "MYSQL_PASSWORD": MYSQL_PASSWORD,
         "MYSQL_DATABASE": MYSQL_DATABASE,
         "MYSQL_DATABASE_TABLE_NAME": MYSQL_DATABASE_TABLE_NAME,
+        "MYSQL_POOL_SIZE": MYSQL_POOL_SIZE,
         "MILVUS_USER": MILVUS_USER,
         "MILVUS_PASSWORD": MILVUS_PASSWORD,
         "MILVUS_HOST": MILVUS_HOST,
@@ -100,12 +181,51 @@ log.debug(
         "MILVUS_METRIC_TYPE": MILVUS_METRIC_TYPE,
         "MILVUS_INDEX_TYPE": MILVUS_INDEX_TYPE,
         "MILVUS_NLIST": MILVUS_NLIST,
+        "MILVUS_INDEX_MEMORY_BUDGET_MB": MILVUS_INDEX_MEMORY_BUDGET_MB,
+        "MILVUS_EXPECTED_ROWS": MILVUS_EXPECTED_ROWS,
         "MILVUS_TOP_K": MILVUS_TOP_K,
         "MILVUS_SEARCH_PARAM": MILVUS_SEARCH_PARAM,
+        "MILVUS_SEARCH_PROFILES_PATH": MILVUS_SEARCH_PROFILES_PATH,
+        "QA_SEARCH_PROFILE": QA_SEARCH_PROFILE,
+        "QA_MAX_CONCURRENCY": QA_MAX_CONCURRENCY,
+        "QA_ENCODER_WORKERS": QA_ENCODER_WORKERS,
+        "QA_IO_WORKERS": QA_IO_WORKERS,
+        "QA_MICRO_BATCHING": QA_MICRO_BATCHING,
+        "QA_BATCH_WINDOW_MS": QA_BATCH_WINDOW_MS,
+        "QA_BATCH_MAX_SIZE": QA_BATCH_MAX_SIZE,
+        "QA_EMBEDDING_CACHE_BYTES": QA_EMBEDDING_CACHE_BYTES,
+        "QA_EMBEDDING_CACHE_CLEAN_TEXT": QA_EMBEDDING_CACHE_CLEAN_TEXT,
+        "QA_EMBEDDING_STORE_PATH": QA_EMBEDDING_STORE_PATH,
+        "QA_ANSWER_CACHE_SIZE": QA_ANSWER_CACHE_SIZE,
+        "QA_ANSWER_CACHE_TTL": QA_ANSWER_CACHE_TTL,
+        "QA_ANSWER_CACHE_NEGATIVE_TTL": QA_ANSWER_CACHE_NEGATIVE_TTL,
+        "QA_CORPUS_POLL_SECONDS": QA_CORPUS_POLL_SECONDS,
+        "QA_SEMANTIC_CACHE_SIZE": QA_SEMANTIC_CACHE_SIZE,
+        "QA_SEMANTIC_CACHE_THRESHOLD": QA_SEMANTIC_CACHE_THRESHOLD,
+        "QA_SCORE_THRESHOLD": QA_SCORE_THRESHOLD,
+        "QA_SCORE_MARGIN": QA_SCORE_MARGIN,
+        "QA_SLOW_QUERY_MS": QA_SLOW_QUERY_MS,
+        "QA_HYBRID_SEARCH": QA_HYBRID_SEARCH,
+        "QA_LEXICAL_TOP_K": QA_LEXICAL_TOP_K,
+        "QA_LEXICAL_MIN_MATCH": QA_LEXICAL_MIN_MATCH,
+        "QA_LEXICAL_WORKERS": QA_LEXICAL_WORKERS,
+        "QA_RRF_K": QA_RRF_K,
+        "QA_WARMUP": QA_WARMUP,
+        "QA_WARMUP_SEQUENCE_LENGTHS": QA_WARMUP_SEQUENCE_LENGTHS,
+        "QA_WARMUP_BATCH_SIZES": QA_WARMUP_BATCH_SIZES,
+        "QA_INGEST_TOKEN_BUDGET": QA_INGEST_TOKEN_BUDGET,
+        "QA_INGEST_MAX_BATCH_SIZE": QA_INGEST_MAX_BATCH_SIZE,
         "DATASET_PATH": DATASET_PATH,
         "DATASET_NAME": DATASET_NAME,
         "MODEL_PATHS": MODEL_PATHS,
-        # "MODEL_SELECTION": MODEL_SELECTION.get("sentence_transformers"),
+        "MODEL_DEFAULT": MODEL_DEFAULT,
+        "MODEL_NAMES": MODEL_NAMES,
+        "MODEL_REVISIONS": MODEL_REVISIONS,
+        "MODEL_OFFLINE": MODEL_OFFLINE,
+        "MODEL_BACKEND": MODEL_BACKEND,
+        "MODEL_MAX_SEQ_LENGTH": MODEL_MAX_SEQ_LENGTH,
+        "MODEL_VERIFY_CHECKSUMS": MODEL_VERIFY_CHECKSUMS,
+        "MODEL_COLLECTIONS": MODEL_COLLECTIONS,
     },
         indent=4, sort_keys=True
     )
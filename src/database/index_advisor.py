@@ -0,0 +1,200 @@
+import math
+from typing import Any, Dict, List
+
+from myLogger.Logger import getLogger as GetLogger
+from config import MILVUS_INDEX_TYPE, MILVUS_NLIST, MILVUS_INDEX_MEMORY_BUDGET_MB, MILVUS_SEARCH_PARAM
+
+log = GetLogger(__name__)
+
+########################################################################################################################
+# Index advisor
+#
+# Sizes every supported index type for a collection of ``rows`` vectors of ``dim`` float32 components and picks
+# the most accurate one whose estimated memory footprint fits the budget:
+#
+#   FLAT (small collections) -> HNSW -> IVF_FLAT -> IVF_SQ8 -> IVF_PQ
+#
+# Memory estimates count vectors or codes, centroids / codebooks, graph links and 8-byte ids of a loaded index.
+# Build times are order-of-magnitude figures for a single query node, derived from the distance computations of
+# k-means training and assignment (BLAS-bound) and of HNSW insertion (latency-bound).
+# ``milvus.collection_state.build_index`` applies an advice to a collection.
+########################################################################################################################
+INDEX_TYPES = ("FLAT", "HNSW", "IVF_FLAT", "IVF_SQ8", "IVF_PQ")
+# collections up to this size are searched exhaustively, an index would not pay off
+FLAT_MAX_ROWS = 10000
+# k-means needs about this many training vectors per centroid
+MIN_ROWS_PER_LIST = 39
+MAX_NLIST = 65536
+# assumed throughput, floating point operations per second
+GEMM_FLOPS = 1e11
+GRAPH_FLOPS = 1e10
+KMEANS_ITERATIONS = 10
+
+
+def size_nlist(rows: int) -> int:
+    """
+    Number of IVF lists: 4 * sqrt(rows) rounded to a power of two, with enough rows per list to train
+
+    :param rows: number of vectors
+    :return: nlist
+    """
+    if MILVUS_NLIST > 0:
+        return MILVUS_NLIST
+    nlist = 2 ** round(math.log2(max(4 * math.sqrt(max(rows, 1)), 1)))
+    while nlist > 1 and rows / nlist < MIN_ROWS_PER_LIST:
+        nlist //= 2
+    return int(min(nlist, MAX_NLIST))
+
+
+def size_hnsw(rows: int, dim: int) -> Dict[str, int]:
+    """
+    HNSW build params: more links per node and a deeper construction search for larger collections
+
+    :param rows: number of vectors
+    :param dim: vector dimension
+    :return: {"M": ..., "efConstruction": ...}
+    """
+    m = 16 if rows <= 1000000 else 32
+    if dim >= 1024:
+        m *= 2
+    return {"M": m, "efConstruction": 200 if rows <= 1000000 else 360}
+
+
+def pq_segments(dim: int) -> List[int]:
+    """
+    Valid IVF_PQ sub-quantizer counts, most accurate first (dim must be divisible by m)
+
+    :param dim: vector dimension
+    :return: candidate m values
+    """
+    return [dim // sub for sub in (2, 4, 8, 16, 32) if dim % sub == 0 and dim // sub >= 1]
+
+
+def _kmeans_seconds(rows: int, dim: int, nlist: int) -> float:
+    train = min(rows, nlist * 256)
+    return (KMEANS_ITERATIONS * train + rows) * nlist * 2 * dim / GEMM_FLOPS
+
+
+def estimate(index_type: str, rows: int, dim: int, params: Dict[str, Any]) -> Dict[str, float]:
+    """
+    Memory footprint and build time of an index
+
+    :param index_type: index type
+    :param rows: number of vectors
+    :param dim: vector dimension
+    :param params: index build params
+    :return: {"memory_bytes": ..., "build_seconds": ...}
+    """
+    raw = rows * dim * 4
+    ids = rows * 8
+    if index_type == "FLAT":
+        memory, seconds = raw + ids, 0.0
+    elif index_type == "HNSW":
+        m, ef = params["M"], params["efConstruction"]
+        # 2M links on the base layer, ~1/M of the nodes on each upper layer
+        links = rows * 2 * m * 4 * (1 + 1.0 / m)
+        memory, seconds = raw + links + ids, rows * ef * m * 2 * dim / GRAPH_FLOPS
+    else:
+        nlist = params["nlist"]
+        centroids = nlist * dim * 4
+        seconds = _kmeans_seconds(rows, dim, nlist)
+        if index_type == "IVF_FLAT":
+            memory = raw + centroids + ids
+        elif index_type == "IVF_SQ8":
+            memory = rows * dim + centroids + ids + dim * 8
+        elif index_type == "IVF_PQ":
+            m, codes = params["m"], 2 ** params.get("nbits", 8)
+            codebooks = codes * dim * 4
+            memory = rows * m * params.get("nbits", 8) // 8 + centroids + codebooks + ids
+            seconds += (25 * min(rows, 65536) + rows) * codes * 2 * dim / GEMM_FLOPS
+        else:
+            raise ValueError(f'Unknown index type "{index_type}", expected one of {INDEX_TYPES}')
+    return {"memory_bytes": int(memory), "build_seconds": round(seconds, 3)}
+
+
+def search_profiles(index_type: str, params: Dict[str, Any]) -> Dict[str, Dict[str, Any]]:
+    """
+    Starting search params of the presets for an untuned index
+
+    :param index_type: index type
+    :param params: index build params
+    :return: {profile: search params}
+    """
+    if index_type == "HNSW":
+        return {"fast": {"ef": 32}, "balanced": {"ef": 64}, "accurate": {"ef": 256}}
+    if index_type.startswith("IVF"):
+        nlist = params["nlist"]
+        nprobe = min(nlist, MILVUS_SEARCH_PARAM.get("nprobe", 16))
+        return {"fast": {"nprobe": max(1, nprobe // 2)}, "balanced": {"nprobe": nprobe},
+                "accurate": {"nprobe": min(nlist, nprobe * 4)}}
+    return {"fast": {}, "balanced": {}, "accurate": {}}
+
+
+def candidates(rows: int, dim: int, metric_type: str = "IP") -> List[Dict[str, Any]]:
+    """
+    Every index type sized for the collection, in order of preference
+
+    :param rows: number of vectors
+    :param dim: vector dimension
+    :param metric_type: metric of the index
+    :return: advice per index type, see ``recommend_index``
+    """
+    nlist = size_nlist(rows)
+    sized = [("FLAT", {}), ("HNSW", size_hnsw(rows, dim)), ("IVF_FLAT", {"nlist": nlist}),
+             ("IVF_SQ8", {"nlist": nlist})]
+    sized += [("IVF_PQ", {"nlist": nlist, "m": m, "nbits": 8}) for m in pq_segments(dim)]
+    advice = []
+    for index_type, params in sized:
+        advice.append({
+            "index_type": index_type,
+            "index_params": {"index_type": index_type, "metric_type": metric_type, "params": params},
+            "search_profiles": search_profiles(index_type, params),
+            "rows": rows,
+            "dim": dim,
+            **estimate(index_type, rows, dim, params),
+        })
+    return advice
+
+
+def recommend_index(rows: int, dim: int, memory_budget_mb: float = MILVUS_INDEX_MEMORY_BUDGET_MB,
+                    metric_type: str = "IP", index_type: str = MILVUS_INDEX_TYPE,
+                    max_build_seconds: float = None) -> Dict[str, Any]:
+    """
+    Picks the most accurate index that fits the memory budget (and the build time limit, if any)
+
+    :param rows: number of vectors, expected or actual
+    :param dim: vector dimension
+    :param memory_budget_mb: memory the loaded index may take, in MiB
+    :param metric_type: metric of the index
+    :param index_type: AUTO, or an index type to size regardless of the budget
+    :param max_build_seconds: estimated build time limit, None disables it
+    :return: {"index_type", "index_params" (for ``create_index``), "search_profiles", "rows", "dim",
+              "memory_bytes", "build_seconds", "reason"}
+    """
+    budget = memory_budget_mb * 1024 * 1024
+    options = candidates(rows, dim, metric_type)
+    if index_type and index_type != "AUTO":
+        forced = [advice for advice in options if advice["index_type"] == index_type]
+        if not forced:
+            raise ValueError(f'Unknown index type "{index_type}", expected AUTO or one of {INDEX_TYPES}')
+        advice = forced[0]
+        if advice["memory_bytes"] > budget:
+            log.warning(f"{index_type} needs ~{advice['memory_bytes'] / 2 ** 20:.0f} MiB, "
+                        f"over the {memory_budget_mb:.0f} MiB budget")
+        advice["reason"] = "configured"
+        return advice
+    if rows > FLAT_MAX_ROWS:
+        options = options[1:]
+    for advice in options:
+        if advice["memory_bytes"] > budget:
+            continue
+        if max_build_seconds is not None and advice["build_seconds"] > max_build_seconds:
+            continue
+        advice["reason"] = "small collection, exhaustive search" if advice["index_type"] == "FLAT" else \
+            "most accurate index within the budget"
+        log.info(f"Index advice for {rows} x {dim}: {advice['index_params']}, "
+                 f"~{advice['memory_bytes'] / 2 ** 20:.1f} MiB, ~{advice['build_seconds']}s to build")
+        return advice
+    smallest = min(advice["memory_bytes"] for advice in options)
+    raise ValueError(f"No index of {rows} x {dim} vectors fits {memory_budget_mb:.0f} MiB, "
+                     f"the smallest needs ~{smallest / 2 ** 20:.0f} MiB")
@@ -5,11 +5,12 @@ import json
 import logging
 import random
 import time
-from typing import List, Dict, Any, Union
+from typing import List, Dict, Any, Callable, Union
 import jsonlines
 import numpy as np
 from pymilvus import FieldSchema, CollectionSchema, DataType, Collection, utility
 import mysql.connector as mysql_connector
+from database.index_advisor import candidates, recommend_index
 from myLogger.Logger import getLogger as GetLogger
 
 log = GetLogger(__name__)
@@ -139,10 +140,20 @@ class CollectionAPI:
         else:
             return False
 
-    def drop_collection(self, collection_name: str) -> Dict:
+    def drop_collection(self, collection_name: str, on_dropped: Callable[[str], Any] = None) -> Dict:
+        """
+        Drops a collection
+
+        :param collection_name: collection name
+        :param on_dropped: called with the name once the collection is dropped,
+            e.g. ``milvus.collection_state.mark_collection_released``
+        :return: {"message", "status"}
+        """
         try:
             if self.has_collection(collection_name):
                 utility.drop_collection(collection_name)
+                if on_dropped is not None:
+                    on_dropped(collection_name)
                 if not self.has_collection(collection_name):
                     return {"message": "Collection dropped.", "status": "success"}
                 else:
@@ -189,6 +200,62 @@ class IndexAPI:
         except Exception as e:
             log.error(e)
 
+    @staticmethod
+    def index_candidates(rows: int, dim: int, metric_type: str = "IP") -> List[Dict]:
+        """
+        Every supported index type sized for the collection, with its memory footprint and build time estimates
+
+        :param rows: number of vectors
+        :param dim: vector dimension
+        :param metric_type: metric of the index
+        :return: advice per index type, in order of preference
+        """
+        return candidates(rows, dim, metric_type)
+
+    @staticmethod
+    def recommend_index(rows: int, dim: int, memory_budget_mb: float = None, metric_type: str = "IP",
+                        **kwargs) -> Dict:
+        """
+        Index advisor: the most accurate of FLAT, HNSW, IVF_FLAT, IVF_SQ8 and IVF_PQ fitting the memory budget
+
+        :param rows: number of vectors, expected or actual
+        :param dim: vector dimension
+        :param memory_budget_mb: memory the loaded index may take, defaults to MILVUS_INDEX_MEMORY_BUDGET_MB
+        :param metric_type: metric of the index
+        :return: advice with "index_params", "search_profiles", "memory_bytes" and "build_seconds"
+        """
+        if memory_budget_mb is not None:
+            kwargs["memory_budget_mb"] = memory_budget_mb
+        return recommend_index(rows, dim, metric_type=metric_type, **kwargs)
+
+    def build_recommended_index(self, collection: Collection, field_name: str = "embedding", rows: int = None,
+                                memory_budget_mb: float = None, metric_type: str = "IP",
+                                build: Callable[..., Dict] = None, **kwargs) -> Dict:
+        """
+        Builds the advised index on a vector field
+
+        :param collection: collection object
+        :param field_name: vector field
+        :param rows: number of vectors, defaults to the collection's entity count
+        :param memory_budget_mb: memory the loaded index may take, defaults to MILVUS_INDEX_MEMORY_BUDGET_MB
+        :param metric_type: metric of the index
+        :param build: applies the advice as ``build(collection, advice, field_name=...)``, e.g.
+            ``milvus.collection_state.build_index``, which also replaces an existing index, reloads the collection
+            and resets its search profiles; by default the index is created on a collection without one
+        :return: the advice
+        """
+        try:
+            field = [f for f in collection.schema.fields if f.name == field_name][0]
+            rows = collection.num_entities if rows is None else rows
+            advice = self.recommend_index(rows, int(field.params["dim"]), memory_budget_mb, metric_type, **kwargs)
+            if build is not None:
+                return build(collection, advice, field_name=field_name)
+            collection.create_index(field_name=field_name, index_params=advice["index_params"])
+            return advice
+        except Exception as e:
+            log.error(e)
+            raise e
+
 
 # 5. PartitionAPI:
 
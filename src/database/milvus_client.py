@@ -8,7 +8,9 @@ from pymilvus import (
 )
 import sys
 import os
+from typing import Any, Callable, Dict
 from myLogger.Logger import getLogger as GetLogger
+from database.index_advisor import recommend_index
 
 log = GetLogger(__name__)
 LOGGER = log.logger
@@ -31,7 +33,20 @@ class Milvus:
     connecting to Milvus, creating collections, and inserting/querying vectors.
     """
 
-    def __init__(self) -> None:
+    def __init__(self, search_params: Callable[[Collection], Dict] = None,
+                 on_index_built: Callable[[str, Dict], Any] = None,
+                 on_dropped: Callable[[str], Any] = None) -> None:
+        """
+        :param search_params: search params of a collection, e.g. ``milvus.search_profiles.get_search_params``;
+            defaults to nprobe 16
+        :param on_index_built: called with the collection name and the advice of a new index,
+            e.g. ``milvus.search_profiles.register_index``
+        :param on_dropped: called with the name of a dropped collection,
+            e.g. ``milvus.collection_state.mark_collection_released``
+        """
+        self.search_params = search_params
+        self.on_index_built = on_index_built
+        self.on_dropped = on_dropped
         try:
             self.collection = None
             connections.connect(host=MILVUS_HOST, port=MILVUS_PORT)
@@ -87,14 +102,17 @@ class Milvus:
             sys.exit(1)
 
     def create_index(self, collection_name: str) -> str:
-        # Create IVF_FLAT index on milvus collection
+        # Create the index advised for the collection's size on milvus collection
         try:
             if not self.has_collection(collection_name):
                 raise Exception(f"There has no collection named:{collection_name}")
             self.set_collection(collection_name)
-            default_index = {"index_type": "IVF_SQ8", "metric_type": METRIC_TYPE, "params": {"nlist": 16384}}
+            advice = recommend_index(self.collection.num_entities, VECTOR_DIMENSION, metric_type=METRIC_TYPE)
+            default_index = advice["index_params"]
             status = self.collection.create_index(field_name="embedding", index_params=default_index)
             if not status.code:
+                if self.on_index_built is not None:
+                    self.on_index_built(collection_name, advice)
                 LOGGER.debug(
                     f"Successfully create index in collection:{collection_name} with param:{default_index}")
                 return status
@@ -109,6 +127,8 @@ class Milvus:
         try:
             self.set_collection(collection_name)
             self.collection.drop()
+            if self.on_dropped is not None:
+                self.on_dropped(collection_name)
             LOGGER.debug("Successfully drop collection!")
             return "ok"
         except Exception as e:
@@ -121,7 +141,8 @@ class Milvus:
             if not self.has_collection(collection_name):
                 raise Exception(f"There has no collection named:{collection_name}")
             collection = Collection(name=collection_name)
-            search_params = {"metric_type": METRIC_TYPE, "params": {"nprobe": 16}}
+            search_params = self.search_params(collection) if self.search_params is not None \
+                else {"metric_type": METRIC_TYPE, "params": {"nprobe": 16}}
             response = collection.search(vectors, anns_field="embedding", param=search_params, limit=top_k)
             LOGGER.debug(f"Successfully search in collection: {response}")
             return response
@@ -1,6 +1,9 @@
+import queue
+import threading
 import traceback
+from contextlib import contextmanager
 from dataclasses import dataclass
-from typing import List, Any
+from typing import List, Any, Callable
 
 from pymysql import connections as mysql_connection
 import pymysql
@@ -145,12 +148,14 @@ class MySQLDatabase(Mysql):
             self.connection.rollback()
             raise e
 
-    def load_data_to_mysql(self, table_name, data) -> None:
+    def load_data_to_mysql(self, table_name, data, on_loaded: Callable[[Any, str], Any] = None) -> None:
         """
         Loads data into MySQL
 
         :param table_name: name of the table
         :param data: data to be loaded
+        :param on_loaded: called with a cursor and a description when new rows were loaded, its writes are
+            committed afterwards; e.g. ``utils.corpus.publish_corpus_change``
         :return: None
         """
         sql = "insert into " + table_name + " (id, question, answer) values (%s, %s, %s);"
@@ -168,6 +173,10 @@ class MySQLDatabase(Mysql):
                         cnt += 1
                         if cnt == 0:
                             log.info("MYSQL loads data to table: {} successfully".format(table_name))
+            if cnt > 0 and on_loaded is not None:
+                with self.connection.cursor() as cursor:
+                    on_loaded(cursor, f"{cnt} records loaded to {table_name}")
+                self.connection.commit()
             log.info("MYSQL loads data to table: {} successfully. Number of Records: {}".format(table_name, cnt))
         except Exception as e:
             log.error(f'Error while loading data to MySQL. Sql insert error: \n{sql}\n{e} ')
@@ -221,3 +230,139 @@ class MySQLDatabase(Mysql):
             log.error(traceback.format_exc())
             return []
 
+
+
+class MySQLConnectionPool:
+    """
+    A thread-safe pool of long-lived pymysql connections.
+
+    Connections are opened on demand up to ``size`` and handed back to the pool after use,
+    so callers pay the TCP/auth handshake once per connection instead of once per request.
+    Pooled connections run in autocommit mode so long-lived readers never see a stale snapshot.
+    """
+
+    def __init__(self, host, port, user, password, database, size: int = 4, timeout: float = 30.0, **kwargs):
+        self.host = host
+        self.port = int(port)
+        self.user = user
+        self.password = password
+        self.database = database
+        self.size = int(size)
+        self.timeout = timeout
+        self.kwargs = kwargs
+        self._pool: queue.LifoQueue = queue.LifoQueue(maxsize=self.size)
+        self._created = 0
+        self._lock = threading.Lock()
+
+    def _new_connection(self) -> mysql_connection:
+        try:
+            return pymysql.connect(host=self.host,
+                                   port=self.port,
+                                   user=self.user,
+                                   password=self.password,
+                                   db=self.database,
+                                   charset=self.kwargs.get('charset', 'utf8mb4'),
+                                   autocommit=True,
+                                   local_infile=self.kwargs.get('local_infile', True),
+                                   )
+        except Exception as e:
+            log.error(f'Error while connecting to MySQL: {e}')
+            log.error(traceback.format_exc())
+            raise e
+
+    def _acquire(self) -> mysql_connection:
+        try:
+            return self._pool.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if self._created < self.size:
+                self._created += 1
+                try:
+                    return self._new_connection()
+                except Exception:
+                    self._created -= 1
+                    raise
+        return self._pool.get(timeout=self.timeout)
+
+    def _release(self, conn: mysql_connection, broken: bool = False) -> None:
+        if broken:
+            try:
+                conn.close()
+            except Exception:
+                pass
+            with self._lock:
+                self._created -= 1
+            return
+        self._pool.put_nowait(conn)
+
+    @contextmanager
+    def connection(self):
+        """
+        Borrows a connection from the pool and returns it on exit
+
+        :return: pymysql connection
+        """
+        conn = self._acquire()
+        broken = False
+        try:
+            conn.ping(reconnect=True)
+            yield conn
+        except pymysql.err.OperationalError:
+            broken = True
+            raise
+        finally:
+            self._release(conn, broken=broken)
+
+    @contextmanager
+    def cursor(self):
+        """
+        Borrows a connection from the pool and yields a cursor on it
+
+        :return: pymysql cursor
+        """
+        with self.connection() as conn:
+            with conn.cursor() as cursor:
+                yield cursor
+
+    def warm(self, count: int = None) -> int:
+        """
+        Opens pooled connections ahead of traffic so no request pays the connect handshake
+
+        :param count: number of connections to open, defaults to the pool size
+        :return: number of connections verified with a round trip
+        """
+        count = self.size if count is None else min(int(count), self.size)
+        borrowed = []
+        try:
+            for _ in range(count):
+                conn = self._acquire()
+                borrowed.append(conn)
+                conn.ping(reconnect=True)
+            log.info(f'Warmed {len(borrowed)} MySQL connection(s) to {self.host}:{self.port}')
+            return len(borrowed)
+        except Exception as e:
+            log.error(f'Error while warming MySQL connections: {e}')
+            log.error(traceback.format_exc())
+            raise e
+        finally:
+            for conn in borrowed:
+                self._release(conn)
+
+    def close(self) -> None:
+        """
+        Closes every idle connection in the pool
+
+        :return: None
+        """
+        while True:
+            try:
+                conn = self._pool.get_nowait()
+            except queue.Empty:
+                break
+            try:
+                conn.close()
+            except Exception as e:
+                log.error(f'Error while closing MySQL connection: {e}')
+            with self._lock:
+                self._created -= 1
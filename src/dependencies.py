@@ -0,0 +1,27 @@
+from milvus.async_service import AsyncQueryService, get_async_query_service
+from milvus.query_service import QueryService, get_query_service
+
+
+# -----------------------------------------------------------------------------
+# FastAPI dependencies
+#
+# Every request shares the process-wide services, so the MySQL pool, the Milvus
+# connection and collection handle, the caches and the encoder are created once
+# per worker process.
+# -----------------------------------------------------------------------------
+def query_service() -> QueryService:
+    """
+    The pooled Milvus/MySQL resources and the shared encoder.
+
+    :return: query service
+    """
+    return get_query_service()
+
+
+def async_query_service() -> AsyncQueryService:
+    """
+    The asyncio front-end of the query service.
+
+    :return: async query service
+    """
+    return get_async_query_service()
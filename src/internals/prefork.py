@@ -0,0 +1,265 @@
+import argparse
+import gc
+import os
+import signal
+import socket
+import sys
+import time
+import traceback
+from typing import Any, Callable, Dict, Optional, Tuple
+
+import uvicorn
+from uvicorn.importer import import_from_string
+
+from utils.models import get_model
+from myLogger.Logger import getLogger as GetLogger
+from config import API_HOST, API_PORT, PREFORK_WORKERS, TORCH_THREADS_PER_WORKER, PREFORK_RESTART_DELAY, \
+    PREFORK_RESTART_MAX_DELAY, PREFORK_MAX_STARTUP_FAILURES, PREFORK_MIN_UPTIME, MILVUS_COLLECTION, MODEL_COLLECTIONS, \
+    MODEL_DEFAULT
+
+log = GetLogger(__name__)
+
+
+########################################################################################################################
+# Pre-fork serving
+#
+# The parent process loads the encoder once and then forks the API workers, which share the model weights
+# copy-on-write. To keep the pages shared the parent:
+#   - never runs a forward pass (that would also start the OpenMP pool, which does not survive fork),
+#   - switches autograd off and freezes the gc, so refcount/gc bookkeeping does not touch the weight objects,
+#   - opens no Milvus or MySQL connection; every worker builds its own pools after the fork.
+# Every worker limits torch intra-op threads so N workers do not oversubscribe the cores.
+#
+# Workers that die are restarted after a delay that doubles with every startup failure in a row (a worker that
+# fails its lifespan startup, e.g. Milvus or MySQL down, or exits within PREFORK_MIN_UPTIME); after
+# PREFORK_MAX_STARTUP_FAILURES of them the launcher stops every worker and fails instead of fork-looping.
+########################################################################################################################
+# exit status of a worker whose lifespan startup failed
+STARTUP_FAILED = 3
+
+
+def threads_per_worker(workers: int, threads: int = TORCH_THREADS_PER_WORKER) -> int:
+    """
+    Number of torch intra-op threads for each worker
+
+    :param workers: number of worker processes
+    :param threads: explicit thread count, 0 splits the cores evenly between workers
+    :return: thread count, at least 1
+    """
+    if threads and threads > 0:
+        return threads
+    return max(1, (os.cpu_count() or 1) // max(1, workers))
+
+
+def load_shared_model(name: str = None) -> Any:
+    """
+    Loads the encoder in the parent and prepares it to be shared copy-on-write
+
+    :param name: name of the model in ``config.MODEL_NAMES``, defaults to the encoder of the served collection
+        (see ``utils.models.get_collection_model``)
+    :return: model
+    """
+    import torch
+    name = name or MODEL_COLLECTIONS.get(MILVUS_COLLECTION, MODEL_DEFAULT)
+    started = time.perf_counter()
+    model = get_model(name)
+    model.eval()
+    for parameter in model.parameters():
+        parameter.requires_grad_(False)
+    torch.set_grad_enabled(False)
+    gc.collect()
+    if hasattr(gc, "freeze"):
+        gc.freeze()
+    log.info(f"Loaded shared model \"{name}\" in {time.perf_counter() - started:.2f}s")
+    return model
+
+
+def _bind(host: str, port: int) -> socket.socket:
+    sock = socket.socket(socket.AF_INET6 if ":" in host else socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(2048)
+    sock.set_inheritable(True)
+    return sock
+
+
+def _run_worker(index: int, sock: socket.socket, app: str, threads: int) -> None:
+    try:
+        import torch
+        signal.signal(signal.SIGINT, signal.SIG_DFL)
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        torch.set_num_threads(threads)
+        log.info(f"Worker {index} (pid {os.getpid()}) serving with {threads} torch thread(s)")
+        server = uvicorn.Server(uvicorn.Config(app, lifespan="on"))
+        server.run(sockets=[sock])
+        # uvicorn returns without raising when the lifespan startup fails
+        os._exit(0 if server.started else STARTUP_FAILED)
+    except Exception as e:
+        log.error(f"Worker {index} failed: {e}")
+        log.error(traceback.format_exc())
+        os._exit(1)
+
+
+class RestartBackoff:
+    """
+    Restart delays of crashed workers: the base delay after a worker that ran for a while, doubling with every
+    startup failure in a row of the same worker, up to ``max_delay``
+    """
+
+    def __init__(self, delay: float = PREFORK_RESTART_DELAY, max_delay: float = PREFORK_RESTART_MAX_DELAY,
+                 max_failures: int = PREFORK_MAX_STARTUP_FAILURES, min_uptime: float = PREFORK_MIN_UPTIME):
+        self.delay = delay
+        self.max_delay = max_delay
+        self.max_failures = max_failures
+        self.min_uptime = min_uptime
+        self.failures: Dict[int, int] = {}
+
+    def next_delay(self, index: int, status: int, uptime: float) -> Optional[float]:
+        """
+        Seconds to wait before restarting a worker that exited
+
+        :param index: worker index
+        :param status: exit status as returned by ``os.wait``
+        :param uptime: seconds the worker ran
+        :return: delay, or None once the worker failed to start ``max_failures`` times in a row
+        """
+        startup_failed = uptime < self.min_uptime or \
+            (os.WIFEXITED(status) and os.WEXITSTATUS(status) == STARTUP_FAILED)
+        if not startup_failed:
+            self.failures[index] = 0
+            return self.delay
+        failures = self.failures[index] = self.failures.get(index, 0) + 1
+        if failures >= self.max_failures:
+            return None
+        return min(self.max_delay, self.delay * 2 ** (failures - 1))
+
+
+class Supervisor:
+    """
+    Runs ``workers`` child processes and restarts the ones that exit, with backoff, until stopped
+    """
+
+    def __init__(self, spawn: Callable[[int], int], workers: int, backoff: RestartBackoff = None):
+        """
+        :param spawn: forks worker ``index`` and returns its pid
+        :param workers: number of workers
+        :param backoff: restart delays, defaults to the PREFORK_RESTART_* settings
+        """
+        self.spawn = spawn
+        self.workers = workers
+        self.backoff = backoff if backoff is not None else RestartBackoff()
+        self.children: Dict[int, Tuple[int, float]] = {}
+        self.restarts: Dict[int, float] = {}
+        self.stopping = False
+
+    def start(self, index: int) -> None:
+        pid = self.spawn(index)
+        self.children[pid] = (index, time.monotonic())
+
+    def stop(self, signum=None, frame=None) -> None:
+        self.stopping = True
+        self.restarts.clear()
+        for pid in list(self.children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    def _exited(self, pid: int, status: int) -> None:
+        index, started = self.children.pop(pid, (None, 0.0))
+        if index is None or self.stopping:
+            return
+        delay = self.backoff.next_delay(index, status, time.monotonic() - started)
+        if delay is None:
+            log.error(f"Worker {index} (pid {pid}) failed to start {self.backoff.max_failures} times in a row, "
+                      f"stopping")
+            self.stop()
+            raise RuntimeError(f"Worker {index} failed to start {self.backoff.max_failures} times in a row")
+        log.error(f"Worker {index} (pid {pid}) exited with status {status}, restarting in {delay:.1f}s")
+        self.restarts[index] = time.monotonic() + delay
+
+    def run(self) -> None:
+        """
+        Starts the workers and waits for them; returns once stopped and every worker has exited
+
+        :return: None
+        """
+        failure = None
+        for index in range(self.workers):
+            self.start(index)
+        while self.children or self.restarts:
+            now = time.monotonic()
+            for index, at in list(self.restarts.items()):
+                if at <= now:
+                    del self.restarts[index]
+                    self.start(index)
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG if self.restarts else 0)
+            except ChildProcessError:
+                if not self.restarts:
+                    break
+                pid, status = 0, 0
+            except InterruptedError:
+                continue
+            if pid == 0:
+                time.sleep(max(0.0, min(0.5, min(self.restarts.values(), default=now) - time.monotonic())))
+                continue
+            try:
+                self._exited(pid, status)
+            except RuntimeError as e:
+                failure = e
+        if failure is not None:
+            raise failure
+
+
+def serve_prefork(app: str = "api:app",
+                  host: str = API_HOST,
+                  port: int = API_PORT,
+                  workers: int = PREFORK_WORKERS,
+                  threads: int = TORCH_THREADS_PER_WORKER) -> None:
+    """
+    Loads the model once, then forks ``workers`` uvicorn workers sharing the listening socket and the
+    model weights. Workers that die are restarted with backoff until the parent receives SIGINT or SIGTERM,
+    or a worker fails to start PREFORK_MAX_STARTUP_FAILURES times in a row.
+
+    :param app: import string of the ASGI app, imported in the parent before forking
+    :param host: bind address
+    :param port: bind port
+    :param workers: number of worker processes
+    :param threads: torch intra-op threads per worker, 0 splits the cores evenly
+    :return: None
+    """
+    if not hasattr(os, "fork"):
+        raise RuntimeError("Pre-fork serving requires os.fork")
+    threads = threads_per_worker(workers, threads)
+    load_shared_model()
+    # import the app before forking so its modules are shared as well
+    asgi_app = import_from_string(app)
+    sock = _bind(host, port)
+
+    def spawn(index: int) -> int:
+        pid = os.fork()
+        if pid == 0:
+            _run_worker(index, sock, asgi_app, threads)
+        return pid
+
+    supervisor = Supervisor(spawn, workers)
+    signal.signal(signal.SIGINT, supervisor.stop)
+    signal.signal(signal.SIGTERM, supervisor.stop)
+    log.info(f"Pre-forking {workers} worker(s) on {host}:{port} with {threads} torch thread(s) each")
+    try:
+        supervisor.run()
+    finally:
+        sock.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Pre-fork question answering API")
+    parser.add_argument("--app", default="api:app")
+    parser.add_argument("--host", default=API_HOST)
+    parser.add_argument("--port", type=int, default=API_PORT)
+    parser.add_argument("--workers", type=int, default=PREFORK_WORKERS)
+    parser.add_argument("--threads", type=int, default=TORCH_THREADS_PER_WORKER)
+    args = parser.parse_args()
+    serve_prefork(app=args.app, host=args.host, port=args.port, workers=args.workers, threads=args.threads)
+    sys.exit(0)
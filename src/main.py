@@ -1,18 +1,39 @@
 import logging
 import traceback
+import pandas as pd
 from pymilvus import Collection, FieldSchema, DataType
 import gradio as gr
-from milvus.question_answering import response_handler, generate_and_store_embeddings, \
-    format_data, load_data_to_mysql
+from milvus.question_answering import generate_and_store_embeddings, format_data, load_data_to_mysql
+from milvus.async_service import async_stream_response_handler
 from myLogger.Logger import getLogger as GetLogger
 from milvus.milvus_helper import MilvusClient
+from milvus.collection_state import get_collection_state
+from milvus.query_service import QueryService, set_query_service
+from milvus.warmup import warm_up
 from database.mysql import MySQLDatabase
+from utils.metrics import start_metrics_server
 from config import MYSQL_HOST, MYSQL_PORT, MYSQL_USER, MYSQL_PASSWORD, MYSQL_DATABASE, \
     MILVUS_HOST, MILVUS_PORT, MILVUS_USER, MILVUS_PASSWORD, MILVUS_COLLECTION, \
-    MYSQL_DATABASE_TABLE_NAME, APP_HOST, APP_PORT, MILVUS_CONNECTION_ALIAS
+    MYSQL_DATABASE_TABLE_NAME, APP_HOST, APP_PORT, MILVUS_CONNECTION_ALIAS, QA_MAX_CONCURRENCY, METRICS_PORT, QA_WARMUP, \
+    DATASET_PATH
 
 log = GetLogger(name=__name__, level=logging.DEBUG)
 
+
+async def query_handler(message, state, request: gr.Request = None):
+    """
+    Streams the answer to a chat message; a newer message from the same session cancels the in-flight one
+
+    :param message: user message
+    :param state: chat history
+    :param request: gradio request, used for its session hash
+    :return: async generator of (textbox, chat history) updates
+    """
+    session = getattr(request, "session_hash", None)
+    async for update in async_stream_response_handler(message, state, session=session):
+        yield update
+
+
 def chatbot(collection: Collection, **kwargs):
     """
     Chatbot interface for the QA system using gradio
@@ -36,7 +57,7 @@ def chatbot(collection: Collection, **kwargs):
     /question_answering_system/question_answering.ipynb">Milvus Bootcamp</a></li> <li><a 
     href="https://milvus.io/docs/question_answering_system.md">Milvus Documentation Question and Answering</a></li> 
     </ul>"""
-    collection.load()
+    get_collection_state(collection).ensure_loaded()
 
     with gr.Blocks() as demo:
         gr.Markdown("Simple Question and Answering System featuring corpus of 1000 questions and answers.")
@@ -50,14 +71,15 @@ def chatbot(collection: Collection, **kwargs):
                           elem_id="accordion", ):
             gr.Markdown(about)
 
-        msg.submit(fn=response_handler,
+        msg.submit(fn=query_handler,
                    inputs=[msg, __chatbot],
                    outputs=[msg, __chatbot],
                    api_name="query", )  # query chatbot
-        query_btn.click(fn=response_handler,
+        query_btn.click(fn=query_handler,
                         inputs=[msg, __chatbot],
                         outputs=[msg, __chatbot])  # query chatbot
         clear.click(lambda: None, None, __chatbot, queue=False)  # clear chatbot
+        demo.queue(concurrency_count=QA_MAX_CONCURRENCY)
         demo.launch(inline=False,
                     debug=True,
                     share=False,
@@ -94,14 +116,22 @@ if __name__ == '__main__':
             FieldSchema(name="embedding", dtype=DataType.FLOAT_VECTOR, descrition="float vector", dim=768,
                         is_primary=False)
         ]
-        __collection = milvus_client.create_collection(MYSQL_DATABASE_TABLE_NAME, fields)
+        data = pd.read_csv(DATASET_PATH)
+        # the index is sized for the dataset
+        __collection = milvus_client.create_collection(MYSQL_DATABASE_TABLE_NAME, fields, rows=len(data))
         if __collection is None:
             raise Exception("Failed to create collection: {}".format(MYSQL_DATABASE_TABLE_NAME))
         log.info("collection: {}".format(__collection))
-        ids, question_data, answer_data = generate_and_store_embeddings(collection=__collection)
+        ids, question_data, answer_data = generate_and_store_embeddings(collection=__collection, data=data)
         # load_data_to_mysql(mysql_db.cursor, mysql_db.connection,
         #                    MYSQL_DATABASE_TABLE_NAME, format_data(ids, question_data, answer_data))
 
+        set_query_service(QueryService(collection=__collection, table_name=MYSQL_DATABASE_TABLE_NAME))
+        if QA_WARMUP:
+            # the UI starts accepting messages only once the serving path is at steady state
+            warm_up()
+        if METRICS_PORT > 0:
+            start_metrics_server(port=METRICS_PORT, host=APP_HOST)
         chatbot(collection=__collection)
 
     except Exception as e:
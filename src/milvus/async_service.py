@@ -0,0 +1,295 @@
+import asyncio
+import contextvars
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Tuple
+
+from milvus.batching import QueryBatcher, get_query_batcher
+from milvus.query_service import QueryService, get_query_service
+from milvus.question_answering import generate_query_embeddings, generate_batch_query_embeddings, best_answer, \
+    format_similar_questions, SEARCHING
+from milvus.tracing import trace_request, trace_stage
+from myLogger.Logger import getLogger as GetLogger
+from utils.corpus import get_corpus_version
+from config import QA_MAX_CONCURRENCY, QA_ENCODER_WORKERS, QA_IO_WORKERS, QA_MICRO_BATCHING
+
+log = GetLogger(__name__)
+
+
+class QuerySuperseded(Exception):
+    """Raised when a newer question from the same session cancelled this one"""
+
+
+class AsyncQueryService:
+    """
+    Asyncio front-end of a ``QueryService``.
+
+    Model inference runs on a small encoder executor and the blocking pymilvus/pymysql calls on an
+    I/O executor, so the event loop stays free. A semaphore bounds the number of questions in flight;
+    cancelling the awaiting task releases the slot immediately. With a ``QueryBatcher`` single questions
+    are merged with concurrent ones into shared encoder and search batches.
+    """
+
+    def __init__(self,
+                 service: QueryService = None,
+                 max_concurrency: int = QA_MAX_CONCURRENCY,
+                 encoder_workers: int = QA_ENCODER_WORKERS,
+                 io_workers: int = QA_IO_WORKERS,
+                 batcher: QueryBatcher = None):
+        self.service = service if service is not None else get_query_service()
+        self.max_concurrency = max_concurrency
+        self.batcher = batcher if batcher is not None or not QA_MICRO_BATCHING else get_query_batcher()
+        self.encoder_executor = ThreadPoolExecutor(max_workers=encoder_workers, thread_name_prefix="qa-encoder")
+        self.io_executor = ThreadPoolExecutor(max_workers=io_workers, thread_name_prefix="qa-io")
+        self._semaphores: Dict[asyncio.AbstractEventLoop, asyncio.Semaphore] = {}
+        self._inflight: Dict[Any, asyncio.Future] = {}
+        self._lock = threading.Lock()
+
+    def _semaphore(self) -> asyncio.Semaphore:
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            semaphore = self._semaphores.get(loop)
+            if semaphore is None:
+                semaphore = self._semaphores[loop] = asyncio.Semaphore(self.max_concurrency)
+            return semaphore
+
+    async def _run(self, executor: ThreadPoolExecutor, fn, *args, **kwargs) -> Any:
+        loop = asyncio.get_running_loop()
+        # run_in_executor does not propagate context variables; carry the request trace along
+        context = contextvars.copy_context()
+        return await loop.run_in_executor(executor, functools.partial(context.run, fn, *args, **kwargs))
+
+    async def search_answers(self, question: str, profile: str = None) -> List[Dict[str, Any]]:
+        """
+        Returns the ranked answers for a question together with their distances
+
+        :param question: question
+        :param profile: search profile, defaults to the service's; other profiles skip the batcher
+        :return: list of {"id", "question", "answer", "distance"} dicts
+        """
+        with trace_request(question):
+            cached = self.service.cached_answers(question, profile=profile)
+            if cached is not None:
+                return cached
+            semaphore = self._semaphore()
+            with trace_stage("queue"):
+                await semaphore.acquire()
+            try:
+                if self.batcher is not None and self.service.uses_default_profile(profile):
+                    with trace_stage("batch"):
+                        return await asyncio.wrap_future(self.batcher.submit(question))
+                version = get_corpus_version()
+                query_embeddings = await self._run(self.encoder_executor, generate_query_embeddings, question,
+                                                   self.service.model, cache=self.service.embedding_cache)
+                answers = await self._run(self.io_executor, self.service.answers_for_embeddings, [question],
+                                          query_embeddings, version=version, profile=profile)
+            finally:
+                semaphore.release()
+            self.service.cache_answers(question, answers[0], version, profile=profile)
+            return answers[0]
+
+    async def search_answers_batch(self, questions: List[str], profile: str = None) -> List[List[Dict[str, Any]]]:
+        """
+        Returns the ranked answers with distances for many questions at once
+
+        :param questions: questions
+        :param profile: search profile, defaults to the service's
+        :return: per question, a list of {"id", "question", "answer", "distance"} dicts
+        """
+        with trace_request(questions):
+            answers = [self.service.cached_answers(q, profile=profile) for q in questions]
+            missing = [i for i, cached in enumerate(answers) if cached is None]
+            if not missing:
+                return answers
+            semaphore = self._semaphore()
+            with trace_stage("queue"):
+                await semaphore.acquire()
+            try:
+                version = get_corpus_version()
+                query_embeddings = await self._run(self.encoder_executor, generate_batch_query_embeddings,
+                                                   [questions[i] for i in missing], self.service.model,
+                                                   cache=self.service.embedding_cache)
+                found = await self._run(self.io_executor, self.service.answers_for_embeddings,
+                                        [questions[i] for i in missing], query_embeddings, version=version,
+                                        profile=profile)
+            finally:
+                semaphore.release()
+            for i, ranked in zip(missing, found):
+                answers[i] = ranked
+                self.service.cache_answers(questions[i], ranked, version, profile=profile)
+            return answers
+
+    async def process_query(self, question: str, profile: str = None) -> str:
+        """
+        Answers a single question
+
+        :param question: question
+        :param profile: search profile, defaults to the service's
+        :return: answer string
+        """
+        answers = await self.search_answers(question, profile=profile)
+        return best_answer(answers)
+
+    async def process_queries(self, questions: List[str], profile: str = None) -> List[str]:
+        """
+        Answers many questions in one batch
+
+        :param questions: questions
+        :param profile: search profile, defaults to the service's
+        :return: one answer per question
+        """
+        answers = await self.search_answers_batch(questions, profile=profile)
+        return [best_answer(ranked) for ranked in answers]
+
+    async def search_latest_answers(self, session: Any, question: str) -> List[Dict[str, Any]]:
+        """
+        Searches the answers of a question, cancelling the previous in-flight question of the same session
+
+        :param session: session key, e.g. the Gradio session hash
+        :param question: question
+        :return: ranked answers; raises ``QuerySuperseded`` if a newer question replaced this one
+        """
+        task = asyncio.ensure_future(self.search_answers(question))
+        previous, self._inflight[session] = self._inflight.get(session), task
+        if previous is not None and not previous.done():
+            log.info(f"Cancelling superseded question for session {session}")
+            previous.cancel()
+        try:
+            return await task
+        except asyncio.CancelledError:
+            if task.cancelled() and self._inflight.get(session) is not task:
+                raise QuerySuperseded(question)
+            raise
+        finally:
+            if self._inflight.get(session) is task:
+                del self._inflight[session]
+
+    async def process_latest_query(self, session: Any, question: str) -> str:
+        """
+        Answers a question, cancelling the previous in-flight question of the same session
+
+        :param session: session key, e.g. the Gradio session hash
+        :param question: question
+        :return: answer string; raises ``QuerySuperseded`` if a newer question replaced this one
+        """
+        return best_answer(await self.search_latest_answers(session, question))
+
+    def shutdown(self, wait: bool = True) -> None:
+        """
+        Stops the executors
+
+        :param wait: wait for running calls to finish
+        :return: None
+        """
+        self.encoder_executor.shutdown(wait=wait)
+        self.io_executor.shutdown(wait=wait)
+
+
+_async_service: AsyncQueryService = None
+_async_service_lock = threading.Lock()
+
+
+def get_async_query_service() -> AsyncQueryService:
+    """
+    Returns the process-wide async query service, creating it on first use
+
+    :return: async query service
+    """
+    global _async_service
+    if _async_service is None:
+        with _async_service_lock:
+            if _async_service is None:
+                _async_service = AsyncQueryService()
+    return _async_service
+
+
+def close_async_query_service() -> None:
+    """
+    Shuts down the process-wide async query service and its query service, if they were created
+
+    :return: None
+    """
+    global _async_service
+    with _async_service_lock:
+        service, _async_service = _async_service, None
+    if service is not None:
+        service.shutdown(wait=False)
+        service.service.close()
+
+
+async def async_chatbot_handler(question: str, session: Any = None) -> str:
+    if session is None:
+        return await get_async_query_service().process_query(question)
+    return await get_async_query_service().process_latest_query(session, question)
+
+
+async def async_response_handler(message: str, state: List = None, session: Any = None):
+    """
+    Async Gradio handler. When a session key is given, a newer message from the same session
+    cancels this one and the chat history is returned unchanged.
+
+    :param message: user message
+    :param state: chat history
+    :param session: session key, e.g. the Gradio session hash
+    :return: cleared textbox and updated chat history
+    """
+    state = [] if state is None else state
+    try:
+        bot_message = await async_chatbot_handler(message, session=session)
+    except QuerySuperseded:
+        return "", state
+    state.append((message, bot_message))
+    return "", state
+
+
+def _entry_index(state: List, entry: Tuple) -> int:
+    """
+    Position of a request's own chat entry; newer messages of the session may have been appended after it
+
+    :param state: chat history
+    :param entry: the entry the request appended
+    :return: index, or -1 once the entry is gone
+    """
+    for i in range(len(state) - 1, -1, -1):
+        if state[i] is entry:
+            return i
+    return -1
+
+
+async def async_stream_response_handler(message: str, state: List = None, session: Any = None):
+    """
+    Streaming Gradio handler: posts a placeholder right away, then the answer, then the ranked
+    similar questions with their scores. A newer message from the same session stops the stream.
+
+    :param message: user message
+    :param state: chat history
+    :param session: session key, e.g. the Gradio session hash
+    :return: async generator of (textbox, chat history) updates
+    """
+    state = [] if state is None else state
+    entry = (message, SEARCHING)
+    state.append(entry)
+    yield "", state
+    service = get_async_query_service()
+    try:
+        if session is None:
+            answers = await service.search_answers(message)
+        else:
+            answers = await service.search_latest_answers(session, message)
+    except QuerySuperseded:
+        index = _entry_index(state, entry)
+        if index >= 0:
+            del state[index]
+        yield "", state
+        return
+    answer = best_answer(answers)
+    updates = [answer]
+    if answers:
+        updates.append(f"{answer}\n\n{format_similar_questions(answers)}")
+    for text in updates:
+        index = _entry_index(state, entry)
+        if index < 0:
+            return
+        entry = state[index] = (message, text)
+        yield "", state
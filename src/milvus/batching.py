@@ -0,0 +1,150 @@
+import functools
+import queue
+import threading
+import time
+import traceback
+from collections import Counter
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from milvus.query_service import get_query_service
+from milvus.tracing import RequestTrace, current_trace, trace_request
+from myLogger.Logger import getLogger as GetLogger
+from utils.metrics import BATCH_SIZE
+from config import QA_BATCH_WINDOW_MS, QA_BATCH_MAX_SIZE
+
+log = GetLogger(__name__)
+
+
+class QueryBatcher:
+    """
+    Micro-batching scheduler for concurrent questions.
+
+    Questions submitted within ``window_ms`` of the first waiting question (or until ``max_batch_size``
+    questions are waiting) are handed to ``handler`` as one list, so they share one encoder batch and
+    one multi-vector Milvus search. Every caller gets a future resolved with its own result, and its
+    request trace, if any, gets the stage timings of the batch.
+    """
+
+    def __init__(self,
+                 handler: Callable[[List[str]], List[Any]],
+                 window_ms: float = QA_BATCH_WINDOW_MS,
+                 max_batch_size: int = QA_BATCH_MAX_SIZE,
+                 name: str = "qa-batcher"):
+        self.handler = handler
+        self.window = window_ms / 1000.0
+        self.max_batch_size = max_batch_size
+        self.batch_sizes: Counter = Counter()
+        self.batches = 0
+        self.queries = 0
+        self._queue: "queue.Queue[Tuple[str, Future, Optional[RequestTrace]]]" = queue.Queue()
+        self._stopped = threading.Event()
+        self._stats_lock = threading.Lock()
+        self._worker = threading.Thread(target=self._run, name=name, daemon=True)
+        self._worker.start()
+
+    def submit(self, question: str) -> Future:
+        """
+        Queues a question for the next batch
+
+        :param question: question
+        :return: future resolved with the handler's result for this question
+        """
+        if self._stopped.is_set():
+            raise RuntimeError("QueryBatcher is stopped")
+        future = Future()
+        self._queue.put((question, future, current_trace()))
+        return future
+
+    def __call__(self, question: str, timeout: float = None) -> Any:
+        return self.submit(question).result(timeout=timeout)
+
+    def _collect(self) -> List[Tuple[str, Future, Optional[RequestTrace]]]:
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.window
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return [item for item in batch if item is not None]
+
+    def _run(self) -> None:
+        while not self._stopped.is_set():
+            batch = [(q, f, t) for q, f, t in self._collect() if f.set_running_or_notify_cancel()]
+            if not batch:
+                continue
+            self._record(len(batch))
+            try:
+                questions = [question for question, _, _ in batch]
+                with trace_request(questions, record_metrics=False) as batch_trace:
+                    results = self.handler(questions)
+                if len(results) != len(batch):
+                    raise ValueError(f"Handler returned {len(results)} results for {len(batch)} questions")
+                # the callers' traces see the encode / search / metadata stages of the batch
+                aligned = len(batch_trace.distances) == len(batch)
+                for index, (_, _, trace) in enumerate(batch):
+                    if trace is not None:
+                        trace.absorb(batch_trace, index if aligned else None)
+                for (_, future, _), result in zip(batch, results):
+                    future.set_result(result)
+            except Exception as e:
+                log.error(f'Error while processing batch of {len(batch)} questions: {e}')
+                log.error(traceback.format_exc())
+                for _, future, _ in batch:
+                    future.set_exception(e)
+
+    def _record(self, size: int) -> None:
+        with self._stats_lock:
+            self.batches += 1
+            self.queries += size
+            self.batch_sizes[size] += 1
+        BATCH_SIZE.observe(size)
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Batch-size statistics since start
+
+        :return: dict with the number of batches and queries, mean and max batch size and the size histogram
+        """
+        with self._stats_lock:
+            return {
+                "batches": self.batches,
+                "queries": self.queries,
+                "mean_batch_size": self.queries / self.batches if self.batches else 0.0,
+                "max_batch_size": max(self.batch_sizes) if self.batch_sizes else 0,
+                "batch_sizes": dict(sorted(self.batch_sizes.items())),
+            }
+
+    def stop(self) -> None:
+        """
+        Stops the worker thread after the current batch
+
+        :return: None
+        """
+        self._stopped.set()
+        self._queue.put(None)
+        self._worker.join(timeout=5)
+
+
+_batcher: QueryBatcher = None
+_batcher_lock = threading.Lock()
+
+
+def get_query_batcher() -> QueryBatcher:
+    """
+    Returns the process-wide batcher in front of the query service, creating it on first use
+
+    :return: query batcher
+    """
+    global _batcher
+    if _batcher is None:
+        with _batcher_lock:
+            if _batcher is None:
+                # callers look up the answer cache before queueing a question
+                _batcher = QueryBatcher(handler=functools.partial(get_query_service().search_answers_batch,
+                                                                  lookup_cache=False))
+    return _batcher
@@ -0,0 +1,340 @@
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional
+
+import numpy as np
+
+from utils.corpus import get_corpus_version
+from utils.embedding import clean_text
+from myLogger.Logger import getLogger as GetLogger
+
+log = GetLogger(__name__)
+
+
+# ---------------------------------------------------------------------------------------
+def normalize_question(question: str, clean: bool = False) -> str:
+    """
+    Canonical form of a question used as a cache key: case folded and whitespace collapsed,
+    optionally run through ``utils.embedding.clean_text`` as well
+
+    :param question: question
+    :param clean: also strip urls, html, punctuation and stop words
+    :return: normalized question
+    """
+    question = str(question)
+    if clean:
+        question = clean_text(question)
+    return re.sub(r'\s+', ' ', question.casefold()).strip()
+
+
+# ---------------------------------------------------------------------------------------
+class EmbeddingCache:
+    """
+    Bounded LRU cache of normalized float32 query embeddings keyed by the normalized question.
+
+    The cache is bounded by the total size of the stored vectors in bytes; the least recently used
+    entries are evicted first.
+    """
+
+    def __init__(self, max_bytes: int, clean: bool = False):
+        self.max_bytes = int(max_bytes)
+        self.clean = clean
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.nbytes = 0
+        self._entries: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def key(self, question: str) -> str:
+        return normalize_question(question, clean=self.clean)
+
+    def get(self, question: str) -> Optional[np.ndarray]:
+        """
+        Looks up the embedding of a question
+
+        :param question: question
+        :return: the cached embedding or None
+        """
+        key = self.key(question)
+        with self._lock:
+            embedding = self._entries.get(key)
+            if embedding is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return embedding
+
+    def put(self, question: str, embedding) -> None:
+        """
+        Stores the embedding of a question, evicting least recently used entries over the byte cap
+
+        :param question: question
+        :param embedding: normalized embedding
+        :return: None
+        """
+        embedding = np.asarray(embedding, dtype=np.float32).reshape(-1)
+        embedding.setflags(write=False)
+        if embedding.nbytes > self.max_bytes:
+            return
+        key = self.key(question)
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self.nbytes -= previous.nbytes
+            self._entries[key] = embedding
+            self.nbytes += embedding.nbytes
+            while self.nbytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.nbytes -= evicted.nbytes
+                self.evictions += 1
+
+    def get_or_compute(self, question: str, compute: Callable[[str], Any]) -> np.ndarray:
+        """
+        Returns the cached embedding or computes and stores it
+
+        :param question: question
+        :param compute: function returning the normalized embedding of a question
+        :return: embedding
+        """
+        embedding = self.get(question)
+        if embedding is None:
+            embedding = np.asarray(compute(question), dtype=np.float32).reshape(-1)
+            self.put(question, embedding)
+        return embedding
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.nbytes = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Hit/miss counters and memory use
+
+        :return: dict of cache statistics
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self.nbytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+            }
+
+
+# ---------------------------------------------------------------------------------------
+class AnswerCache:
+    """
+    Bounded LRU cache of question -> ranked answers with a per-entry TTL.
+
+    Empty results ("Sorry, No answer found.") are cached as negative entries with their own, usually
+    shorter, TTL. Entries remember the corpus version they were computed under and are dropped as soon
+    as ``utils.corpus.bump_corpus_version`` is called by an ingestion job.
+    """
+
+    def __init__(self, max_entries: int, ttl: float, negative_ttl: float = None, clean: bool = False):
+        self.max_entries = int(max_entries)
+        self.ttl = ttl
+        self.negative_ttl = ttl if negative_ttl is None else negative_ttl
+        self.clean = clean
+        self.hits = 0
+        self.negative_hits = 0
+        self.misses = 0
+        self.expired = 0
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def key(self, question: str) -> str:
+        return normalize_question(question, clean=self.clean)
+
+    def get(self, question: str) -> Optional[Any]:
+        """
+        Looks up the cached answers of a question
+
+        :param question: question
+        :return: the cached value, an empty list for a negative entry, or None on a miss
+        """
+        key = self.key(question)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            value, expires_at, version = entry
+            if expires_at <= now or version != get_corpus_version():
+                del self._entries[key]
+                self.expired += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            if not value:
+                self.negative_hits += 1
+            return value
+
+    def put(self, question: str, value, version: int = None) -> None:
+        """
+        Stores the answers of a question; empty answers are stored as a negative entry
+
+        :param question: question
+        :param value: ranked answers
+        :param version: corpus version the value was computed under, defaults to the current one
+        :return: None
+        """
+        ttl = self.ttl if value else self.negative_ttl
+        if ttl <= 0 or self.max_entries <= 0:
+            return
+        version = get_corpus_version() if version is None else version
+        with self._lock:
+            self._entries[self.key(question)] = (value, time.monotonic() + ttl, version)
+            self._entries.move_to_end(self.key(question))
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, *args) -> None:
+        """
+        Drops every entry; usable as a ``utils.corpus.on_corpus_change`` listener
+
+        :return: None
+        """
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Hit/miss counters
+
+        :return: dict of cache statistics
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "negative_hits": self.negative_hits,
+                "misses": self.misses,
+                "expired": self.expired,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+            }
+
+
+# ---------------------------------------------------------------------------------------
+class SemanticCache:
+    """
+    Small in-process vector index of recent query embeddings and their answers.
+
+    A lookup returns the cached answers of the most similar stored query when its cosine similarity
+    reaches ``threshold``, so paraphrases ("What is AAA?", "what's AAA") skip the Milvus search and the
+    SQL lookup. Embeddings are expected to be L2-normalized, which makes the cosine a dot product over a
+    preallocated float32 matrix. When full, the least recently used slot is overwritten. Entries from an
+    older corpus version never match.
+    """
+
+    def __init__(self, capacity: int, dim: int, threshold: float):
+        self.capacity = int(capacity)
+        self.dim = int(dim)
+        self.threshold = float(threshold)
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._vectors = np.zeros((self.capacity, self.dim), dtype=np.float32)
+        self._values: List[Any] = [None] * self.capacity
+        self._versions = np.full(self.capacity, -1, dtype=np.int64)
+        self._last_used = np.zeros(self.capacity, dtype=np.float64)
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def lookup(self, embedding) -> Optional[Any]:
+        """
+        Finds the cached answers of the nearest stored query above the similarity threshold
+
+        :param embedding: normalized query embedding
+        :return: cached answers or None
+        """
+        embedding = np.asarray(embedding, dtype=np.float32).reshape(-1)
+        with self._lock:
+            if self._size == 0:
+                self.misses += 1
+                return None
+            scores = self._vectors[:self._size] @ embedding
+            scores[self._versions[:self._size] != get_corpus_version()] = -np.inf
+            best = int(np.argmax(scores))
+            if scores[best] < self.threshold:
+                self.misses += 1
+                return None
+            self._last_used[best] = time.monotonic()
+            self.hits += 1
+            return self._values[best]
+
+    def put(self, embedding, value, version: int = None) -> None:
+        """
+        Stores a query embedding with its answers, overwriting the least recently used slot when full
+
+        :param embedding: normalized query embedding
+        :param value: ranked answers
+        :param version: corpus version the value was computed under, defaults to the current one
+        :return: None
+        """
+        if self.capacity <= 0:
+            return
+        embedding = np.asarray(embedding, dtype=np.float32).reshape(-1)
+        version = get_corpus_version() if version is None else version
+        with self._lock:
+            if self._size < self.capacity:
+                slot = self._size
+                self._size += 1
+            else:
+                slot = int(np.argmin(self._last_used))
+                self.evictions += 1
+            self._vectors[slot] = embedding
+            self._values[slot] = value
+            self._versions[slot] = version
+            self._last_used[slot] = time.monotonic()
+
+    def invalidate(self, *args) -> None:
+        """
+        Drops every entry; usable as a ``utils.corpus.on_corpus_change`` listener
+
+        :return: None
+        """
+        with self._lock:
+            self._values = [None] * self.capacity
+            self._versions[:] = -1
+            self._size = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Hit/miss counters
+
+        :return: dict of cache statistics
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": self._size,
+                "capacity": self.capacity,
+                "threshold": self.threshold,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+            }
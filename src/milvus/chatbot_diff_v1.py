@@ -1,10 +1,12 @@
 import traceback
+import pandas as pd
 from pymilvus import Collection, FieldSchema, DataType
 import gradio as gr
 from database.mysql import MySQLDatabase
 from milvus.milvus_helper import MilvusClient
 from milvus.question_answering import load_data_to_mysql, generate_and_store_embeddings, format_data, handle_diff
 from myLogger.Logger import getLogger as GetLogger
+from config import DATASET_PATH
 
 log = GetLogger(__name__)
 
@@ -82,11 +84,12 @@ if __name__ == '__main__':
             FieldSchema(name="embedding", dtype=DataType.FLOAT_VECTOR, descrition="float vector", dim=768,
                         is_primary=False)
         ]
-        collection = milvus_client.create_collection(TABLE_NAME, fields)
+        data = pd.read_csv(DATASET_PATH)
+        collection = milvus_client.create_collection(TABLE_NAME, fields, rows=len(data))
         if collection is None:
             raise Exception("Failed to create collection: {}".format(TABLE_NAME))
         log.info("collection: {}".format(collection))
-        ids, question_data, answer_data = generate_and_store_embeddings(collection=collection)
+        ids, question_data, answer_data = generate_and_store_embeddings(collection=collection, data=data)
         load_data_to_mysql(mysql_db.cursor, mysql_db.connection,
                            TABLE_NAME, format_data(ids, question_data, answer_data))
 
@@ -0,0 +1,205 @@
+import threading
+import time
+import traceback
+from typing import Any, Dict, Tuple
+
+from pymilvus import Collection, utility
+
+from milvus.search_profiles import register_index
+from myLogger.Logger import getLogger as GetLogger
+from config import MILVUS_LOAD_TIMEOUT
+
+log = GetLogger(__name__)
+
+
+def _parse_progress(progress) -> int:
+    """
+    Normalizes the loading progress reported by pymilvus ("100%", 100 or {"loading_progress": "100%"})
+
+    :param progress: raw progress value
+    :return: progress as an integer percentage
+    """
+    if isinstance(progress, dict):
+        progress = progress.get("loading_progress", 0)
+    if isinstance(progress, str):
+        progress = progress.strip().rstrip("%") or 0
+    return int(float(progress))
+
+
+class CollectionState:
+    """
+    Tracks whether a collection is loaded into query nodes.
+
+    The collection is loaded at most once per process; afterwards ``ready`` is a plain attribute
+    read, so the search hot path never issues load or loading-progress RPCs.
+    """
+
+    def __init__(self, collection: Collection, timeout: float = MILVUS_LOAD_TIMEOUT, poll_interval: float = 0.5):
+        self.collection = collection
+        self.timeout = timeout
+        self.poll_interval = poll_interval
+        self.progress = 0
+        self._ready = False
+        self._load_requested = False
+        self._lock = threading.Lock()
+
+    @property
+    def ready(self) -> bool:
+        return self._ready
+
+    @property
+    def using(self) -> str:
+        return getattr(self.collection, "_using", "default")
+
+    def refresh_progress(self) -> int:
+        """
+        Asks the server how much of the collection is loaded
+
+        :return: loading progress as an integer percentage
+        """
+        self.progress = _parse_progress(utility.loading_progress(self.collection.name, using=self.using))
+        if self.progress >= 100:
+            self._ready = True
+        return self.progress
+
+    def _probe_progress(self) -> int:
+        """
+        ``refresh_progress`` for a collection that may never have been loaded, on which the server reports an
+        error instead of a progress
+
+        :return: loading progress as an integer percentage, 0 when the collection is not loaded
+        """
+        try:
+            return self.refresh_progress()
+        except Exception as e:
+            if self._load_requested:
+                raise e
+            log.debug(f'Collection "{self.collection.name}" not loaded: {e}')
+            self.progress = 0
+            return 0
+
+    def ensure_loaded(self, wait: bool = True) -> bool:
+        """
+        Loads the collection if it is not loaded yet
+
+        :param wait: block until loading completes or the timeout expires
+        :return: True when the collection is ready for search
+        """
+        if self._ready:
+            return True
+        with self._lock:
+            if self._ready:
+                return True
+            try:
+                if self._probe_progress() >= 100:
+                    return True
+                if not self._load_requested:
+                    log.info(f'Loading collection "{self.collection.name}"')
+                    self.collection.load(_async=True)
+                    self._load_requested = True
+                if not wait:
+                    return self._ready
+                deadline = time.monotonic() + self.timeout
+                while self.refresh_progress() < 100:
+                    if time.monotonic() > deadline:
+                        raise TimeoutError(f'Collection "{self.collection.name}" still loading '
+                                           f'({self.progress}%) after {self.timeout}s')
+                    time.sleep(self.poll_interval)
+                log.info(f'Collection "{self.collection.name}" loaded')
+                return True
+            except Exception as e:
+                log.error(f'Error while loading collection: \nCollection: {self.collection.name} \n{e}')
+                log.error(traceback.format_exc())
+                raise e
+
+    def mark_loaded(self) -> None:
+        """
+        Records that the collection is known to be loaded, e.g. for an in-memory stand-in without a server
+
+        :return: None
+        """
+        with self._lock:
+            self._ready = True
+            self._load_requested = True
+            self.progress = 100
+
+    def mark_released(self) -> None:
+        """
+        Records that the collection was released or dropped, so the next ``ensure_loaded`` reloads it
+
+        :return: None
+        """
+        with self._lock:
+            self._ready = False
+            self._load_requested = False
+            self.progress = 0
+
+
+_states: Dict[Tuple[str, str], CollectionState] = {}
+_states_lock = threading.Lock()
+
+
+def get_collection_state(collection: Collection) -> CollectionState:
+    """
+    Returns the shared load-state tracker for a collection
+
+    :param collection: collection object
+    :return: collection state
+    """
+    key = (getattr(collection, "_using", "default"), collection.name)
+    with _states_lock:
+        state = _states.get(key)
+        if state is None:
+            state = _states[key] = CollectionState(collection)
+        return state
+
+
+def release_collection(collection: Collection) -> None:
+    """
+    Releases a collection from the query nodes and records it, so the next ``ensure_loaded`` reloads it
+
+    :param collection: collection object
+    :return: None
+    """
+    collection.release()
+    get_collection_state(collection).mark_released()
+
+
+def mark_collection_released(collection_name: str, using: str = "default") -> None:
+    """
+    Records that a collection was released or dropped by name, e.g. through ``utility.drop_collection``;
+    collections no state was created for are ignored
+
+    :param collection_name: collection name
+    :param using: connection alias
+    :return: None
+    """
+    with _states_lock:
+        state = _states.get((using, collection_name))
+    if state is not None:
+        state.mark_released()
+
+
+def build_index(collection: Any, advice: Dict[str, Any], field_name: str = "embedding",
+                wait: bool = True) -> Dict[str, Any]:
+    """
+    Builds the advised index on a vector field, replacing the existing one: the collection is released, re-indexed
+    and loaded again, and its search profiles are reset to the starting params of the new index
+
+    :param collection: collection object
+    :param advice: advice of ``database.index_advisor.recommend_index``
+    :param field_name: vector field
+    :param wait: block until the collection is loaded again
+    :return: the advice, with the measured "built_seconds"
+    """
+    started = time.perf_counter()
+    if collection.has_index():
+        release_collection(collection)
+        collection.drop_index()
+    collection.create_index(field_name=field_name, index_params=advice["index_params"])
+    advice["built_seconds"] = round(time.perf_counter() - started, 3)
+    register_index(collection.name, advice)
+    log.info(f"Built {advice['index_type']} on {collection.name}.{field_name} in {advice['built_seconds']}s "
+             f"(estimated {advice['build_seconds']}s, ~{advice['memory_bytes'] / 2 ** 20:.1f} MiB)")
+    get_collection_state(collection).ensure_loaded(wait=wait)
+    return advice
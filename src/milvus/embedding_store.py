@@ -0,0 +1,211 @@
+import hashlib
+import json
+import os
+import re
+import threading
+import traceback
+from typing import Any, Dict, List, Sequence, Tuple
+
+import numpy as np
+
+from utils.metrics import CACHE_LOOKUPS
+from utils.models import model_id
+from myLogger.Logger import getLogger as GetLogger
+from config import QA_EMBEDDING_STORE_PATH
+
+log = GetLogger(__name__)
+
+########################################################################################################################
+# Persistent embedding store
+#
+# Embeddings of ingested texts on disk, keyed by (model id, sha256 of the text), so re-ingesting a dataset only
+# encodes new or changed texts. Every model id has a directory of its own holding:
+#
+#   vectors.f32   append-only float32 rows, read through a memmap
+#   index.bin     append-only 32-byte sha256 digests, digest i belongs to row i
+#   meta.json     model id and dimension
+#
+# Rows are appended to vectors.f32 before their digests, so after a crash the shorter of the two files wins and the
+# store stays consistent. The store expects a single writing process, as ingestion is, which compacts it to the
+# current dataset once it is ingested.
+########################################################################################################################
+DIGEST_SIZE = 32
+
+
+def content_hash(text: str) -> bytes:
+    return hashlib.sha256(str(text).encode("utf-8")).digest()
+
+
+class EmbeddingStore:
+    """
+    Append-only on-disk embeddings of one model
+    """
+
+    def __init__(self, directory: str, model_name: str, dim: int = None):
+        self.directory = directory
+        self.model_name = model_name
+        self.dim = dim
+        self.hits = 0
+        self.misses = 0
+        self._rows: Dict[bytes, int] = {}
+        self._vectors: np.memmap = None
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self._vectors_path = os.path.join(directory, "vectors.f32")
+        self._index_path = os.path.join(directory, "index.bin")
+        self._meta_path = os.path.join(directory, "meta.json")
+        self._open()
+
+    def _open(self) -> None:
+        if os.path.isfile(self._meta_path):
+            with open(self._meta_path) as f:
+                meta = json.load(f)
+            if meta.get("model_id") != self.model_name:
+                raise ValueError(f"Embedding store {self.directory} belongs to {meta.get('model_id')}, "
+                                 f"not {self.model_name}")
+            if self.dim is not None and meta.get("dim") != self.dim:
+                raise ValueError(f"Embedding store {self.directory} holds {meta.get('dim')}-d vectors, not {self.dim}")
+            self.dim = meta["dim"]
+        if self.dim is None:
+            return
+        vector_rows = os.path.getsize(self._vectors_path) // (4 * self.dim) if os.path.isfile(self._vectors_path) else 0
+        index_rows = os.path.getsize(self._index_path) // DIGEST_SIZE if os.path.isfile(self._index_path) else 0
+        rows = min(vector_rows, index_rows)
+        if rows != vector_rows or rows != index_rows:
+            log.warning(f"Embedding store {self.directory} was not closed cleanly, keeping {rows} rows")
+            for path, size in ((self._vectors_path, rows * 4 * self.dim), (self._index_path, rows * DIGEST_SIZE)):
+                if os.path.isfile(path):
+                    with open(path, "r+b") as f:
+                        f.truncate(size)
+        if rows:
+            with open(self._index_path, "rb") as f:
+                index = f.read(rows * DIGEST_SIZE)
+            self._rows = {index[i * DIGEST_SIZE:(i + 1) * DIGEST_SIZE]: i for i in range(rows)}
+        self._vectors = None
+
+    def _memmap(self) -> np.memmap:
+        if self._vectors is None or len(self._vectors) != len(self._rows):
+            self._vectors = np.memmap(self._vectors_path, dtype=np.float32, mode="r", shape=(len(self._rows), self.dim)) \
+                if self._rows else np.zeros((0, self.dim or 0), dtype=np.float32)
+        return self._vectors
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def get_many(self, texts: Sequence[str]) -> Tuple[List[Any], List[int]]:
+        """
+        Looks up the embeddings of texts
+
+        :param texts: texts
+        :return: (one embedding or None per text, indices of the texts without an embedding)
+        """
+        digests = [content_hash(text) for text in texts]
+        with self._lock:
+            rows = [self._rows.get(digest) for digest in digests]
+            vectors = self._memmap() if any(row is not None for row in rows) else None
+            embeddings = [np.array(vectors[row]) if row is not None else None for row in rows]
+        missing = [i for i, row in enumerate(rows) if row is None]
+        self.hits += len(texts) - len(missing)
+        self.misses += len(missing)
+        CACHE_LOOKUPS.inc(len(texts) - len(missing), cache="embedding_store", result="hit")
+        CACHE_LOOKUPS.inc(len(missing), cache="embedding_store", result="miss")
+        return embeddings, missing
+
+    def put_many(self, texts: Sequence[str], embeddings: np.ndarray) -> int:
+        """
+        Appends the embeddings of texts not stored yet
+
+        :param texts: texts
+        :param embeddings: one embedding per text
+        :return: number of rows appended
+        """
+        embeddings = np.ascontiguousarray(np.asarray(embeddings, dtype=np.float32).reshape(len(texts), -1))
+        with self._lock:
+            if self.dim is None:
+                self.dim = int(embeddings.shape[1])
+                with open(self._meta_path, "w") as f:
+                    json.dump({"model_id": self.model_name, "dim": self.dim}, f)
+            elif embeddings.shape[1] != self.dim:
+                raise ValueError(f"Expected {self.dim}-d embeddings, got {embeddings.shape[1]}-d")
+            fresh: Dict[bytes, int] = {}
+            for i, text in enumerate(texts):
+                digest = content_hash(text)
+                if digest not in self._rows and digest not in fresh:
+                    fresh[digest] = i
+            if not fresh:
+                return 0
+            with open(self._vectors_path, "ab") as f:
+                f.write(embeddings[list(fresh.values())].tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+            with open(self._index_path, "ab") as f:
+                f.write(b"".join(fresh))
+                f.flush()
+                os.fsync(f.fileno())
+            start = len(self._rows)
+            for offset, digest in enumerate(fresh):
+                self._rows[digest] = start + offset
+            self._vectors = None
+            return len(fresh)
+
+    def compact(self, texts: Sequence[str]) -> int:
+        """
+        Rewrites the store keeping only the embeddings of ``texts``, e.g. the current dataset
+
+        :param texts: texts to keep
+        :return: number of rows dropped
+        """
+        keep = {content_hash(text) for text in texts}
+        with self._lock:
+            if not self._rows:
+                return 0
+            vectors = self._memmap()
+            kept = [(digest, row) for digest, row in self._rows.items() if digest in keep]
+            dropped = len(self._rows) - len(kept)
+            if not dropped:
+                return 0
+            data = np.asarray(vectors[[row for _, row in kept]], dtype=np.float32) if kept else \
+                np.zeros((0, self.dim), dtype=np.float32)
+            self._vectors = vectors = None
+            for path, payload in ((self._vectors_path, data.tobytes()),
+                                  (self._index_path, b"".join(digest for digest, _ in kept))):
+                with open(f"{path}.tmp", "wb") as f:
+                    f.write(payload)
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(f"{path}.tmp", path)
+            self._rows = {digest: i for i, (digest, _) in enumerate(kept)}
+            log.info(f"Embedding store {self.directory} compacted, {dropped} rows dropped")
+            return dropped
+
+
+_stores: Dict[str, EmbeddingStore] = {}
+_stores_lock = threading.Lock()
+
+
+def get_embedding_store(model: Any, root: str = QA_EMBEDDING_STORE_PATH) -> EmbeddingStore:
+    """
+    Returns the process-wide store of a model's embeddings; None when QA_EMBEDDING_STORE_PATH is empty or the
+    model is not pinned to a revision (see ``utils.models.model_id``), as its embeddings could silently change
+
+    :param model: encoder
+    :param root: directory holding a store per model id
+    :return: embedding store or None
+    """
+    if not root:
+        return None
+    name = model_id(model)
+    if name is None:
+        log.info(f"{type(model).__name__} is not pinned to a revision, embeddings are not stored")
+        return None
+    directory = os.path.join(root, re.sub(r"[^A-Za-z0-9_.-]+", "_", name))
+    with _stores_lock:
+        store = _stores.get(directory)
+        if store is None:
+            try:
+                store = _stores[directory] = EmbeddingStore(directory, name)
+            except Exception as e:
+                log.error(f'Error while opening the embedding store {directory}: {e}')
+                log.error(traceback.format_exc())
+                raise e
+    return store
@@ -0,0 +1,127 @@
+import time
+import traceback
+from typing import Any, List, Sequence
+
+import numpy as np
+
+from milvus.embedding_store import EmbeddingStore
+from myLogger.Logger import getLogger as GetLogger
+from config import QA_INGEST_TOKEN_BUDGET, QA_INGEST_MAX_BATCH_SIZE
+
+log = GetLogger(__name__)
+
+########################################################################################################################
+# Bulk encoding for ingestion
+#
+# A transformer batch costs (batch size x longest sequence in the batch) whatever the other sequences' lengths, so
+# mixing short and long texts pads the short ones up to the long one. The texts are sorted by token length and cut
+# into batches holding at most ``max_tokens`` padded tokens: many short texts per batch, few long ones. Embeddings
+# are returned in the original order. ``encode_cached`` first takes every embedding it can from the on-disk
+# embedding store, so re-ingestion only encodes new or changed texts.
+########################################################################################################################
+TOKENIZE_CHUNK = 10000
+
+
+def token_lengths(model: Any, texts: Sequence[str], max_seq_length: int = None) -> np.ndarray:
+    """
+    Token count of every text as the encoder sees it, special tokens included and truncation applied
+
+    :param model: sentence transformer; encoders without a tokenizer are estimated from word counts
+    :param texts: texts
+    :param max_seq_length: truncation length, defaults to the model's max_seq_length
+    :return: one length per text
+    """
+    max_seq_length = max_seq_length or getattr(model, "max_seq_length", None) or 512
+    tokenizer = getattr(model, "tokenizer", None)
+    if tokenizer is None:
+        lengths = [len(str(text).split()) + 2 for text in texts]
+    else:
+        lengths = []
+        for start in range(0, len(texts), TOKENIZE_CHUNK):
+            chunk = [str(text) for text in texts[start:start + TOKENIZE_CHUNK]]
+            encoded = tokenizer(chunk, add_special_tokens=True, truncation=True, max_length=max_seq_length,
+                                return_attention_mask=False, return_token_type_ids=False)
+            lengths.extend(len(ids) for ids in encoded["input_ids"])
+    return np.minimum(np.asarray(lengths, dtype=np.int64), max_seq_length)
+
+
+def token_budget_batches(lengths: Sequence[int], max_tokens: int = QA_INGEST_TOKEN_BUDGET,
+                         max_batch_size: int = QA_INGEST_MAX_BATCH_SIZE) -> List[np.ndarray]:
+    """
+    Groups texts of similar length into batches of at most ``max_tokens`` padded tokens
+
+    :param lengths: token length of every text
+    :param max_tokens: padded tokens per batch (batch size x longest text); a longer text gets a batch of its own
+    :param max_batch_size: texts per batch
+    :return: indices of the texts of every batch, longest texts first
+    """
+    order = np.argsort(-np.asarray(lengths), kind="stable")
+    batches, start = [], 0
+    while start < len(order):
+        # the first text of a batch is its longest
+        longest = max(int(lengths[order[start]]), 1)
+        size = max(1, min(max_batch_size, max_tokens // longest))
+        batches.append(order[start:start + size])
+        start += size
+    return batches
+
+
+def encode_bucketed(model: Any, texts: Sequence[str], max_tokens: int = QA_INGEST_TOKEN_BUDGET,
+                    max_batch_size: int = QA_INGEST_MAX_BATCH_SIZE, max_seq_length: int = None) -> np.ndarray:
+    """
+    Encodes texts in length-sorted, token-budget batches
+
+    :param model: sentence transformer
+    :param texts: texts
+    :param max_tokens: padded tokens per batch
+    :param max_batch_size: texts per batch
+    :param max_seq_length: truncation length used to measure the texts, defaults to the model's max_seq_length
+    :return: embeddings (not normalized), in the order of ``texts``
+    """
+    try:
+        if len(texts) == 0:
+            return np.zeros((0, 0), dtype=np.float32)
+        started = time.perf_counter()
+        lengths = token_lengths(model, texts, max_seq_length)
+        batches = token_budget_batches(lengths, max_tokens=max_tokens, max_batch_size=max_batch_size)
+        embeddings = None
+        padded = 0
+        for batch in batches:
+            encoded = np.asarray(model.encode([texts[i] for i in batch], batch_size=len(batch)), dtype=np.float32)
+            if embeddings is None:
+                embeddings = np.empty((len(texts), encoded.shape[-1]), dtype=np.float32)
+            embeddings[batch] = encoded.reshape(len(batch), -1)
+            padded += len(batch) * int(lengths[batch].max())
+        elapsed = time.perf_counter() - started
+        log.info(f"Encoded {len(texts)} texts in {len(batches)} batches in {elapsed:.2f}s "
+                 f"({len(texts) / elapsed if elapsed > 0 else 0.0:.1f} texts/s), "
+                 f"padding efficiency {int(lengths.sum()) / padded:.1%}")
+        return embeddings
+    except Exception as e:
+        log.error(f'Error while encoding {len(texts)} texts: \nModel: {model} \n{e}')
+        log.error(traceback.format_exc())
+        raise e
+
+
+def encode_cached(model: Any, texts: Sequence[str], store: EmbeddingStore = None, **kwargs) -> np.ndarray:
+    """
+    Encodes only the texts missing from the embedding store, in token-budget batches, and stores them
+
+    :param model: sentence transformer
+    :param texts: texts
+    :param store: embedding store of the model (see ``get_embedding_store``), None encodes every text
+    :param kwargs: further options of ``encode_bucketed``
+    :return: embeddings (not normalized), in the order of ``texts``
+    """
+    if store is None or len(texts) == 0:
+        return encode_bucketed(model, texts, **kwargs)
+    cached, missing = store.get_many(texts)
+    log.info(f"{len(texts) - len(missing)} of {len(texts)} embeddings found in {store.directory}, "
+             f"encoding {len(missing)}")
+    if missing:
+        pending = [texts[i] for i in missing]
+        encoded = encode_bucketed(model, pending, **kwargs)
+        store.put_many(pending, encoded)
+        for i, row in zip(missing, encoded):
+            cached[i] = row
+    return np.stack(cached).astype(np.float32, copy=False)
@@ -0,0 +1,134 @@
+import contextvars
+import traceback
+from collections import namedtuple
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Dict, List, Sequence
+
+import numpy as np
+from scipy import sparse
+from sklearn.feature_extraction.text import CountVectorizer
+
+from milvus.tracing import trace_stage
+from myLogger.Logger import getLogger as GetLogger
+from config import QA_LEXICAL_TOP_K, QA_LEXICAL_MIN_MATCH, QA_LEXICAL_WORKERS, QA_RRF_K
+
+log = GetLogger(__name__)
+
+# Hit of the lexical index or of the fusion, shaped like a pymilvus hit
+Hit = namedtuple("Hit", ["id", "distance"])
+
+_executor = ThreadPoolExecutor(max_workers=QA_LEXICAL_WORKERS, thread_name_prefix="qa-lexical")
+
+
+class BM25Index:
+    """
+    In-memory Okapi BM25 index over the corpus questions.
+
+    The document-term matrix of BM25 weights is computed once at build time, so scoring a query is a
+    column slice and a row sum of a sparse matrix. English stop words are dropped, and a document must
+    contain at least ``min_match`` of the query's terms to be returned.
+    """
+
+    def __init__(self, ids: Sequence[Any], texts: Sequence[str], k1: float = 1.5, b: float = 0.75,
+                 min_match: float = QA_LEXICAL_MIN_MATCH):
+        self.ids = [str(i) for i in ids]
+        self.k1 = k1
+        self.b = b
+        self.min_match = min_match
+        self.vectorizer = CountVectorizer(stop_words="english", lowercase=True)
+        if len(texts) == 0:
+            self.vocabulary: Dict[str, int] = {}
+            self._weights = sparse.csc_matrix((0, 0), dtype=np.float32)
+            return
+        counts = sparse.csr_matrix(self.vectorizer.fit_transform(texts), dtype=np.float32)
+        self.vocabulary = self.vectorizer.vocabulary_
+        documents = counts.shape[0]
+        lengths = np.asarray(counts.sum(axis=1)).ravel()
+        average = lengths.mean() if documents else 0.0
+        frequency = np.bincount(counts.indices, minlength=counts.shape[1])
+        idf = np.log(1.0 + (documents - frequency + 0.5) / (frequency + 0.5)).astype(np.float32)
+        # tf * (k1 + 1) / (tf + k1 * (1 - b + b * |d| / avgdl)), per non-zero entry
+        norm = (k1 * (1.0 - b + b * lengths / (average or 1.0))).astype(np.float32)
+        rows = np.repeat(np.arange(documents), np.diff(counts.indptr))
+        tf = counts.data
+        counts.data = idf[counts.indices] * tf * (k1 + 1.0) / (tf + norm[rows])
+        self._weights = counts.tocsc()
+        log.info(f"BM25 index built over {documents} questions, {len(self.vocabulary)} terms")
+
+    @classmethod
+    def from_table(cls, cursor, table_name: str, **kwargs) -> "BM25Index":
+        """
+        Builds the index from the questions of the metadata table
+
+        :param cursor: cursor object
+        :param table_name: name of the table
+        :return: BM25 index
+        """
+        sql = "select id, question from " + table_name + ";"
+        try:
+            cursor.execute(sql)
+            rows = cursor.fetchall()
+            return cls([row[0] for row in rows], [row[1] for row in rows], **kwargs)
+        except Exception as e:
+            log.error(f'Error while building the BM25 index: \nSql: \n{sql} \n{e}')
+            log.error(traceback.format_exc())
+            raise e
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def search(self, queries: Sequence[str], limit: int = QA_LEXICAL_TOP_K) -> List[List[Hit]]:
+        """
+        Lexical top-``limit`` of every query
+
+        :param queries: query texts
+        :param limit: hits per query
+        :return: one list of hits per query, best first; distance is the BM25 score
+        """
+        with trace_stage("lexical"):
+            results = []
+            analyzer = self.vectorizer.build_analyzer() if self.vocabulary else None
+            for query in queries:
+                tokens = set(analyzer(query)) if analyzer else set()
+                terms = sorted({self.vocabulary[t] for t in tokens if t in self.vocabulary})
+                if not terms:
+                    results.append([])
+                    continue
+                columns = self._weights[:, terms]
+                scores = np.asarray(columns.sum(axis=1)).ravel()
+                matched = np.asarray((columns > 0).sum(axis=1)).ravel()
+                # query terms missing from the vocabulary count as unmatched
+                candidates = np.flatnonzero(matched >= self.min_match * len(tokens))
+                if len(candidates) > limit:
+                    candidates = candidates[np.argpartition(-scores[candidates], limit - 1)[:limit]]
+                candidates = candidates[np.argsort(-scores[candidates], kind="stable")]
+                results.append([Hit(self.ids[i], float(scores[i])) for i in candidates])
+            return results
+
+    def search_async(self, queries: Sequence[str], limit: int = QA_LEXICAL_TOP_K) -> Future:
+        """
+        Runs ``search`` on the lexical executor, e.g. while the dense search is in flight
+
+        :param queries: query texts
+        :param limit: hits per query
+        :return: future resolved with the hits of every query
+        """
+        return _executor.submit(contextvars.copy_context().run, self.search, list(queries), limit)
+
+
+def reciprocal_rank_fusion(rankings: Sequence[Sequence[Any]], k: float = QA_RRF_K, limit: int = None) -> List[Hit]:
+    """
+    Fuses ranked hit lists: every hit scores sum(1 / (k + rank)) over the lists it appears in
+
+    :param rankings: hit lists, best first; hits are matched by id
+    :param k: RRF constant, larger values flatten the rank discount
+    :param limit: maximum number of fused hits
+    :return: fused hits, best first; distance is the RRF score
+    """
+    scores: Dict[str, float] = {}
+    for ranking in rankings:
+        for rank, hit in enumerate(ranking, start=1):
+            key = str(hit.id)
+            scores[key] = scores.get(key, 0.0) + 1.0 / (k + rank)
+    fused = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+    return [Hit(hit_id, score) for hit_id, score in fused[:limit]]
@@ -6,6 +6,8 @@ from pymilvus import connections as milvus_connection, CollectionSchema, FieldSc
 
 from database.milvus import MilvusAPI
 from myLogger.Logger import getLogger as GetLogger
+from milvus.search_profiles import get_search_params, register_index
+from config import MILVUS_EXPECTED_ROWS
 
 log = GetLogger(__name__)
 
@@ -67,18 +69,16 @@ class MilvusClient:
             if not self.client.has_collection(table_name):
                 collection = self.client.create_collection(collection_name=table_name,
                                                            fields=fields, )
-                index_params = {
-                    "index_type": "IVF_FLAT",
-                    "metric_type": "IP",
-                    "params": {"nlist": 200}
-                }
+                dim = [field for field in fields if field.name == field_name][0].params["dim"]
+                advice = self.client.recommend_index(kwargs.get('rows', MILVUS_EXPECTED_ROWS), int(dim))
 
                 self.client.create_index(
                     field_name=field_name,
                     collection_name=collection.name,
                     schema=collection.schema,
-                    index_params=index_params
+                    index_params=advice["index_params"]
                 )
+                register_index(collection.name, advice)
                 log.info(f"Collection \"{table_name}\" created successfully!")
             else:
                 collection = Collection(name=table_name)
@@ -107,7 +107,7 @@ class MilvusClient:
 
     def search_in_milvus(self, query_embeddings):
         try:
-            search_params = {"metric_type": 'IP', "params": {"nprobe": 16}}
+            search_params = get_search_params(self.client.collection)
             log.info("Partitions: {}".format(self.client.collection.partitions))
             # Load collection
             self.client.collection.load()
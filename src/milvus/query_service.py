@@ -0,0 +1,380 @@
+import threading
+import traceback
+from typing import Any, Dict, List, Optional
+
+from pymilvus import connections, Collection
+
+from database.mysql import MySQLConnectionPool
+from milvus.cache import AnswerCache, EmbeddingCache, SemanticCache
+from milvus.collection_state import CollectionState, get_collection_state
+from milvus.lexical import BM25Index
+from milvus.question_answering import search_answers, search_answers_batch, answers_for_embeddings, best_answer
+from milvus.tracing import trace_cache, trace_request
+from myLogger.Logger import getLogger as GetLogger
+from utils.corpus import CorpusVersionWatcher, get_corpus_version, off_corpus_change, on_corpus_change
+from utils.metrics import REGISTRY
+from utils.models import get_collection_model
+from config import MYSQL_HOST, MYSQL_PORT, MYSQL_USER, MYSQL_PASSWORD, MYSQL_DATABASE, MYSQL_POOL_SIZE, \
+    MILVUS_HOST, MILVUS_PORT, MILVUS_USER, MILVUS_PASSWORD, MILVUS_COLLECTION, \
+    MYSQL_DATABASE_TABLE_NAME, MILVUS_CONNECTION_ALIAS, QA_EMBEDDING_CACHE_BYTES, \
+    QA_EMBEDDING_CACHE_CLEAN_TEXT, QA_ANSWER_CACHE_SIZE, QA_ANSWER_CACHE_TTL, QA_ANSWER_CACHE_NEGATIVE_TTL, \
+    QA_SEMANTIC_CACHE_SIZE, QA_SEMANTIC_CACHE_THRESHOLD, MILVUS_DIMENSION, QA_SCORE_THRESHOLD, QA_SCORE_MARGIN, \
+    QA_HYBRID_SEARCH, QA_SEARCH_PROFILE, QA_CORPUS_POLL_SECONDS
+
+log = GetLogger(__name__)
+
+
+class QueryService:
+    """
+    Long-lived owner of the resources needed to answer a question.
+
+    The service connects to Milvus once, caches the ``Collection`` handle, keeps a pool of
+    MySQL connections and holds a reference to the encoder, so answering a question never
+    re-establishes a connection. Query embeddings are memoized in an LRU ``EmbeddingCache``
+    unless ``QA_EMBEDDING_CACHE_BYTES`` is 0, and whole results in a TTL ``AnswerCache`` unless
+    ``QA_ANSWER_CACHE_SIZE`` is 0; near-duplicate questions are answered from a ``SemanticCache``
+    unless ``QA_SEMANTIC_CACHE_SIZE`` is 0. Both result caches are dropped whenever the corpus
+    is re-ingested, by this process or, polled every ``QA_CORPUS_POLL_SECONDS``, by another.
+
+    Every request is traced, see ``milvus.tracing``. With ``hybrid`` a BM25 index over the
+    questions, built from the metadata table on first use and rebuilt after re-ingestion, is
+    searched alongside Milvus and fused with the dense ranking. Requests may pick another search
+    profile (see ``milvus.search_profiles``); those bypass the answer and semantic caches.
+    """
+
+    def __init__(self,
+                 collection_name: str = MILVUS_COLLECTION,
+                 table_name: str = MYSQL_DATABASE_TABLE_NAME,
+                 model: Any = None,
+                 pool: MySQLConnectionPool = None,
+                 alias: str = MILVUS_CONNECTION_ALIAS,
+                 collection: Collection = None,
+                 embedding_cache: EmbeddingCache = None,
+                 answer_cache: AnswerCache = None,
+                 semantic_cache: SemanticCache = None,
+                 score_threshold: float = QA_SCORE_THRESHOLD,
+                 score_margin: float = QA_SCORE_MARGIN,
+                 hybrid: bool = QA_HYBRID_SEARCH,
+                 search_profile: str = QA_SEARCH_PROFILE,
+                 corpus_poll_seconds: float = QA_CORPUS_POLL_SECONDS):
+        self.collection_name = collection.name if collection is not None else collection_name
+        self.table_name = table_name
+        self.alias = alias
+        self.model = model if model is not None else get_collection_model(self.collection_name)
+        self.pool = pool if pool is not None else MySQLConnectionPool(host=MYSQL_HOST,
+                                                                      port=int(MYSQL_PORT),
+                                                                      user=MYSQL_USER,
+                                                                      password=MYSQL_PASSWORD,
+                                                                      database=MYSQL_DATABASE,
+                                                                      size=MYSQL_POOL_SIZE)
+        if embedding_cache is None and QA_EMBEDDING_CACHE_BYTES > 0:
+            embedding_cache = EmbeddingCache(max_bytes=QA_EMBEDDING_CACHE_BYTES, clean=QA_EMBEDDING_CACHE_CLEAN_TEXT)
+        self.embedding_cache = embedding_cache
+        if answer_cache is None and QA_ANSWER_CACHE_SIZE > 0:
+            answer_cache = AnswerCache(max_entries=QA_ANSWER_CACHE_SIZE,
+                                       ttl=QA_ANSWER_CACHE_TTL,
+                                       negative_ttl=QA_ANSWER_CACHE_NEGATIVE_TTL,
+                                       clean=QA_EMBEDDING_CACHE_CLEAN_TEXT)
+        self._listeners = []
+        if answer_cache is not None:
+            self._listeners.append(on_corpus_change(answer_cache.invalidate))
+        self.answer_cache = answer_cache
+        if semantic_cache is None and QA_SEMANTIC_CACHE_SIZE > 0:
+            semantic_cache = SemanticCache(capacity=QA_SEMANTIC_CACHE_SIZE,
+                                           dim=int(MILVUS_DIMENSION),
+                                           threshold=QA_SEMANTIC_CACHE_THRESHOLD)
+        if semantic_cache is not None:
+            self._listeners.append(on_corpus_change(semantic_cache.invalidate))
+        self.semantic_cache = semantic_cache
+        self.score_threshold = score_threshold
+        self.score_margin = score_margin
+        self.hybrid = hybrid
+        self.search_profile = search_profile
+        self._lexical_index: BM25Index = None
+        self._listeners.append(on_corpus_change(self._drop_lexical_index))
+        self.corpus_watcher = CorpusVersionWatcher(self.pool, interval=corpus_poll_seconds) \
+            if corpus_poll_seconds > 0 else None
+        self._collection: Collection = collection
+        self._lock = threading.Lock()
+
+    def connect(self) -> None:
+        """
+        Connects to Milvus unless a connection already exists for the alias
+
+        :return: None
+        """
+        try:
+            if not connections.has_connection(alias=self.alias):
+                connections.connect(alias=self.alias,
+                                    user=MILVUS_USER,
+                                    password=MILVUS_PASSWORD,
+                                    host=MILVUS_HOST,
+                                    port=int(MILVUS_PORT))
+                log.info(f'Connected to Milvus at {MILVUS_HOST}:{MILVUS_PORT} using alias "{self.alias}"')
+        except Exception as e:
+            log.error(f'Error while connecting to Milvus: {e}')
+            log.error(traceback.format_exc())
+            raise e
+
+    @property
+    def state(self) -> CollectionState:
+        """
+        Load-state tracker of the cached collection
+
+        :return: collection state
+        """
+        if self._collection is None:
+            with self._lock:
+                if self._collection is None:
+                    self.connect()
+                    self._collection = Collection(name=self.collection_name, using=self.alias)
+        return get_collection_state(self._collection)
+
+    @property
+    def collection(self) -> Collection:
+        """
+        Cached collection handle, created and loaded on first access
+
+        :return: collection object
+        """
+        state = self.state
+        if not state.ready:
+            state.ensure_loaded()
+        return state.collection
+
+    @property
+    def lexical_index(self) -> Optional[BM25Index]:
+        """
+        BM25 index over the questions, built on first access in hybrid mode
+
+        :return: lexical index, or None unless hybrid
+        """
+        if not self.hybrid:
+            return None
+        index = self._lexical_index
+        if index is None:
+            with self._lock:
+                index = self._lexical_index
+                if index is None:
+                    with self.pool.cursor() as cursor:
+                        index = self._lexical_index = BM25Index.from_table(cursor, self.table_name)
+        return index
+
+    def _drop_lexical_index(self, version: int = None) -> None:
+        self._lexical_index = None
+
+    def uses_default_profile(self, profile: str = None) -> bool:
+        """
+        Whether a request runs with the service's search profile; only those read and fill the result caches
+
+        :param profile: requested search profile
+        :return: True for None or the service's profile
+        """
+        return profile is None or profile == self.search_profile
+
+    def pipeline_options(self, profile: str = None) -> Dict[str, Any]:
+        """
+        Keyword arguments passed to the ``question_answering`` pipeline functions
+
+        :param profile: search profile of the request, defaults to the service's
+        :return: pipeline keyword arguments
+        """
+        return {"table_name": self.table_name,
+                "model": self.model,
+                "embedding_cache": self.embedding_cache,
+                "semantic_cache": self.semantic_cache if self.uses_default_profile(profile) else None,
+                "score_threshold": self.score_threshold,
+                "score_margin": self.score_margin,
+                "lexical_index": self.lexical_index,
+                "search_profile": profile or self.search_profile}
+
+    def cached_answers(self, question: str, profile: str = None) -> Optional[List[Dict[str, Any]]]:
+        """
+        Looks a question up in the answer cache
+
+        :param question: question
+        :param profile: search profile of the request; other profiles than the service's bypass the cache
+        :return: the cached ranked answers, or None on a miss or without an answer cache
+        """
+        if self.corpus_watcher is not None:
+            # picks up re-ingestions of other processes before anything is served from a cache
+            self.corpus_watcher.poll()
+        if self.answer_cache is None or not self.uses_default_profile(profile):
+            return None
+        cached = self.answer_cache.get(question)
+        trace_cache("answer", cached is not None)
+        return cached
+
+    def cache_answers(self, question: str, answers: List[Dict[str, Any]], version: int,
+                      profile: str = None) -> None:
+        """
+        Stores the ranked answers of a question computed under ``version`` of the corpus
+
+        :param question: question
+        :param answers: ranked answers
+        :param version: corpus version captured before the work started
+        :param profile: search profile of the request; other profiles than the service's are not cached
+        :return: None
+        """
+        if self.answer_cache is not None and self.uses_default_profile(profile):
+            self.answer_cache.put(question, answers, version=version)
+
+    def process_query(self, question: str, profile: str = None) -> str:
+        """
+        Answers a single question using the pooled resources
+
+        :param question: question
+        :param profile: search profile ("fast", "balanced", "accurate"), defaults to the service's
+        :return: answer string
+        """
+        with trace_request(question):
+            return best_answer(self.search_answers(question, profile=profile))
+
+    def explain(self, question: str, profile: str = None) -> Dict[str, Any]:
+        """
+        Answers a question and reports where the time went
+
+        :param question: question
+        :param profile: search profile, defaults to the service's
+        :return: {"answers": ranked answers, "trace": stage timings, cache hits and top-k similarities}
+        """
+        with trace_request(question) as trace:
+            answers = self.search_answers(question, profile=profile)
+        return {"answers": answers, "trace": trace.to_dict()}
+
+    def search_answers(self, question: str, profile: str = None) -> List[Dict[str, Any]]:
+        """
+        Returns the ranked answers for a question together with their distances
+
+        :param question: question
+        :param profile: search profile, defaults to the service's
+        :return: list of {"id", "question", "answer", "distance"} dicts
+        """
+        with trace_request(question):
+            cached = self.cached_answers(question, profile=profile)
+            if cached is not None:
+                return cached
+            version = get_corpus_version()
+            # before the checkout: building the lexical index takes a pooled connection of its own
+            options = self.pipeline_options(profile)
+            with self.pool.cursor() as cursor:
+                answers = search_answers(cursor, question, self.collection, **options)
+            self.cache_answers(question, answers, version, profile=profile)
+            return answers
+
+    def process_queries(self, questions: List[str], profile: str = None) -> List[str]:
+        """
+        Answers many questions with one encode, one search and one metadata fetch
+
+        :param questions: questions
+        :param profile: search profile, defaults to the service's
+        :return: one answer per question
+        """
+        return [best_answer(answers) for answers in self.search_answers_batch(questions, profile=profile)]
+
+    def search_answers_batch(self, questions: List[str], lookup_cache: bool = True,
+                             profile: str = None) -> List[List[Dict[str, Any]]]:
+        """
+        Returns the ranked answers with distances for many questions at once; only the questions
+        missing from the answer cache reach the encoder, Milvus and MySQL
+
+        :param questions: questions
+        :param lookup_cache: look the questions up in the answer cache first; results are cached either way
+        :param profile: search profile, defaults to the service's
+        :return: per question, a list of {"id", "question", "answer", "distance"} dicts
+        """
+        with trace_request(questions):
+            answers = [self.cached_answers(q, profile=profile) if lookup_cache else None for q in questions]
+            missing = [i for i, cached in enumerate(answers) if cached is None]
+            if missing:
+                version = get_corpus_version()
+                options = self.pipeline_options(profile)
+                with self.pool.cursor() as cursor:
+                    found = search_answers_batch(cursor, [questions[i] for i in missing], self.collection, **options)
+                for i, ranked in zip(missing, found):
+                    answers[i] = ranked
+                    self.cache_answers(questions[i], ranked, version, profile=profile)
+            return answers
+
+    def answers_for_embeddings(self, questions: List[str], query_embeddings: List,
+                               version: int = None, profile: str = None) -> List[List[Dict[str, Any]]]:
+        """
+        Resolves already encoded queries to ranked answers using a pooled connection
+
+        :param questions: questions, aligned with the embeddings
+        :param query_embeddings: normalized query embeddings
+        :param version: corpus version captured before encoding
+        :param profile: search profile, defaults to the service's
+        :return: per question, a list of {"id", "question", "answer", "distance"} dicts
+        """
+        options = self.pipeline_options(profile)
+        with self.pool.cursor() as cursor:
+            return answers_for_embeddings(cursor, questions, query_embeddings, self.collection,
+                                          table_name=self.table_name, semantic_cache=options["semantic_cache"],
+                                          version=version, score_threshold=self.score_threshold,
+                                          score_margin=self.score_margin, lexical_index=options["lexical_index"],
+                                          search_profile=options["search_profile"])
+
+    def close(self) -> None:
+        """
+        Releases the MySQL pool, drops the cached collection handle and stops listening to corpus changes
+
+        :return: None
+        """
+        for listener in self._listeners:
+            off_corpus_change(listener)
+        self._listeners = []
+        self.pool.close()
+        self._collection = None
+
+
+_service: QueryService = None
+_service_lock = threading.Lock()
+
+
+def get_query_service() -> QueryService:
+    """
+    Returns the process-wide query service, creating it on first use
+
+    :return: query service
+    """
+    global _service
+    if _service is None:
+        with _service_lock:
+            if _service is None:
+                _service = QueryService()
+    return _service
+
+
+def set_query_service(service: QueryService) -> QueryService:
+    """
+    Replaces the process-wide query service, e.g. with one built around an existing collection
+
+    :param service: query service
+    :return: the previous query service, if any
+    """
+    global _service
+    with _service_lock:
+        previous, _service = _service, service
+    return previous
+
+
+@REGISTRY.register_collector
+def _cache_metrics() -> List:
+    """
+    Exports the statistics of the process-wide service's caches on every scrape
+    """
+    service = _service
+    if service is None:
+        return []
+    ratios, entries = [], []
+    for name, cache in (("embedding", service.embedding_cache),
+                        ("answer", service.answer_cache),
+                        ("semantic", service.semantic_cache)):
+        if cache is None:
+            continue
+        stats = cache.stats()
+        ratios.append(({"cache": name}, stats["hit_ratio"]))
+        entries.append(({"cache": name}, stats["entries"]))
+    return [("qa_cache_hit_ratio", "gauge", "Hit ratio of the query service caches since start", ratios),
+            ("qa_cache_entries", "gauge", "Entries held by the query service caches", entries)]
@@ -1,16 +1,25 @@
-import time
 import traceback
 from typing import List, Any, Dict, Tuple
 import pymysql
 from pymilvus import connections, FieldSchema, CollectionSchema, DataType, Collection, utility, SearchResult
-from sentence_transformers import SentenceTransformer
 import pandas as pd
 from difflib import Differ
 from sklearn.preprocessing import normalize
+from database.index_advisor import recommend_index
+from milvus.cache import EmbeddingCache, SemanticCache
+from milvus.embedding_store import get_embedding_store
+from milvus.ingestion import encode_cached
+from milvus.lexical import BM25Index, reciprocal_rank_fusion
+from milvus.search_profiles import get_search_params, register_index
+from milvus.tracing import trace_cache, trace_distances, trace_request, trace_stage
+from utils.corpus import bump_corpus_version, get_corpus_version, publish_corpus_change
+from utils.metrics import track_ingestion
+from utils.models import get_collection_model, get_model
 from myLogger.Logger import getLogger as GetLogger
 from config import MYSQL_HOST, MYSQL_PORT, MYSQL_USER, MYSQL_PASSWORD, MYSQL_DATABASE, \
     MILVUS_HOST, MILVUS_PORT, MILVUS_USER, MILVUS_PASSWORD, MILVUS_COLLECTION, \
-    MYSQL_DATABASE_TABLE_NAME, MILVUS_CONNECTION_ALIAS, DATASET_PATH, MODEL_SELECTION
+    MYSQL_DATABASE_TABLE_NAME, MILVUS_CONNECTION_ALIAS, DATASET_PATH, QA_MICRO_BATCHING, \
+    QA_RRF_K, MILVUS_EXPECTED_ROWS
 
 log = GetLogger(__name__)
 
@@ -27,7 +36,7 @@ def batch_retrival(arr, batch_amount) -> List:
     log.info(f'batch_retrival: {len(arr)}')
     while (batch_index + batch_amount) <= len(arr):  # if index plus batch amount is not greater than array length
         yield arr[batch_index:batch_index + batch_amount]  # yield portion of array
-        batch_index += (batch_amount - 1)  # add batch amount to index
+        batch_index += batch_amount  # add batch amount to index
     # output rest of array if the length of the array is not a multiple of batch_amount
     if batch_index < len(arr):
         yield arr[batch_index:]
@@ -60,12 +69,39 @@ def connect_to_milvus_and_mysql():
         raise e
 
 
+def publish_milvus_change(reason: str) -> int:
+    """
+    Publishes a change of the Milvus corpus to the query services of every process through a short-lived
+    MySQL connection; only the version of this process moves when MySQL is unreachable
+
+    :param reason: what changed, for the logs
+    :return: the new corpus version of this process
+    """
+    try:
+        conn = pymysql.connect(host=MYSQL_HOST,
+                               port=int(MYSQL_PORT),
+                               user=MYSQL_USER,
+                               password=MYSQL_PASSWORD,
+                               database=MYSQL_DATABASE)
+    except Exception as e:
+        log.warning(f'Could not publish the corpus change, other processes keep their caches: {e}')
+        return bump_corpus_version(reason)
+    try:
+        with conn.cursor() as cursor:
+            version = publish_corpus_change(cursor, reason)
+        conn.commit()
+        return version
+    finally:
+        conn.close()
+
+
 # Creating Collection and Setting Index
-def create_collection(table_name) -> Collection:
+def create_collection(table_name, rows: int = MILVUS_EXPECTED_ROWS) -> Collection:
     """
-    Creates a collection in Milvus
+    Creates a collection in Milvus, indexed as advised for ``rows`` vectors (see ``recommend_index``)
 
     :param table_name: name of the collection
+    :param rows: expected number of vectors
     :return: collection object
     """
     try:
@@ -80,8 +116,9 @@ def create_collection(table_name) -> Collection:
             _schema = CollectionSchema(fields=_fields, description=f"{table_name} collection")
             __collection = Collection(name=table_name, schema=_schema)
 
-            _index_params = {"index_type": "IVF_FLAT", "metric_type": 'IP', "params": {"nlist": 200}}
-            __collection.create_index(field_name="embedding", index_params=_index_params)
+            _advice = recommend_index(rows, 768, metric_type='IP')
+            __collection.create_index(field_name="embedding", index_params=_advice["index_params"])
+            register_index(table_name, _advice)
             log.info(f"Collection \"{__collection.name}\" created successfully!")
             return __collection
         else:
@@ -102,7 +139,8 @@ def create_table_in_mysql(cursor, table_name) -> None:
     :param table_name: name of the table
     :return: None
     """
-    sql = "CREATE TABLE if not exists " + table_name + " (id TEXT, question TEXT, answer TEXT);"
+    sql = "CREATE TABLE if not exists " + table_name + " (id VARCHAR(128) NOT NULL, question TEXT NOT NULL, " \
+                                                      "answer TEXT NOT NULL, PRIMARY KEY (id));"
     try:
         # checks if the table exists in the database
         check_table = "SHOW TABLES LIKE '" + table_name + "'"
@@ -129,12 +167,14 @@ def store_embeddings(collection, sentence_embeddings) -> List[Any] or None:
     :return: ids of the stored embeddings
     """
     try:
-        collection.load()
         if collection.num_entities != len(sentence_embeddings):
             log.info(f"Number of entities in collection: {collection.num_entities}")
             log.info(f"Number of embeddings: {len(sentence_embeddings)}")
             # Validate if the embedding exist before inserting
-            mr = collection.insert([sentence_embeddings])
+            with track_ingestion("milvus") as rows:
+                mr = collection.insert([sentence_embeddings])
+                rows.append(len(sentence_embeddings))
+            publish_milvus_change(f"{len(sentence_embeddings)} embeddings stored in {collection.name}")
             log.info("Embeddings stored successfully!")
             return mr.primary_keys  # ids of the stored embeddings
     except Exception as e:
@@ -153,7 +193,7 @@ def generate_embeddings(data: Dict, model=None) -> Tuple[List[Any], Dict]:
     """
     try:
         if model is None:
-            model = SentenceTransformer('all-mpnet-base-v2')
+            model = get_model()
         # Get questions and answers.
         question_data = data['question'].tolist()
         answer_data = data['answer'].tolist()
@@ -170,41 +210,44 @@ def generate_embeddings(data: Dict, model=None) -> Tuple[List[Any], Dict]:
 
 
 # Processing and Storing QA Dataset
-def generate_and_store_embeddings(collection: Collection, model=MODEL_SELECTION['sentence_transformers']):
+def generate_and_store_embeddings(collection: Collection, model=None, data: pd.DataFrame = None):
     """
     Generates embeddings for the questions and answers and stores them in Milvus
 
-    :param model: BERT model
+    :param model: BERT model, defaults to the collection's encoder
     :param collection: collection object
+    :param data: question/answer dataset, read from DATASET_PATH by default
     :return: ids, question_data, answer_data
     """
     try:
-        data = pd.read_csv(DATASET_PATH)
+        data = pd.read_csv(DATASET_PATH) if data is None else data
         collection = Collection(name=collection.name, schema=collection.schema)
-        collection.load()
         log.info(f"Is collection empty: {collection.is_empty}")
         log.info(f"Number of entities in collection: {collection.num_entities}")
 
         if collection.is_empty:
-            if not model:
-                raise ValueError("Model object is of None Type.")
-            else:
-                log.info("Model already loaded!")
+            model = model if model is not None else get_collection_model(collection.name)
             # Get questions and answers.
             question_data = data['question'].tolist()
             answer_data = data['answer'].tolist()
-            # Generate embeddings
-            log.info("Generating raw embeddings... Loading......")
-            sentence_embeddings = model.encode(answer_data)
-            log.info("Generating normalized embeddings... Loading......")
-            sentence_embeddings = normalize(sentence_embeddings).tolist()
-            log.info("Embeddings generated successfully!")
-            collection.load()
-            log.info(f"Number of entities in collection: {collection.num_entities}")
-            log.info(f"Number of embeddings: {len(sentence_embeddings)}")
-            # raise Exception("Number of entities in collection and embeddings do not match!")
-            mr = collection.insert([sentence_embeddings])
-            ids = mr.primary_keys
+            with track_ingestion("milvus") as rows:
+                # Generate embeddings of the new or changed answers, batched by token length
+                log.info("Generating raw embeddings... Loading......")
+                store = get_embedding_store(model)
+                sentence_embeddings = encode_cached(model, answer_data, store=store)
+                if store is not None:
+                    # drop the embeddings of answers no longer in the dataset
+                    store.compact(answer_data)
+                log.info("Generating normalized embeddings... Loading......")
+                sentence_embeddings = normalize(sentence_embeddings).tolist()
+                log.info("Embeddings generated successfully!")
+                log.info(f"Number of entities in collection: {collection.num_entities}")
+                log.info(f"Number of embeddings: {len(sentence_embeddings)}")
+                # raise Exception("Number of entities in collection and embeddings do not match!")
+                mr = collection.insert([sentence_embeddings])
+                ids = mr.primary_keys
+                rows.append(len(ids))
+            publish_milvus_change(f"{len(ids)} embeddings stored in {collection.name}")
             log.info("Embeddings generated and stored successfully!")
             return ids, question_data, answer_data
         else:
@@ -219,10 +262,11 @@ def generate_and_store_embeddings(collection: Collection, model=MODEL_SELECTION[
 
 
 # Inserting IDs and Questions-answer Combos into PostgreSQL
-async def load_data_to_mysql(cursor, conn, table_name, data) -> None:
+def load_data_to_mysql(cursor, conn, table_name, data) -> None:
     """
     Loads data into MySQL
-    Inserts the ids, questions and answers into the table
+    Inserts the ids, questions and answers into the table, in batches of 1000 rows, and publishes the corpus
+    change to the query services of every process (see ``utils.corpus.publish_corpus_change``)
 
     :param cursor: cursor object
     :param conn: connection object
@@ -233,9 +277,6 @@ async def load_data_to_mysql(cursor, conn, table_name, data) -> None:
     sql = "insert into " + table_name + " (id, question, answer) values (%s, %s, %s);"
     # check to see if the table exists
     check_table = f"SHOW TABLES LIKE '{table_name}';"
-    # check if the data to be inserted is already present
-    # check_sql = f"SELECT COUNT(*) FROM {table_name} WHERE id = %s;"
-    check_count = f"SELECT COUNT(id) FROM {table_name};"
     try:
         cursor.execute(f"USE {MYSQL_DATABASE};")
         if cursor.execute(check_table) == 0:
@@ -247,19 +288,16 @@ async def load_data_to_mysql(cursor, conn, table_name, data) -> None:
             conn.commit()
             log.info(f"Table {table_name} created successfully!")
         cnt = 0
-        while True:
-            try:
-                row: List = batch_retrival(data, 1000)
-                result = cursor.execute(check_count)
-                # result = cursor.fetchone()[0]
-                if result < len(data) + 1 and len(row) > 0:
-                    cursor.executemany(sql, row)
-                    await conn.commit()
-                    cnt += 1
-                    if cnt == 0:
-                        log.info("MYSQL loads data to table: {} successfully".format(table_name))
-            except StopIteration:
-                break
+        with track_ingestion("mysql") as rows:
+            for batch in batch_retrival(data, 1000):
+                if len(batch) > 0:
+                    cursor.executemany(sql, batch)
+                    conn.commit()
+                    cnt += len(batch)
+                    rows.append(len(batch))
+        if cnt > 0:
+            publish_corpus_change(cursor, f"{cnt} records loaded to {table_name}")
+            conn.commit()
         log.info("MYSQL loads data to table: {} successfully. Number of Records: {}".format(table_name, cnt))
     except Exception as e:
         log.error(f'Error while loading data to MySQL. Sql insert error: \n{sql}\n{e} ')
@@ -292,18 +330,27 @@ def format_data(ids, question_data, answer_data) -> List:
 
 # Search
 # Processing Query
-def generate_query_embeddings(question, model) -> List:
+def generate_query_embeddings(question, model, cache: EmbeddingCache = None) -> List:
     """
     Generates embeddings for the query
 
     :param question: query
     :param model: BERT model
+    :param cache: optional cache of query embeddings keyed by the normalized question
     :return: query embeddings
     """
     try:
-        embed = model.encode(question)
-        embed = embed.reshape(1, -1)
-        embed = normalize(embed)
+        if cache is not None:
+            embed = cache.get(question)
+            trace_cache("embedding", embed is not None)
+            if embed is not None:
+                return [embed.tolist()]
+        with trace_stage("encode"):
+            embed = model.encode(question)
+            embed = embed.reshape(1, -1)
+            embed = normalize(embed)
+        if cache is not None:
+            cache.put(question, embed[0])
         query_embeddings = embed.tolist()
         log.info("Query embeddings generated successfully")
         return query_embeddings
@@ -313,21 +360,58 @@ def generate_query_embeddings(question, model) -> List:
         raise e
 
 
-def search_in_milvus(collection: Collection, query_embeddings) -> SearchResult:
+def generate_batch_query_embeddings(questions: List[str], model, batch_size: int = 32,
+                                    cache: EmbeddingCache = None) -> List:
     """
-    Searches for the query in Milvus
+    Generates embeddings for many queries with a single batched forward pass
+
+    :param questions: queries
+    :param model: BERT model
+    :param batch_size: encoder batch size
+    :param cache: optional cache of query embeddings; only the misses are encoded
+    :return: one normalized query embedding per question
+    """
+    try:
+        if len(questions) == 0:
+            return []
+        embeds = [cache.get(q) if cache is not None else None for q in questions]
+        missing = [i for i, embed in enumerate(embeds) if embed is None]
+        if cache is not None:
+            trace_cache("embedding", not missing)
+        if missing:
+            with trace_stage("encode"):
+                embed = model.encode([questions[i] for i in missing], batch_size=batch_size)
+                embed = normalize(embed.reshape(len(missing), -1))
+            for i, row in zip(missing, embed):
+                embeds[i] = row
+                if cache is not None:
+                    cache.put(questions[i], row)
+        log.info(f"Query embeddings generated successfully for {len(questions)} questions "
+                 f"({len(questions) - len(missing)} cached)")
+        return [embed.tolist() for embed in embeds]
+    except Exception as e:
+        log.error(f'Error while generating batch query embeddings: \nQuestions: {len(questions)} \nModel: {model} \n{e}')
+        log.error(traceback.format_exc())
+        raise e
+
+
+def search_in_milvus(collection: Collection, query_embeddings, limit: int = 5, profile: str = None) -> SearchResult:
+    """
+    Searches for the queries in Milvus, one result set per query embedding. The collection must
+    already be loaded, see ``milvus.collection_state.CollectionState``.
 
     :param collection: collection object
     :param query_embeddings: query embeddings
+    :param limit: number of hits per query
+    :param profile: search profile ("fast", "balanced", "accurate"), defaults to QA_SEARCH_PROFILE
     :return: results list
     """
     try:
-        search_params = {"metric_type": 'IP', "params": {"nprobe": 16}}
-        log.info("Partitions: {}".format(collection.partitions))
-        # Load collection
-        collection.load()
+        search_params = get_search_params(collection, profile)
         # Search
-        results = collection.search(query_embeddings, anns_field="embedding", param=search_params, limit=5)
+        with trace_stage("search"):
+            results = collection.search(query_embeddings, anns_field="embedding", param=search_params, limit=limit)
+        trace_distances(results)
         log.info("Milvus searches data successfully")
         log.info("Search results: {}".format(len(results)))
         return results
@@ -388,7 +472,64 @@ def search_by_similar_questions(cursor, table_name, question=None) -> List:
         return []
 
 
+# Resolve answers by primary key
+def get_answers_by_ids(cursor, ids, table_name) -> Dict[str, Tuple[str, str]]:
+    """
+    Fetches the question and answer of every id in a single primary key lookup
+
+    :param cursor: cursor object
+    :param ids: ids of the vectors returned by Milvus
+    :param table_name: name of the table
+    :return: mapping of id to (question, answer)
+    """
+    if ids is None or len(ids) == 0:
+        return {}
+    ids = [str(i) for i in ids]
+    sql = "select id, question, answer from " + table_name + " where id in (" + ", ".join(["%s"] * len(ids)) + ");"
+    try:
+        with trace_stage("metadata"):
+            cursor.execute(sql, ids)
+            return {str(row[0]): (row[1], row[2]) for row in cursor.fetchall()}
+    except Exception as e:
+        log.error(f'Error while getting answers by ids: \nSql: \n{sql} \nIds: {ids} \n{e} ')
+        log.error(traceback.format_exc())
+        raise e
+
+
+def retrieve_answers_batch(cursor, results, table_name) -> List[List[Dict[str, Any]]]:
+    """
+    Turns the hits of several Milvus queries into answer rows with one lookup, keeping the search order
+
+    :param cursor: cursor object
+    :param results: search results, one list of hits per query
+    :param table_name: name of the table
+    :return: per query, a list of {"id", "question", "answer", "distance"} dicts
+    """
+    results = [[(str(hit.id), float(hit.distance)) for hit in hits] for hits in results]
+    ids = list(dict.fromkeys(hit_id for hits in results for hit_id, _ in hits))
+    rows = get_answers_by_ids(cursor, ids, table_name)
+    return [[{"id": hit_id, "question": rows[hit_id][0], "answer": rows[hit_id][1], "distance": distance}
+             for hit_id, distance in hits if hit_id in rows]
+            for hits in results]
+
+
+def retrieve_answers(cursor, hits, table_name) -> List[Dict[str, Any]]:
+    """
+    Turns the hits of one Milvus query into answer rows, keeping the search order
+
+    :param cursor: cursor object
+    :param hits: hits of a single query, e.g. ``results[0]``
+    :param table_name: name of the table
+    :return: list of {"id", "question", "answer", "distance"} dicts
+    """
+    return retrieve_answers_batch(cursor, [hits], table_name)[0]
+
+
 # Extract answer
+NO_ANSWER = "Sorry, No answer found."
+SEARCHING = "Searching…"
+
+
 def get_answer(rows) -> str:
     """
     Extracts the answer from the rows
@@ -398,7 +539,7 @@ def get_answer(rows) -> str:
     """
     try:
         if rows is None or len(rows) == 0:
-            return "Sorry, No answer found."
+            return NO_ANSWER
         return rows[0][0]
     except Exception as e:
         log.error(f'Error while getting answer: \nRows: {rows} \n{e}')
@@ -411,12 +552,13 @@ def get_response_by_question(question, table_name=MILVUS_COLLECTION) -> Any:
     try:
         # Setting up milvus and mysql connection
         conn, cursor, collection = connect_to_milvus_and_mysql()
-        # Creating Collection and Setting Index
-        collection = create_collection(table_name=table_name)
+        data = pd.read_csv(DATASET_PATH)
+        # Creating Collection and Setting Index, sized for the dataset
+        collection = create_collection(table_name=table_name, rows=len(data))
         # Creating Table in MySQL
         create_table_in_mysql(cursor=cursor, table_name=table_name)
         # Processing and Storing QA Dataset
-        ids, question_data, answer_data = generate_and_store_embeddings(collection=collection)
+        ids, question_data, answer_data = generate_and_store_embeddings(collection=collection, data=data)
         # Inserting IDs and Questions-answer Combos into PostgreSQL
         load_data_to_mysql(cursor, conn, table_name, format_data(ids=ids,
                                                                  question_data=question_data,
@@ -430,38 +572,237 @@ def get_response_by_question(question, table_name=MILVUS_COLLECTION) -> Any:
         raise e
 
 
-def process_query(cursor, question: str, collection: Collection, table_name=MILVUS_COLLECTION,
-                  model=MODEL_SELECTION['sentence_transformers']) -> str:
+def select_hits(hits, score_threshold: float = None, score_margin: float = None) -> List:
     """
-    Processes the query
+    Adaptive top-k: keeps the hits whose similarity passes the cutoff and lies within ``score_margin``
+    of the best hit. Scores are inner products of normalized vectors, higher is better.
+
+    :param hits: hits of a single query, best first
+    :param score_threshold: minimum similarity, None keeps every hit
+    :param score_margin: maximum distance from the best similarity, None disables the margin
+    :return: the selected hits, possibly empty
+    """
+    hits = list(hits)
+    if score_threshold is not None:
+        hits = [hit for hit in hits if hit.distance >= score_threshold]
+    if score_margin is not None and hits:
+        best = max(hit.distance for hit in hits)
+        hits = [hit for hit in hits if hit.distance >= best - score_margin]
+    return hits
+
+
+def fuse_hits(dense, lexical, k: float = QA_RRF_K, limit: int = 5) -> List:
+    """
+    Hybrid ranking: reciprocal rank fusion of the dense hits (after ``select_hits``) and the lexical hits.
+    Lexical matches alone never answer a query: without a dense hit above the cutoff there is no hit.
+
+    :param dense: dense hits of a single query, best first
+    :param lexical: lexical hits of the same query, best first
+    :param k: RRF constant
+    :param limit: maximum number of fused hits
+    :return: fused hits, best first; distance is the RRF score
+    """
+    if not dense:
+        return []
+    return reciprocal_rank_fusion([dense, lexical], k=k, limit=limit)
+
+
+def answers_for_embeddings(cursor, questions: List[str], query_embeddings: List, collection: Collection,
+                           table_name=MILVUS_COLLECTION, semantic_cache: SemanticCache = None,
+                           version: int = None, score_threshold: float = None,
+                           score_margin: float = None, lexical_index: BM25Index = None,
+                           limit: int = 5, search_profile: str = None) -> List[List[Dict[str, Any]]]:
+    """
+    Resolves already encoded queries to ranked answers: near-duplicates are served from the semantic
+    cache, the rest go through one Milvus search and one metadata fetch for the hits that pass
+    ``select_hits``. A query without any such hit is answered with no rows and no SQL work.
+    With a ``lexical_index`` the BM25 search runs concurrently with the Milvus search and both rankings
+    are fused with RRF, so "distance" then holds the fused score.
 
     :param cursor: cursor object
-    :param question: question
+    :param questions: questions, aligned with the embeddings
+    :param query_embeddings: normalized query embeddings
+    :param collection: collection object
     :param table_name: name of the table
-    :param model: model name
+    :param semantic_cache: optional cache answering near-duplicate questions without a search
+    :param version: corpus version the search runs against, defaults to the current one
+    :param score_threshold: minimum similarity of a hit, None keeps every hit
+    :param score_margin: maximum distance of a hit from the best similarity, None disables the margin
+    :param lexical_index: optional BM25 index over the questions for hybrid retrieval
+    :param limit: number of dense hits per query, and of fused hits in hybrid mode
+    :param search_profile: search profile of the Milvus search, defaults to QA_SEARCH_PROFILE
+    :return: per question, a list of {"id", "question", "answer", "distance"} dicts
+    """
+    version = get_corpus_version() if version is None else version
+    answers = [semantic_cache.lookup(embed) if semantic_cache is not None else None for embed in query_embeddings]
+    missing = [i for i, cached in enumerate(answers) if cached is None]
+    if semantic_cache is not None:
+        trace_cache("semantic", not missing)
+    if len(missing) < len(questions):
+        log.info("Semantic cache hits: {}".format(len(questions) - len(missing)))
+    if missing:
+        lexical = lexical_index.search_async([questions[i] for i in missing]) if lexical_index is not None else None
+        # Search
+        results = search_in_milvus(collection=collection, query_embeddings=[query_embeddings[i] for i in missing],
+                                   limit=limit, profile=search_profile)
+        results = [select_hits(hits, score_threshold, score_margin) for hits in results]
+        log.info("Hits above the score cutoff: {}".format([len(hits) for hits in results]))
+        if lexical is not None:
+            results = [fuse_hits(dense, hits, limit=limit) for dense, hits in zip(results, lexical.result())]
+            log.info("Hybrid hits: {}".format([len(hits) for hits in results]))
+        # Resolve the hits to answers in one lookup
+        for i, ranked in zip(missing, retrieve_answers_batch(cursor, results, table_name)):
+            answers[i] = ranked
+            if semantic_cache is not None and ranked:
+                semantic_cache.put(query_embeddings[i], ranked, version=version)
+    return answers
+
+
+def search_answers(cursor, question: str, collection: Collection, table_name=MILVUS_COLLECTION,
+                   model=None,
+                   embedding_cache: EmbeddingCache = None,
+                   semantic_cache: SemanticCache = None,
+                   score_threshold: float = None,
+                   score_margin: float = None,
+                   lexical_index: BM25Index = None,
+                   search_profile: str = None) -> List[Dict[str, Any]]:
+    """
+    Searches for the answers closest to the question, ranked by distance
+
+    :param cursor: cursor object
+    :param question: question
     :param collection: collection object
+    :param table_name: name of the table
+    :param model: sentence transformer, defaults to the collection's encoder
+    :param embedding_cache: optional cache of query embeddings
+    :param semantic_cache: optional cache answering near-duplicate questions without a search
+    :param score_threshold: minimum similarity of a hit, None keeps every hit
+    :param score_margin: maximum distance of a hit from the best similarity, None disables the margin
+    :param lexical_index: optional BM25 index over the questions for hybrid retrieval
+    :param search_profile: search profile of the Milvus search, defaults to QA_SEARCH_PROFILE
+    :return: list of {"id", "question", "answer", "distance"} dicts
     """
     log.info("Processing query: {}".format(question))
+    version = get_corpus_version()
     # Processing Query
-    query_embeddings = generate_query_embeddings(question, model)
+    model = model if model is not None else get_collection_model(collection.name)
+    query_embeddings = generate_query_embeddings(question, model, cache=embedding_cache)
     log.info("Query embeddings generated successfully")
-    # Search
-    results = search_in_milvus(collection=collection, query_embeddings=query_embeddings)
-    log.info("Search results: {}".format(len(results)))
-    # Getting the Similar Questions
-    ids = [str(x.id) for x in results[0]]
-    similar_questions = get_similar_questions(cursor, ids, table_name)
-    log.info("Similar questions: {}".format(similar_questions))
-    # Get the answer
-    rows = search_by_similar_questions(cursor, table_name, similar_questions, )
+    answers = answers_for_embeddings(cursor, [question], query_embeddings, collection, table_name=table_name,
+                                     semantic_cache=semantic_cache, version=version,
+                                     score_threshold=score_threshold, score_margin=score_margin,
+                                     lexical_index=lexical_index, search_profile=search_profile)[0]
+    log.info("Similar questions: {}".format([(a["question"], a["distance"]) for a in answers]))
+    return answers
+
+
+def search_answers_batch(cursor, questions: List[str], collection: Collection, table_name=MILVUS_COLLECTION,
+                         model=None,
+                         embedding_cache: EmbeddingCache = None,
+                         semantic_cache: SemanticCache = None,
+                         score_threshold: float = None,
+                         score_margin: float = None,
+                         lexical_index: BM25Index = None,
+                         search_profile: str = None) -> List[List[Dict[str, Any]]]:
+    """
+    Searches for the answers of many questions with one encode, one search and one metadata fetch
+
+    :param cursor: cursor object
+    :param questions: questions
+    :param collection: collection object
+    :param table_name: name of the table
+    :param model: sentence transformer, defaults to the collection's encoder
+    :param embedding_cache: optional cache of query embeddings
+    :param semantic_cache: optional cache answering near-duplicate questions without a search
+    :param score_threshold: minimum similarity of a hit, None keeps every hit
+    :param score_margin: maximum distance of a hit from the best similarity, None disables the margin
+    :param lexical_index: optional BM25 index over the questions for hybrid retrieval
+    :param search_profile: search profile of the Milvus search, defaults to QA_SEARCH_PROFILE
+    :return: per question, a list of {"id", "question", "answer", "distance"} dicts
+    """
+    if len(questions) == 0:
+        return []
+    log.info("Processing {} queries".format(len(questions)))
+    version = get_corpus_version()
+    model = model if model is not None else get_collection_model(collection.name)
+    query_embeddings = generate_batch_query_embeddings(questions, model, cache=embedding_cache)
+    return answers_for_embeddings(cursor, questions, query_embeddings, collection, table_name=table_name,
+                                  semantic_cache=semantic_cache, version=version,
+                                  score_threshold=score_threshold, score_margin=score_margin,
+                                  lexical_index=lexical_index, search_profile=search_profile)
+
+
+def best_answer(answers: List[Dict[str, Any]]) -> str:
+    """
+    Extracts the answer of the best ranked hit
+
+    :param answers: ranked answers as returned by ``search_answers``
+    :return: answer string
+    """
+    with trace_stage("answer"):
+        return get_answer([(a["answer"],) for a in answers])
+
+
+def format_similar_questions(answers: List[Dict[str, Any]]) -> str:
+    """
+    Formats the ranked similar questions with their similarity scores as a markdown list
+
+    :param answers: ranked answers as returned by ``search_answers``
+    :return: markdown string
+    """
+    lines = [f"{rank}. {a['question']} (score {a['distance']:.3f})" for rank, a in enumerate(answers, start=1)]
+    return "Similar questions:\n" + "\n".join(lines)
+
+
+def process_query(cursor, question: str, collection: Collection, table_name=MILVUS_COLLECTION,
+                  model=None, **kwargs) -> str:
+    """
+    Processes the query
+
+    :param cursor: cursor object
+    :param question: question
+    :param table_name: name of the table
+    :param model: sentence transformer, defaults to the collection's encoder
+    :param collection: collection object
+    :param kwargs: further options of ``search_answers``
+    """
+    answers = search_answers(cursor, question, collection, table_name=table_name, model=model, **kwargs)
     # Extract answer
-    answer = get_answer(rows)
-    return answer
+    return best_answer(answers)
+
+
+def process_queries(cursor, questions: List[str], collection: Collection, table_name=MILVUS_COLLECTION,
+                    model=None, **kwargs) -> List[str]:
+    """
+    Processes many queries in one batch
+
+    :param cursor: cursor object
+    :param questions: questions
+    :param collection: collection object
+    :param table_name: name of the table
+    :param model: sentence transformer, defaults to the collection's encoder
+    :param kwargs: further options of ``search_answers_batch``
+    :return: one answer per question
+    """
+    answers = search_answers_batch(cursor, questions, collection, table_name=table_name, model=model, **kwargs)
+    return [best_answer(ranked) for ranked in answers]
 
 
 def chatbot_handler(question) -> str:
-    conn, cursor, collection = connect_to_milvus_and_mysql()
-    return process_query(cursor, question, collection)
+    """
+    Answers a question through the long-lived query service
+
+    :param question: question
+    :return: answer string
+    """
+    # imported here since the query service modules build on this one
+    from milvus.query_service import get_query_service
+    if QA_MICRO_BATCHING:
+        from milvus.batching import get_query_batcher
+        with trace_request(question):
+            answers = get_query_service().cached_answers(question)
+            return best_answer(answers if answers is not None else get_query_batcher()(question))
+    return get_query_service().process_query(question)
 
 
 def diff_texts(text1: str, text2: str):
@@ -496,7 +837,6 @@ def response_handler(message, state: List = None):
     bot_message = chatbot_handler(message)
     # bot_message = diff_texts(message, bot_message)
     state.append((message, bot_message))
-    time.sleep(1)
     return "", state
 
 # def transcribe(__input__, state=None):
@@ -81,13 +81,14 @@ except Exception as e:
 # In this example we are using the sentence_transformer library to encode the sentence into
 # vectors. This library uses a modified BERT model to generate the embeddings, and in this
 # example we are using a model pretrained using Microsoft's mpnet. More info can be found here.
+# The model is loaded from its local directory (see `python -m utils.models download`).
 
-from sentence_transformers import SentenceTransformer
+from utils.models import get_model
 import pandas as pd
 from sklearn.preprocessing import normalize
 
 DATASET_DATA = f'{os.getcwd()}/Resources/datasets/questions_answers.csv'
-model = SentenceTransformer('all-mpnet-base-v2')
+model = get_model('sentence_transformers')
 
 # Get questions and answers.
 data = pd.read_csv(DATASET_DATA)
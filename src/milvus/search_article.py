@@ -18,6 +18,7 @@ import os
 import timeit
 import pandas as pd
 import numpy as np
+from milvus.collection_state import mark_collection_released
 from utils.request_types import request_get
 from myLogger.Logger import getLogger as GetLogger
 
@@ -28,6 +29,7 @@ log = GetLogger(__file__)
 def create_milvus_collection(collection_name, dim):
     if utility.has_collection(collection_name):
         utility.drop_collection(collection_name)
+        mark_collection_released(collection_name)
 
     fields = [
         FieldSchema(name="id", dtype=DataType.INT64, is_primary=True, auto_id=False),
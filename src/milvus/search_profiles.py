@@ -0,0 +1,448 @@
+import argparse
+import json
+import os
+import threading
+import time
+import traceback
+from typing import Any, Dict, List, Sequence, Tuple
+
+import numpy as np
+
+from database.index_advisor import search_profiles as index_search_profiles
+from myLogger.Logger import getLogger as GetLogger
+from config import MILVUS_SEARCH_PARAM, MILVUS_SEARCH_PROFILES_PATH, QA_SEARCH_PROFILE
+
+log = GetLogger(__name__)
+
+########################################################################################################################
+# Search profiles
+#
+# A profile names the index search parameters (nprobe for IVF indexes, ef for HNSW) the query path uses.
+# Untuned collections get the starting params of their index type (``default_profiles``); ``autotune``
+# replaces them with the cheapest setting that reaches each profile's recall@k target against exact
+# brute-force ground truth, per collection. The profiles file is reloaded whenever it changes on disk.
+########################################################################################################################
+PROFILE_TARGETS = {"fast": 0.90, "balanced": 0.95, "accurate": 0.99}
+# profiles of collections whose index is unknown; "balanced" is MILVUS_SEARCH_PARAM
+DEFAULT_PROFILES = {
+    "fast": {"nprobe": max(1, MILVUS_SEARCH_PARAM.get("nprobe", 16) // 2)},
+    "balanced": dict(MILVUS_SEARCH_PARAM),
+    "accurate": {"nprobe": MILVUS_SEARCH_PARAM.get("nprobe", 16) * 4},
+}
+
+
+def default_profiles(index_type: str, build_params: Dict[str, Any]) -> Dict[str, Dict[str, Any]]:
+    """
+    Starting profiles of an untuned index: ef for HNSW, nprobe for IVF indexes, no params for FLAT
+
+    :param index_type: index type
+    :param build_params: index build params (nlist for IVF indexes)
+    :return: {profile: search params}
+    """
+    index_type = index_type.upper()
+    if index_type.startswith("IVF"):
+        return index_search_profiles(index_type, {"nlist": int(build_params.get("nlist", 1024))})
+    if index_type in ("HNSW", "FLAT"):
+        return index_search_profiles(index_type, build_params)
+    return DEFAULT_PROFILES
+
+
+class SearchProfiles:
+    """
+    Named search parameters per collection, persisted as JSON:
+    ``{collection: {"index_type": ..., "profiles": {name: params}, "sweep": [...]}}``
+    """
+
+    def __init__(self, path: str = MILVUS_SEARCH_PROFILES_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._stamp: Tuple[int, int] = None
+        self._collections: Dict[str, Dict[str, Any]] = self._load()
+        # starting profiles of untuned collections, by collection name
+        self._defaults: Dict[str, Dict[str, Dict[str, Any]]] = {}
+
+    def _stat(self) -> Tuple[int, int]:
+        try:
+            stat = os.stat(self.path)
+            return stat.st_mtime_ns, stat.st_size
+        except (OSError, TypeError, ValueError):
+            return None
+
+    def _load(self) -> Dict[str, Dict[str, Any]]:
+        self._stamp = self._stat()
+        if not self.path or not os.path.exists(self.path):
+            return {}
+        try:
+            with open(self.path) as f:
+                return json.load(f)
+        except Exception as e:
+            log.error(f'Error while reading search profiles from {self.path}: {e}')
+            return {}
+
+    def save(self) -> None:
+        with self._lock:
+            data = json.dumps(self._collections, indent=2)
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp = f"{self.path}.tmp"
+        with open(tmp, "w") as f:
+            f.write(data + "\n")
+        os.replace(tmp, self.path)
+        self._stamp = self._stat()
+        log.info(f"Search profiles saved to {self.path}")
+
+    def refresh(self) -> bool:
+        """
+        Reloads the profiles when the file changed since it was read or saved, e.g. by ``autotune`` in another
+        process; changes that were not saved are dropped then
+
+        :return: True when the file was reloaded
+        """
+        if self._stat() == self._stamp:
+            return False
+        collections = self._load()
+        with self._lock:
+            self._collections = collections
+        log.info(f"Search profiles reloaded from {self.path}")
+        return True
+
+    def defaults(self, collection) -> Dict[str, Dict[str, Any]]:
+        """
+        Starting profiles of a collection's index, looked up once per collection
+
+        :param collection: collection object
+        :return: {profile: search params}
+        """
+        with self._lock:
+            profiles = self._defaults.get(collection.name)
+        if profiles is None:
+            try:
+                profiles = default_profiles(*index_info(collection))
+            except Exception as e:
+                log.warning(f'Could not read the index of {collection.name}, using the default profiles: {e}')
+                return DEFAULT_PROFILES
+            with self._lock:
+                self._defaults[collection.name] = profiles
+        return profiles
+
+    def get(self, collection_name: str, profile: str = None,
+            defaults: Dict[str, Dict[str, Any]] = None) -> Dict[str, Any]:
+        """
+        Index search parameters of a profile
+
+        :param collection_name: collection name
+        :param profile: profile name, defaults to QA_SEARCH_PROFILE
+        :param defaults: profiles of an untuned collection, defaults to ``DEFAULT_PROFILES``
+        :return: search params, e.g. {"nprobe": 16}
+        """
+        profile = profile or QA_SEARCH_PROFILE
+        defaults = DEFAULT_PROFILES if defaults is None else defaults
+        with self._lock:
+            tuned = self._collections.get(collection_name, {}).get("profiles", {})
+            params = tuned.get(profile, defaults.get(profile))
+        if params is None:
+            raise ValueError(f'Unknown search profile "{profile}", expected one of {self.names(collection_name)}')
+        return dict(params)
+
+    def names(self, collection_name: str = None) -> List[str]:
+        with self._lock:
+            tuned = self._collections.get(collection_name, {}).get("profiles", {})
+        return list(dict.fromkeys(list(DEFAULT_PROFILES) + list(tuned)))
+
+    def set(self, collection_name: str, profiles: Dict[str, Dict[str, Any]], **details) -> None:
+        with self._lock:
+            entry = self._collections.setdefault(collection_name, {})
+            entry.setdefault("profiles", {}).update(profiles)
+            entry.update(details)
+
+    def reset(self, collection_name: str, profiles: Dict[str, Dict[str, Any]], **details) -> None:
+        """
+        Replaces the profiles of a collection, e.g. once its index was rebuilt and earlier tuning no longer applies
+        """
+        with self._lock:
+            self._collections[collection_name] = {"profiles": dict(profiles), **details}
+            self._defaults.pop(collection_name, None)
+
+
+_profiles: SearchProfiles = None
+_profiles_lock = threading.Lock()
+
+
+def get_search_profiles() -> SearchProfiles:
+    """
+    Returns the process-wide search profiles, loading them on first use and reloading them when the file changed
+
+    :return: search profiles
+    """
+    global _profiles
+    if _profiles is None:
+        with _profiles_lock:
+            if _profiles is None:
+                _profiles = SearchProfiles()
+    _profiles.refresh()
+    return _profiles
+
+
+def register_index(collection_name: str, advice: Dict[str, Any], save: bool = True) -> None:
+    """
+    Resets the profiles of a collection to the starting search params of its newly built index
+    (see ``database.index_advisor.recommend_index``)
+
+    :param collection_name: collection name
+    :param advice: index advice
+    :param save: persist the profiles to MILVUS_SEARCH_PROFILES_PATH
+    """
+    profiles = get_search_profiles()
+    profiles.reset(collection_name, advice["search_profiles"], index_type=advice["index_type"])
+    if save:
+        try:
+            profiles.save()
+        except Exception as e:
+            log.error(f'Error while saving search profiles: {e}')
+
+
+def get_search_params(collection, profile: str = None, metric_type: str = "IP") -> Dict[str, Any]:
+    """
+    Search parameters for ``collection.search``
+
+    :param collection: collection object
+    :param profile: profile name, defaults to QA_SEARCH_PROFILE
+    :param metric_type: metric of the index
+    :return: {"metric_type": ..., "params": {...}}
+    """
+    profiles = get_search_profiles()
+    return {"metric_type": metric_type, "params": profiles.get(collection.name, profile, profiles.defaults(collection))}
+
+
+def index_info(collection, field_name: str = "embedding") -> Tuple[str, Dict[str, Any]]:
+    """
+    Index type and build parameters of a vector field
+
+    :param collection: collection object
+    :param field_name: vector field
+    :return: (index type, build params), ("FLAT", {}) without an index
+    """
+    for index in getattr(collection, "indexes", []) or []:
+        if getattr(index, "field_name", field_name) == field_name:
+            params = dict(index.params)
+            extra = params.get("params", {})
+            if isinstance(extra, str):
+                extra = json.loads(extra)
+            return params.get("index_type", "FLAT"), extra
+    return "FLAT", {}
+
+
+def sweep_values(index_type: str, build_params: Dict[str, Any], k: int) -> Tuple[str, List[int]]:
+    """
+    The search parameter to tune and its candidate values, cheapest first
+
+    :param index_type: index type
+    :param build_params: index build params (nlist for IVF indexes)
+    :param k: number of hits per query
+    :return: (parameter name, candidate values); no candidates for exhaustive indexes
+    """
+    if index_type.upper() == "HNSW":
+        values = sorted({max(k, v) for v in (8, 16, 32, 64, 128, 256, 512)})
+        return "ef", values
+    if index_type.upper().startswith("IVF"):
+        nlist = int(build_params.get("nlist", 1024))
+        values = [2 ** i for i in range(0, 17) if 2 ** i < nlist] + [nlist]
+        return "nprobe", values
+    return None, []
+
+
+def exact_top_k(corpus_ids: Sequence[Any], corpus_vectors: np.ndarray, query_vectors: np.ndarray,
+                k: int) -> List[List[Any]]:
+    """
+    Brute-force inner-product ground truth
+
+    :param corpus_ids: ids of the corpus vectors
+    :param corpus_vectors: corpus vectors, one per row
+    :param query_vectors: query vectors, one per row
+    :param k: neighbours per query
+    :return: ids of the exact top-k of every query, best first
+    """
+    corpus_ids = np.asarray(corpus_ids)
+    corpus_vectors = np.asarray(corpus_vectors, dtype=np.float32)
+    truth = []
+    for start in range(0, len(query_vectors), 256):
+        scores = np.asarray(query_vectors[start:start + 256], dtype=np.float32) @ corpus_vectors.T
+        top = np.argpartition(-scores, min(k, scores.shape[1]) - 1, axis=1)[:, :k]
+        for row, candidates in zip(scores, top):
+            truth.append(corpus_ids[candidates[np.argsort(-row[candidates])]].tolist())
+    return truth
+
+
+def recall_at_k(found: Sequence[Sequence[Any]], truth: Sequence[Sequence[Any]], k: int) -> float:
+    """
+    Mean fraction of the exact top-k returned by the search
+
+    :param found: ids returned per query
+    :param truth: exact top-k ids per query
+    :param k: neighbours per query
+    :return: recall@k in [0, 1]
+    """
+    if not truth:
+        return 0.0
+    total = 0.0
+    for hits, exact in zip(found, truth):
+        exact = set(exact[:k])
+        total += len(exact.intersection(list(hits)[:k])) / (len(exact) or 1)
+    return total / len(truth)
+
+
+def fetch_vectors(collection, field_name: str = "embedding", id_field: str = "id",
+                  batch_size: int = 1000) -> Tuple[List[Any], np.ndarray]:
+    """
+    Reads every vector of a collection for the ground truth
+
+    :param collection: collection object
+    :param field_name: vector field
+    :param id_field: primary key field
+    :param batch_size: rows per round trip
+    :return: (ids, vectors)
+    """
+    ids, vectors = [], []
+    if hasattr(collection, "query_iterator"):
+        iterator = collection.query_iterator(batch_size=batch_size, expr=f"{id_field} >= 0",
+                                             output_fields=[id_field, field_name])
+        try:
+            while True:
+                rows = iterator.next()
+                if not rows:
+                    break
+                ids.extend(row[id_field] for row in rows)
+                vectors.extend(row[field_name] for row in rows)
+        finally:
+            iterator.close()
+    else:
+        # older servers cap offset + limit at 16384
+        offset = 0
+        while True:
+            rows = collection.query(expr=f"{id_field} >= 0", output_fields=[id_field, field_name],
+                                    offset=offset, limit=batch_size)
+            if not rows:
+                break
+            ids.extend(row[id_field] for row in rows)
+            vectors.extend(row[field_name] for row in rows)
+            offset += len(rows)
+    return ids, np.asarray(vectors, dtype=np.float32)
+
+
+def autotune(collection, query_vectors, k: int = 5,
+             targets: Dict[str, float] = None,
+             ground_truth: Sequence[Sequence[Any]] = None,
+             corpus: Tuple[Sequence[Any], np.ndarray] = None,
+             values: Sequence[int] = None,
+             param: str = None,
+             metric_type: str = "IP",
+             repeats: int = 3) -> Dict[str, Any]:
+    """
+    Sweeps the index search parameter and picks, per profile, the cheapest value whose recall@k reaches
+    the profile's target. A target no value reaches gets the most accurate value of the sweep.
+
+    :param collection: loaded collection
+    :param query_vectors: sample of real or held-out query embeddings
+    :param k: hits per query
+    :param targets: recall target per profile name, defaults to ``PROFILE_TARGETS``
+    :param ground_truth: exact top-k ids per query; computed from ``corpus`` or the collection otherwise
+    :param corpus: (ids, vectors) of the collection, fetched from Milvus if omitted
+    :param values: candidate values, derived from the index otherwise
+    :param param: parameter name ("nprobe" or "ef"), derived from the index otherwise
+    :param metric_type: metric of the index
+    :param repeats: timed repetitions per value, the fastest counts
+    :return: {"index_type", "param", "k", "sweep": [{"value", "recall", "latency_ms"}], "profiles"}
+    """
+    targets = targets or PROFILE_TARGETS
+    query_vectors = np.asarray(query_vectors, dtype=np.float32)
+    index_type, build_params = index_info(collection)
+    if param is None or values is None:
+        derived_param, derived_values = sweep_values(index_type, build_params, k)
+        param = param or derived_param
+        values = values if values is not None else derived_values
+    if not param or not values:
+        log.info(f"{index_type} index of {collection.name} is exhaustive, nothing to tune")
+        return {"index_type": index_type, "param": None, "k": k, "sweep": [], "profiles": {}}
+    if ground_truth is None:
+        corpus_ids, corpus_vectors = corpus if corpus is not None else fetch_vectors(collection)
+        ground_truth = exact_top_k(corpus_ids, corpus_vectors, query_vectors, k)
+    truth = [[str(i) for i in ids] for ids in ground_truth]
+    sweep = []
+    for value in values:
+        search_params = {"metric_type": metric_type, "params": {param: value}}
+        elapsed = []
+        for _ in range(max(1, repeats)):
+            started = time.perf_counter()
+            results = collection.search(query_vectors.tolist(), anns_field="embedding", param=search_params,
+                                        limit=k)
+            elapsed.append(time.perf_counter() - started)
+        found = [[str(hit.id) for hit in hits] for hits in results]
+        sweep.append({"value": value,
+                      "recall": round(recall_at_k(found, truth, k), 4),
+                      "latency_ms": round(min(elapsed) * 1000.0 / len(query_vectors), 4)})
+        log.info(f"{param}={value}: recall@{k}={sweep[-1]['recall']}, {sweep[-1]['latency_ms']} ms/query")
+        if sweep[-1]["recall"] >= 1.0:
+            break
+    profiles = {}
+    for name, target in targets.items():
+        reached = [point for point in sweep if point["recall"] >= target]
+        if not reached:
+            log.warning(f'No {param} reaches recall@{k} {target} for profile "{name}", using the most accurate')
+            reached = [max(sweep, key=lambda point: point["recall"])]
+        # the sweep runs cheapest first
+        profiles[name] = {param: reached[0]["value"]}
+    return {"index_type": index_type, "param": param, "k": k, "sweep": sweep, "profiles": profiles}
+
+
+def tune_collection(collection, query_vectors, k: int = 5, save: bool = True, **kwargs) -> Dict[str, Any]:
+    """
+    Autotunes a collection and stores the resulting profiles
+
+    :param collection: loaded collection
+    :param query_vectors: sample of query embeddings
+    :param k: hits per query
+    :param save: persist the profiles to MILVUS_SEARCH_PROFILES_PATH
+    :return: the autotune report
+    """
+    report = autotune(collection, query_vectors, k=k, **kwargs)
+    if report["profiles"]:
+        profiles = get_search_profiles()
+        profiles.set(collection.name, report["profiles"], index_type=report["index_type"], k=k,
+                     sweep=report["sweep"])
+        if save:
+            profiles.save()
+    return report
+
+
+if __name__ == '__main__':
+    import pandas as pd
+    from pymilvus import Collection, connections
+    from sklearn.preprocessing import normalize
+    from milvus.collection_state import get_collection_state
+    from milvus.ingestion import encode_bucketed
+    from utils.models import get_collection_model
+    from config import MILVUS_HOST, MILVUS_PORT, MILVUS_USER, MILVUS_PASSWORD, MILVUS_COLLECTION, \
+        MILVUS_CONNECTION_ALIAS, DATASET_PATH
+
+    parser = argparse.ArgumentParser(description="Tune nprobe/ef against recall@k targets")
+    parser.add_argument("--collection", default=MILVUS_COLLECTION)
+    parser.add_argument("--dataset", default=DATASET_PATH, help="CSV whose questions are the query sample")
+    parser.add_argument("--sample", type=int, default=500)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    try:
+        connections.connect(alias=MILVUS_CONNECTION_ALIAS, user=MILVUS_USER, password=MILVUS_PASSWORD,
+                            host=MILVUS_HOST, port=int(MILVUS_PORT))
+        __collection = Collection(name=args.collection, using=MILVUS_CONNECTION_ALIAS)
+        get_collection_state(__collection).ensure_loaded()
+        questions = pd.read_csv(args.dataset)["question"].astype(str)
+        questions = questions.sample(n=min(args.sample, len(questions)), random_state=args.seed).tolist()
+        # the collection's own encoder (MODEL_COLLECTIONS), queries must match the ingested vectors
+        embeddings = normalize(encode_bucketed(get_collection_model(args.collection), questions))
+        print(json.dumps(tune_collection(__collection, embeddings, k=args.k), indent=2))
+    except Exception as e:
+        log.error(f'Error while tuning search profiles: {e}')
+        log.error(traceback.format_exc())
+        raise e
@@ -0,0 +1,159 @@
+import json
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, List, Optional
+
+from myLogger.Logger import getLogger as GetLogger
+from utils.metrics import CACHE_LOOKUPS, IN_FLIGHT, QUESTIONS, REQUEST_LATENCY, REQUESTS, STAGE_LATENCY
+from config import QA_SLOW_QUERY_MS
+
+log = GetLogger(__name__)
+slow_query_log = GetLogger("milvus.slow_query")
+
+_current: ContextVar[Optional["RequestTrace"]] = ContextVar("qa_request_trace", default=None)
+
+
+class RequestTrace:
+    """
+    Latency breakdown of one request through the QA pipeline.
+
+    Stages (encode, search, metadata, answer, ...) accumulate wall time in milliseconds; cache lookups are
+    recorded as hit/miss flags and the top-k similarities of the Milvus search are kept for the explain
+    payload and the slow-query log.
+    """
+
+    def __init__(self, question: Any):
+        self.question = question
+        self.stages: Dict[str, float] = {}
+        self.cache: Dict[str, bool] = {}
+        self.distances: List[List[float]] = []
+        self.total_ms: float = None
+        self._started = time.perf_counter()
+        self._lock = threading.Lock()
+
+    def add_stage(self, name: str, elapsed_ms: float) -> None:
+        with self._lock:
+            self.stages[name] = self.stages.get(name, 0.0) + elapsed_ms
+
+    @contextmanager
+    def stage(self, name: str):
+        started = time.perf_counter()
+        try:
+            yield self
+        finally:
+            self.add_stage(name, (time.perf_counter() - started) * 1000.0)
+
+    def absorb(self, batch: "RequestTrace", index: int = None) -> None:
+        """
+        Adds the stage timings and cache lookups of a micro-batch the request was part of
+
+        :param batch: trace of the batch
+        :param index: position of the request in the batch, to take the similarities of its own query
+        """
+        with batch._lock:
+            stages, cache, distances = dict(batch.stages), dict(batch.cache), list(batch.distances)
+        for name, elapsed_ms in stages.items():
+            self.add_stage(name, elapsed_ms)
+        with self._lock:
+            self.cache.update(cache)
+            if index is not None and index < len(distances):
+                self.distances.append(distances[index])
+
+    def finish(self) -> float:
+        if self.total_ms is None:
+            self.total_ms = (time.perf_counter() - self._started) * 1000.0
+        return self.total_ms
+
+    def to_dict(self) -> Dict[str, Any]:
+        total_ms = self.total_ms if self.total_ms is not None else (time.perf_counter() - self._started) * 1000.0
+        return {
+            "question": self.question,
+            "total_ms": round(total_ms, 3),
+            "stages_ms": {name: round(ms, 3) for name, ms in self.stages.items()},
+            "cache": dict(self.cache),
+            "distances": self.distances,
+        }
+
+
+def current_trace() -> Optional[RequestTrace]:
+    return _current.get()
+
+
+@contextmanager
+def trace_request(question: Any, slow_ms: float = QA_SLOW_QUERY_MS, record_metrics: bool = True):
+    """
+    Traces a request; nested calls join the trace that is already active. Requests slower than ``slow_ms``
+    are written to the ``milvus.slow_query`` log with their stage breakdown and top-k similarities.
+
+    :param question: question, or the list of questions of a batch
+    :param slow_ms: slow-query threshold in milliseconds, a negative value disables the log
+    :param record_metrics: count the request in the request metrics; off for internal work such as
+        micro-batches, whose questions were already counted by their callers
+    :return: the active trace
+    """
+    trace = _current.get()
+    if trace is not None:
+        yield trace
+        return
+    trace = RequestTrace(question)
+    token = _current.set(trace)
+    if record_metrics:
+        IN_FLIGHT.inc()
+    outcome = "error"
+    try:
+        yield trace
+        outcome = "ok"
+    finally:
+        _current.reset(token)
+        total_ms = trace.finish()
+        if record_metrics:
+            IN_FLIGHT.dec()
+            REQUESTS.inc(outcome=outcome)
+            QUESTIONS.inc(len(question) if isinstance(question, (list, tuple)) else 1)
+            REQUEST_LATENCY.observe(total_ms / 1000.0)
+        if 0 <= slow_ms < total_ms:
+            slow_query_log.warning("Slow query: {}".format(json.dumps(trace.to_dict(), default=str)))
+
+
+@contextmanager
+def trace_stage(name: str):
+    """
+    Times a pipeline stage into the stage latency histogram and the active trace, if any
+
+    :param name: stage name
+    """
+    trace = _current.get()
+    started = time.perf_counter()
+    try:
+        yield trace
+    finally:
+        elapsed = time.perf_counter() - started
+        STAGE_LATENCY.observe(elapsed, stage=name)
+        if trace is not None:
+            trace.add_stage(name, elapsed * 1000.0)
+
+
+def trace_cache(name: str, hit: bool) -> None:
+    """
+    Records a cache lookup in the cache metrics and the active trace, if any
+
+    :param name: cache name
+    :param hit: whether the lookup hit
+    """
+    CACHE_LOOKUPS.inc(cache=name, result="hit" if hit else "miss")
+    trace = _current.get()
+    if trace is not None:
+        trace.cache[name] = hit
+
+
+def trace_distances(results) -> None:
+    """
+    Records the top-k similarities of a Milvus search on the active trace
+
+    :param results: search results, one list of hits per query
+    """
+    trace = _current.get()
+    if trace is not None:
+        trace.distances.extend([[round(float(hit.distance), 4) for hit in hits] for hits in results])
@@ -0,0 +1,106 @@
+import threading
+import time
+import traceback
+from typing import Any, Dict, Sequence
+
+from sklearn.preprocessing import normalize
+
+from milvus.query_service import QueryService, get_query_service
+from milvus.question_answering import get_answers_by_ids, search_in_milvus
+from myLogger.Logger import getLogger as GetLogger
+from config import QA_WARMUP_SEQUENCE_LENGTHS, QA_WARMUP_BATCH_SIZES
+
+log = GetLogger(__name__)
+
+_ready = threading.Event()
+_report: Dict[str, Any] = {}
+
+
+def warm_encoder(model: Any, lengths: Sequence[int] = QA_WARMUP_SEQUENCE_LENGTHS,
+                 batch_sizes: Sequence[int] = QA_WARMUP_BATCH_SIZES) -> Any:
+    """
+    Runs synthetic encodes at several sequence lengths and batch sizes so torch initializes its kernels
+    and allocator pools before the first real question. Goes to the model directly, leaving the
+    embedding cache untouched.
+
+    :param model: sentence transformer
+    :param lengths: sequence lengths in words, capped at the model's max_seq_length
+    :param batch_sizes: batch sizes to encode at every length
+    :return: normalized embedding of the last synthetic text, for a dummy search
+    """
+    max_length = getattr(model, "max_seq_length", None)
+    embedding = None
+    for length in lengths:
+        length = min(int(length), max_length) if max_length else int(length)
+        text = " ".join(["warm"] * max(length, 1))
+        for batch_size in batch_sizes:
+            embedding = model.encode([text] * int(batch_size), batch_size=int(batch_size))
+    if embedding is None:
+        embedding = model.encode(["warm"])
+    return normalize(embedding[:1].reshape(1, -1))
+
+
+def warm_up(service: QueryService = None,
+            lengths: Sequence[int] = QA_WARMUP_SEQUENCE_LENGTHS,
+            batch_sizes: Sequence[int] = QA_WARMUP_BATCH_SIZES) -> Dict[str, Any]:
+    """
+    Brings the serving path to steady state: encoder kernels, the collection loaded into the query nodes,
+    the index paged in by a dummy search, the MySQL pool connected, the metadata table touched and, in
+    hybrid mode, the BM25 index built.
+    Readiness (``is_ready``) is reported only after every step succeeded.
+
+    :param service: query service, defaults to the process-wide one
+    :param lengths: sequence lengths of the synthetic encodes
+    :param batch_sizes: batch sizes of the synthetic encodes
+    :return: seconds spent per step
+    """
+    service = service if service is not None else get_query_service()
+    timings: Dict[str, float] = {}
+
+    def step(name, fn, *args, **kwargs):
+        started = time.perf_counter()
+        result = fn(*args, **kwargs)
+        timings[name] = round(time.perf_counter() - started, 4)
+        log.info(f"Warm-up {name} done in {timings[name]}s")
+        return result
+
+    try:
+        log.info("Warming up the serving path...")
+        started = time.perf_counter()
+        embedding = step("encoder", warm_encoder, service.model, lengths=lengths, batch_sizes=batch_sizes)
+        step("collection", service.state.ensure_loaded, wait=True)
+        results = step("search", search_in_milvus, service.collection, embedding.tolist())
+        step("mysql", service.pool.warm)
+        ids = [hit.id for hits in results for hit in hits]
+        with service.pool.cursor() as cursor:
+            step("metadata", get_answers_by_ids, cursor, ids, service.table_name)
+        if service.hybrid:
+            step("lexical", lambda: service.lexical_index)
+        timings["total"] = round(time.perf_counter() - started, 4)
+        _report.clear()
+        _report.update(timings)
+        _ready.set()
+        log.info(f"Warm-up complete, ready to serve: {timings}")
+        return timings
+    except Exception as e:
+        log.error(f'Error while warming up: {e}')
+        log.error(traceback.format_exc())
+        raise e
+
+
+def is_ready() -> bool:
+    """
+    Whether the warm-up completed in this process
+
+    :return: True once ``warm_up`` succeeded
+    """
+    return _ready.is_set()
+
+
+def warmup_report() -> Dict[str, Any]:
+    """
+    Seconds spent per warm-up step
+
+    :return: step timings, empty before the warm-up completed
+    """
+    return dict(_report)
@@ -0,0 +1,171 @@
+import threading
+import time
+from typing import Any, Callable, List
+
+from myLogger.Logger import getLogger as GetLogger
+from config import QA_CORPUS_POLL_SECONDS
+
+log = GetLogger(__name__)
+
+# -----------------------------------------------------------------------------
+# Corpus version
+#
+# Every writer of the question/answer corpus (Milvus inserts, MySQL loads) bumps the
+# version; caches remember the version an entry was computed under and drop entries
+# from an older corpus.
+#
+# The version is per process. Ingestion usually runs in another process than the API
+# workers, so writers also publish the change to a shared counter row in MySQL
+# (``publish_corpus_change``); every query service polls it through a
+# ``CorpusVersionWatcher`` and bumps its own version when the row moved. The table is
+# created by the first publish; until then the shared version reads as 0.
+# -----------------------------------------------------------------------------
+CORPUS_VERSION_TABLE = "corpus_version"
+CORPUS_NAME = "corpus"
+_version = 0
+_lock = threading.Lock()
+_listeners: List[Callable[[int], None]] = []
+
+
+def get_corpus_version() -> int:
+    """
+    Current version of the question/answer corpus.
+
+    :return: corpus version
+    """
+    return _version
+
+
+def bump_corpus_version(reason: str = None) -> int:
+    """
+    Marks the corpus as changed and notifies the registered listeners.
+
+    :param reason: what changed, for the logs
+    :return: the new corpus version
+    """
+    global _version
+    with _lock:
+        _version += 1
+        version = _version
+        listeners = list(_listeners)
+    log.info("Corpus version bumped to %s%s" % (version, f": {reason}" if reason else ""))
+    for listener in listeners:
+        try:
+            listener(version)
+        except Exception as e:
+            log.error("Corpus version listener failed: %s" % e)
+    return version
+
+
+def on_corpus_change(listener: Callable[[int], None]) -> Callable[[int], None]:
+    """
+    Registers a callback invoked with the new version whenever the corpus changes.
+
+    :param listener: callback
+    :return: the callback, so this can be used as a decorator
+    """
+    with _lock:
+        _listeners.append(listener)
+    return listener
+
+
+def off_corpus_change(listener: Callable[[int], None]) -> None:
+    """
+    Unregisters a callback registered with ``on_corpus_change``; unknown callbacks are ignored.
+
+    :param listener: callback
+    :return: None
+    """
+    with _lock:
+        try:
+            _listeners.remove(listener)
+        except ValueError:
+            pass
+
+
+# MySQL error code of a missing table
+NO_SUCH_TABLE = 1146
+
+
+def _missing_table(error: Exception) -> bool:
+    code = getattr(error, "errno", None) or (error.args[0] if error.args else None)
+    # SQLite, used by the benchmark stand-ins, has no error codes
+    return code == NO_SUCH_TABLE or "no such table" in str(error)
+
+
+def read_shared_corpus_version(cursor: Any) -> int:
+    """
+    Reads the corpus version shared between processes.
+
+    :param cursor: MySQL cursor
+    :return: shared version, 0 before the first publish
+    """
+    try:
+        cursor.execute(f"SELECT version FROM {CORPUS_VERSION_TABLE} WHERE name = %s;", (CORPUS_NAME,))
+    except Exception as e:
+        # the table is created by the first publish
+        if _missing_table(e):
+            return 0
+        raise e
+    row = cursor.fetchone()
+    return int(row[0]) if row else 0
+
+
+def publish_corpus_change(cursor: Any, reason: str = None) -> int:
+    """
+    Increments the shared corpus version, so the query services of other processes drop their caches, and
+    bumps the version of this process. The caller commits.
+
+    :param cursor: MySQL cursor of the writing transaction
+    :param reason: what changed, for the logs
+    :return: the new version of this process
+    """
+    cursor.execute(f"CREATE TABLE IF NOT EXISTS {CORPUS_VERSION_TABLE} (name VARCHAR(64) NOT NULL, "
+                   f"version BIGINT NOT NULL, PRIMARY KEY (name));")
+    updated = cursor.execute(f"UPDATE {CORPUS_VERSION_TABLE} SET version = version + 1 WHERE name = %s;",
+                             (CORPUS_NAME,))
+    if not updated:
+        cursor.execute(f"INSERT INTO {CORPUS_VERSION_TABLE} (name, version) VALUES (%s, 1);", (CORPUS_NAME,))
+    return bump_corpus_version(reason)
+
+
+class CorpusVersionWatcher:
+    """
+    Polls the shared corpus version at most every ``interval`` seconds and bumps the version of this
+    process when another process published a change.
+    """
+
+    def __init__(self, pool: Any, interval: float = QA_CORPUS_POLL_SECONDS):
+        """
+        :param pool: MySQL connection pool with a ``cursor()`` context manager
+        :param interval: seconds between polls
+        """
+        self.pool = pool
+        self.interval = interval
+        self._seen: int = None
+        self._next_poll = 0.0
+        self._lock = threading.Lock()
+
+    def poll(self) -> bool:
+        """
+        Checks the shared version unless it was checked less than ``interval`` seconds ago; never blocks on
+        a concurrent poll and never raises.
+
+        :return: True when a change of another process was picked up
+        """
+        if time.monotonic() < self._next_poll or not self._lock.acquire(blocking=False):
+            return False
+        try:
+            self._next_poll = time.monotonic() + self.interval
+            with self.pool.cursor() as cursor:
+                shared = read_shared_corpus_version(cursor)
+            changed = self._seen is not None and shared != self._seen
+            self._seen = shared
+            if changed:
+                bump_corpus_version(f"shared corpus version {shared}")
+            return changed
+        except Exception as e:
+            log.warning("Corpus version poll failed: %s" % e)
+            return False
+        finally:
+            self._lock.release()
@@ -0,0 +1,134 @@
+import copy
+import platform
+from typing import Any, Callable, Tuple
+
+from myLogger.Logger import getLogger as GetLogger
+
+log = GetLogger(__name__)
+
+# -----------------------------------------------------------------------------
+# Encoder backends
+#
+# CPU inference variants of a sentence transformer, applied once after loading:
+#
+#   fp32         the model as loaded
+#   int8         dynamic int8 quantization of the Linear layers (torch quantize_dynamic):
+#                weights stored as int8, activations quantized on the fly
+#   traced       the transformer traced to a frozen TorchScript graph, which drops
+#                Python dispatch and lets the JIT fuse ops
+#   int8-traced  both
+#
+# Embeddings of the variants are close to but not bit-identical with fp32, so a
+# collection should be ingested and queried with the same backend; see
+# ``python -m benchmarks.encoders`` for the speedup and the agreement with fp32.
+# -----------------------------------------------------------------------------
+BACKENDS = ("fp32", "int8", "traced", "int8-traced")
+TRACE_SEQUENCE_LENGTH = 128
+
+
+def _parse(backend: str) -> Tuple[bool, bool]:
+    backend = (backend or "fp32").lower()
+    if backend not in BACKENDS:
+        raise ValueError(f'Unknown encoder backend "{backend}", expected one of {BACKENDS}')
+    return "int8" in backend, "traced" in backend
+
+
+def quantize_int8(model: Any, inplace: bool = False) -> Any:
+    """
+    Dynamic int8 quantization of every Linear layer
+
+    :param model: sentence transformer
+    :param inplace: quantize the model itself instead of a copy
+    :return: quantized model
+    """
+    import torch
+    engines = torch.backends.quantized.supported_engines
+    preferred = "qnnpack" if platform.machine().lower() in ("arm64", "aarch64") else "fbgemm"
+    if preferred in engines:
+        torch.backends.quantized.engine = preferred
+    model.eval()
+    return torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8, inplace=inplace)
+
+
+def trace_transformer(model: Any, sequence_length: int = TRACE_SEQUENCE_LENGTH) -> Any:
+    """
+    Replaces the Hugging Face model inside the sentence transformer by a frozen TorchScript trace.
+    Pooling and normalization modules are left as they are.
+
+    :param model: sentence transformer, modified in place
+    :param sequence_length: sequence length of the example input; the trace accepts other lengths
+    :return: the model
+    """
+    import torch
+
+    transformer = model[0]
+    auto_model = transformer.auto_model
+
+    class Traceable(torch.nn.Module):
+        def __init__(self, wrapped):
+            super().__init__()
+            self.wrapped = wrapped
+
+        def forward(self, input_ids, attention_mask):
+            return self.wrapped(input_ids=input_ids, attention_mask=attention_mask, return_dict=False)[0]
+
+    class TracedAutoModel(torch.nn.Module):
+        """Stands in for the Hugging Face model: accepts its keyword arguments, returns its tuple output"""
+
+        def __init__(self, traced, config):
+            super().__init__()
+            self.traced = traced
+            self.config = config
+
+        def forward(self, input_ids=None, attention_mask=None, **kwargs):
+            return (self.traced(input_ids, attention_mask),)
+
+    features = transformer.tokenize(["warm " * sequence_length] * 2)
+    example = (features["input_ids"][:, :sequence_length], features["attention_mask"][:, :sequence_length])
+    model.eval()
+    with torch.no_grad():
+        traced = torch.jit.freeze(torch.jit.trace(Traceable(auto_model).eval(), example, strict=False))
+    transformer.auto_model = TracedAutoModel(traced, auto_model.config)
+    return model
+
+
+def apply_backend(model: Any, backend: str, inplace: bool = False) -> Any:
+    """
+    Converts a loaded fp32 sentence transformer to a backend
+
+    :param model: sentence transformer
+    :param backend: one of BACKENDS
+    :param inplace: convert the model itself; otherwise the given model is left untouched
+    :return: converted model
+    """
+    int8, traced = _parse(backend)
+    if not (int8 or traced):
+        return model
+    if int8:
+        model = quantize_int8(model, inplace=inplace)
+    elif not inplace:
+        model = copy.deepcopy(model)
+    if traced:
+        model = trace_transformer(model)
+    # part of the model id, embeddings of different backends are not interchangeable
+    model.backend = backend.lower()
+    return model
+
+
+def with_backend(factory: Callable[[], Any], backend: str) -> Callable[[], Any]:
+    """
+    Wraps a model factory so the loaded model is converted to a backend
+
+    :param factory: callable loading the fp32 model
+    :param backend: one of BACKENDS
+    :return: callable loading the converted model
+    """
+    _parse(backend)
+    if (backend or "fp32").lower() == "fp32":
+        return factory
+
+    def load():
+        model = apply_backend(factory(), backend, inplace=True)
+        log.info(f"Encoder converted to the {backend} backend")
+        return model
+    return load
@@ -0,0 +1,315 @@
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, Iterable, List, Sequence, Tuple
+
+from myLogger.Logger import getLogger as GetLogger
+
+log = GetLogger(__name__)
+
+# -----------------------------------------------------------------------------
+# In-process metrics
+#
+# A minimal registry of counters, gauges and histograms rendered in the Prometheus
+# text exposition format. Metrics are per process: with several API workers every
+# worker is scraped (or aggregated) on its own.
+# -----------------------------------------------------------------------------
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256)
+
+# (name, type, help, [(labels, value), ...])
+Family = Tuple[str, str, str, List[Tuple[Dict[str, Any], float]]]
+
+
+def _format_labels(labels: Dict[str, Any]) -> str:
+    if not labels:
+        return ""
+    pairs = []
+    for key, value in labels.items():
+        value = str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+        pairs.append(f'{key}="{value}"')
+    return "{" + ",".join(pairs) + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, Any]) -> Tuple:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def _labels(self, key: Tuple) -> Dict[str, Any]:
+        return dict(zip(self.labelnames, key))
+
+    def collect(self) -> List[Family]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    """Monotonically increasing count; Prometheus derives rates (e.g. QPS) from it"""
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple, float] = {}
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        if amount < 0:
+            raise ValueError("Counters can only increase")
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+    def collect(self) -> List[Family]:
+        with self._lock:
+            samples = [(self._labels(key), value) for key, value in self._values.items()]
+        return [(self.name, self.kind, self.documentation, samples)]
+
+
+class Gauge(Counter):
+    """Value that goes up and down, e.g. the number of requests in flight"""
+    kind = "gauge"
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels) -> None:
+        self.inc(-amount, **labels)
+
+    def set(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    @contextmanager
+    def track_inprogress(self, **labels):
+        self.inc(**labels)
+        try:
+            yield
+        finally:
+            self.dec(**labels)
+
+
+class Histogram(_Metric):
+    """Cumulative bucket counts, sum and count of observations"""
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._values: Dict[Tuple, List[float]] = {}
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            # bucket counts (non-cumulative), then sum and count
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [0] * (len(self.buckets) + 1) + [0.0, 0]
+            state[index] += 1
+            state[-2] += value
+            state[-1] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def collect(self) -> List[Family]:
+        samples = []
+        with self._lock:
+            values = [(key, list(state)) for key, state in self._values.items()]
+        for key, state in values:
+            labels = self._labels(key)
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), state):
+                cumulative += count
+                samples.append(({**labels, "le": _format_value(bound)}, cumulative, "_bucket"))
+            samples.append((labels, state[-2], "_sum"))
+            samples.append((labels, state[-1], "_count"))
+        return [(self.name, self.kind, self.documentation, samples)]
+
+
+class MetricsRegistry:
+    """
+    Holds the metrics of a process and renders them in the Prometheus text format.
+
+    Besides metrics updated in place, collectors (callables returning metric families) are
+    evaluated at scrape time, e.g. to export the statistics a cache already keeps.
+    """
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._collectors: List[Callable[[], Iterable[Family]]] = []
+        self._lock = threading.Lock()
+
+    def _register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                if type(existing) is not type(metric) or existing.labelnames != metric.labelnames:
+                    raise ValueError(f"Metric {metric.name} is already registered with another type or labels")
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self._register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def register_collector(self, collector: Callable[[], Iterable[Family]]) -> Callable[[], Iterable[Family]]:
+        """
+        Registers a callable evaluated on every scrape
+
+        :param collector: callable returning (name, type, help, [(labels, value), ...]) families
+        :return: the collector, so this can be used as a decorator
+        """
+        with self._lock:
+            self._collectors.append(collector)
+        return collector
+
+    def unregister_collector(self, collector: Callable[[], Iterable[Family]]) -> None:
+        with self._lock:
+            if collector in self._collectors:
+                self._collectors.remove(collector)
+
+    def collect(self) -> List[Family]:
+        with self._lock:
+            metrics = list(self._metrics.values())
+            collectors = list(self._collectors)
+        families = []
+        for metric in metrics:
+            families.extend(metric.collect())
+        for collector in collectors:
+            try:
+                families.extend(collector())
+            except Exception as e:
+                log.error(f"Metrics collector {collector} failed: {e}")
+        return families
+
+    def render(self) -> str:
+        """
+        Renders every metric in the Prometheus text exposition format
+
+        :return: exposition text
+        """
+        lines = []
+        seen = set()
+        for name, kind, documentation, samples in self.collect():
+            if name not in seen:
+                seen.add(name)
+                lines.append(f"# HELP {name} {documentation}")
+                lines.append(f"# TYPE {name} {kind}")
+            for sample in samples:
+                labels, value = sample[0], sample[1]
+                suffix = sample[2] if len(sample) > 2 else ""
+                lines.append(f"{name}{suffix}{_format_labels(labels)} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+# -----------------------------------------------------------------------------
+# QA pipeline metrics
+# -----------------------------------------------------------------------------
+STAGE_LATENCY = REGISTRY.histogram("qa_stage_latency_seconds",
+                                   "Latency of a QA pipeline stage (encode, search, metadata, answer, ...)",
+                                   labelnames=("stage",))
+REQUEST_LATENCY = REGISTRY.histogram("qa_request_latency_seconds", "End-to-end latency of a QA request")
+REQUESTS = REGISTRY.counter("qa_requests_total", "QA requests served, by outcome", labelnames=("outcome",))
+QUESTIONS = REGISTRY.counter("qa_questions_total", "Questions answered, counting every question of a batch")
+IN_FLIGHT = REGISTRY.gauge("qa_requests_in_flight", "QA requests currently being served")
+CACHE_LOOKUPS = REGISTRY.counter("qa_cache_lookups_total", "Cache lookups on the request path, by cache and result",
+                                 labelnames=("cache", "result"))
+BATCH_SIZE = REGISTRY.histogram("qa_batch_size", "Questions per micro-batch", buckets=SIZE_BUCKETS)
+INGESTED_ROWS = REGISTRY.counter("qa_ingested_rows_total", "Rows written during ingestion, by store",
+                                 labelnames=("store",))
+INGESTION_RATE = REGISTRY.gauge("qa_ingestion_rows_per_second", "Throughput of the last ingestion run, by store",
+                                labelnames=("store",))
+MODEL_LOAD_SECONDS = REGISTRY.gauge("qa_model_load_seconds", "Time taken to load a model on first use, by model",
+                                    labelnames=("model",))
+
+
+@contextmanager
+def track_ingestion(store: str):
+    """
+    Measures an ingestion run; the caller reports the number of rows written through the yielded list
+
+    :param store: target store, e.g. "milvus" or "mysql"
+    :return: a list to append row counts to
+    """
+    rows: List[int] = []
+    started = time.perf_counter()
+    try:
+        yield rows
+    finally:
+        elapsed = time.perf_counter() - started
+        total = sum(rows)
+        if total:
+            INGESTED_ROWS.inc(total, store=store)
+            INGESTION_RATE.set(total / elapsed if elapsed > 0 else 0.0, store=store)
+
+
+def start_metrics_server(port: int, host: str = "0.0.0.0", registry: MetricsRegistry = REGISTRY) -> ThreadingHTTPServer:
+    """
+    Serves ``/metrics`` on a background thread, for processes without the FastAPI app (e.g. the Gradio UI)
+
+    :param port: bind port
+    :param host: bind address
+    :param registry: registry to expose
+    :return: the running server
+    """
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = registry.render().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", CONTENT_TYPE)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            log.debug(format % args)
+
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+    log.info(f"Serving metrics on http://{host}:{port}/metrics")
+    return server
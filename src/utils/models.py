@@ -0,0 +1,365 @@
+import argparse
+import hashlib
+import json
+import os
+import threading
+import time
+import traceback
+from typing import Any, Callable, Dict, List, Optional
+
+from utils.encoder_backends import with_backend
+from utils.metrics import MODEL_LOAD_SECONDS
+from myLogger.Logger import getLogger as GetLogger
+from config import MODEL_DEFAULT, MODEL_NAMES, MODEL_PATHS, MODEL_REVISIONS, MODEL_OFFLINE, MODEL_VERIFY_CHECKSUMS, \
+    MODEL_COLLECTIONS, MODEL_BACKEND, MODEL_MAX_SEQ_LENGTH
+
+log = GetLogger(__name__)
+
+# -----------------------------------------------------------------------------
+# Model registry
+#
+# Models are named in config.MODEL_PATHS and loaded on first use, so modules that
+# import config but never encode (loaders, admin tools, tests) do not pay for the
+# model load. Every model is loaded at most once per process, under a lock of its own.
+#
+# Models load from their local directory only: ``download`` fetches a pinned revision
+# once and writes a manifest of sha256 checksums next to the files, which every load
+# verifies. Cold starts are deterministic and never touch the network.
+# -----------------------------------------------------------------------------
+MANIFEST = "model_manifest.json"
+# weights of other runtimes than torch, never loaded by sentence-transformers
+SKIPPED_DIRECTORIES = ("onnx/", "openvino/")
+SKIPPED_EXTENSIONS = (".onnx", ".h5", ".msgpack", ".ot", ".tflite")
+
+
+def file_sha256(path: str, chunk_size: int = 1 << 20) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def model_files(filenames: List[str]) -> List[str]:
+    """
+    Files of a hub repository that sentence-transformers loads: configuration, tokenizer and torch weights,
+    safetensors only when the repository has them
+
+    :param filenames: every file of the repository
+    :return: files to download
+    """
+    files = [f for f in filenames if not f.startswith(SKIPPED_DIRECTORIES) and not f.endswith(SKIPPED_EXTENSIONS)]
+    if any(f.endswith(".safetensors") for f in files):
+        files = [f for f in files if not f.endswith(".bin")]
+    return files
+
+
+def write_manifest(directory: str, repo_id: str, revision: str) -> Dict[str, Any]:
+    """
+    Records the revision and the sha256 of every file of a model directory
+
+    :param directory: model directory
+    :param repo_id: hub repository the files were downloaded from
+    :param revision: revision (commit) the files were downloaded at
+    :return: manifest
+    """
+    files = {}
+    for root, dirs, names in os.walk(directory):
+        dirs[:] = sorted(d for d in dirs if not d.startswith("."))
+        for name in sorted(names):
+            path = os.path.join(root, name)
+            relative = os.path.relpath(path, directory)
+            if relative != MANIFEST and not name.startswith("."):
+                files[relative.replace(os.sep, "/")] = file_sha256(path)
+    manifest = {"repo_id": repo_id, "revision": revision, "files": files}
+    with open(os.path.join(directory, MANIFEST), "w") as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+
+def verify_model_dir(directory: str, revision: str = None, checksums: bool = True) -> Dict[str, Any]:
+    """
+    Checks a model directory against its manifest
+
+    :param directory: model directory
+    :param revision: pinned revision, None or empty accepts the manifest's
+    :param checksums: also verify the sha256 of every file
+    :return: manifest
+    """
+    path = os.path.join(directory, MANIFEST)
+    if not os.path.isfile(path):
+        raise FileNotFoundError(f"No model manifest in {directory}, run `python -m utils.models download`")
+    with open(path) as f:
+        manifest = json.load(f)
+    if revision and manifest.get("revision") != revision:
+        raise ValueError(f"Model in {directory} is at revision {manifest.get('revision')}, pinned {revision}")
+    if checksums:
+        for relative, expected in manifest["files"].items():
+            file_path = os.path.join(directory, *relative.split("/"))
+            if not os.path.isfile(file_path):
+                raise FileNotFoundError(f"Model file {file_path} listed in the manifest is missing")
+            if file_sha256(file_path) != expected:
+                raise ValueError(f"Checksum mismatch for model file {file_path}")
+    return manifest
+
+
+def sentence_transformer(model_name_or_path: str) -> Callable[[], Any]:
+    """
+    Factory of a sentence transformer; the library is imported only when the model is loaded
+
+    :param model_name_or_path: model name on the hub or local path
+    :return: callable loading the model
+    """
+    def load():
+        from sentence_transformers import SentenceTransformer
+        return SentenceTransformer(model_name_or_path=model_name_or_path)
+    return load
+
+
+def local_sentence_transformer(directory: str, revision: str = None,
+                               checksums: bool = MODEL_VERIFY_CHECKSUMS) -> Callable[[], Any]:
+    """
+    Factory of a sentence transformer loaded strictly from a verified local directory
+
+    :param directory: model directory holding a manifest
+    :param revision: pinned revision, None or empty accepts the manifest's
+    :param checksums: verify the sha256 of every file before loading
+    :return: callable loading the model
+    """
+    def load():
+        manifest = verify_model_dir(directory, revision, checksums=checksums)
+        from sentence_transformers import SentenceTransformer
+        log.info(f"Loading {manifest.get('repo_id')}@{manifest.get('revision')} from {directory}")
+        # no hub resolution for the model or its tokenizer
+        model = SentenceTransformer(model_name_or_path=directory, local_files_only=True)
+        model.model_id = f"{manifest.get('repo_id')}@{manifest.get('revision')}"
+        return model
+    return load
+
+
+def model_id(model: Any) -> Optional[str]:
+    """
+    Identity of the embeddings a model produces: weights and revision, encoder backend and truncation length.
+    Only models loaded from a verified local directory (``local_sentence_transformer``) are pinned to a revision;
+    models loaded from the hub or outside the registry have no id.
+
+    :param model: encoder
+    :return: model id, e.g. "sentence-transformers/all-mpnet-base-v2@<commit>/int8/384", or None
+    """
+    base = getattr(model, "model_id", None)
+    if not base:
+        return None
+    return f"{base}/{getattr(model, 'backend', 'fp32')}/{getattr(model, 'max_seq_length', None)}"
+
+
+def with_max_seq_length(factory: Callable[[], Any], max_seq_length: int) -> Callable[[], Any]:
+    """
+    Wraps a model factory so the loaded model truncates its inputs at ``max_seq_length`` tokens
+
+    :param factory: callable loading the model
+    :param max_seq_length: truncation length, 0 keeps the model's own
+    :return: callable loading the model
+    """
+    if not max_seq_length:
+        return factory
+
+    def load():
+        model = factory()
+        model.max_seq_length = max_seq_length
+        return model
+    return load
+
+
+def default_factories(backend: str = MODEL_BACKEND) -> Dict[str, Callable[[], Any]]:
+    """
+    A factory per model of MODEL_PATHS: from the local directory, or from the hub when MODEL_OFFLINE is off
+    and the model was never downloaded
+
+    :param backend: encoder backend the loaded models are converted to
+    :return: {name: factory}
+    """
+    factories = {}
+    for name, directory in MODEL_PATHS.items():
+        if MODEL_OFFLINE or os.path.isfile(os.path.join(directory, MANIFEST)):
+            factory = local_sentence_transformer(directory, MODEL_REVISIONS.get(name))
+        else:
+            factory = sentence_transformer(MODEL_NAMES.get(name, name))
+        factories[name] = with_max_seq_length(with_backend(factory, backend), MODEL_MAX_SEQ_LENGTH)
+    return factories
+
+
+def download_model(name: str, revision: str = None) -> Dict[str, Any]:
+    """
+    Downloads the files sentence-transformers loads (see ``model_files``) of a model into its MODEL_PATHS
+    directory and writes the manifest
+
+    :param name: model name
+    :param revision: revision to download, defaults to the pinned one or "main"
+    :return: manifest
+    """
+    from huggingface_hub import HfApi, snapshot_download
+    repo_id = MODEL_NAMES.get(name, name)
+    revision = revision or MODEL_REVISIONS.get(name) or "main"
+    # resolve branches and tags to the commit, which is what the manifest pins
+    info = HfApi().model_info(repo_id, revision=revision, files_metadata=False)
+    commit = info.sha
+    files = model_files([sibling.rfilename for sibling in info.siblings or []])
+    directory = MODEL_PATHS[name]
+    log.info(f"Downloading {len(files)} files of {repo_id}@{commit} into {directory}")
+    snapshot_download(repo_id=repo_id, revision=commit, local_dir=directory, allow_patterns=files or None)
+    return write_manifest(directory, repo_id, commit)
+
+
+class ModelRegistry:
+    """
+    Thread-safe registry of lazily loaded models
+    """
+
+    def __init__(self, factories: Dict[str, Callable[[], Any]] = None):
+        if factories is None:
+            factories = default_factories()
+        self._factories: Dict[str, Callable[[], Any]] = dict(factories)
+        self._models: Dict[str, Any] = {}
+        self._load_times: Dict[str, float] = {}
+        self._locks: Dict[str, threading.Lock] = {}
+        self._lock = threading.Lock()
+
+    def register(self, name: str, factory: Callable[[], Any]) -> None:
+        """
+        Registers (or replaces) a model factory; a model already loaded under the name is dropped
+
+        :param name: model name
+        :param factory: callable returning the loaded model
+        """
+        with self._lock:
+            self._factories[name] = factory
+            self._models.pop(name, None)
+            self._load_times.pop(name, None)
+
+    def get(self, name: str = MODEL_DEFAULT) -> Any:
+        """
+        Returns a model, loading it on first use; concurrent callers wait for the same load
+
+        :param name: model name
+        :return: model
+        """
+        model = self._models.get(name)
+        if model is not None:
+            return model
+        with self._lock:
+            if name not in self._factories:
+                raise KeyError(f'Unknown model "{name}", expected one of {self.names()}')
+            lock = self._locks.setdefault(name, threading.Lock())
+        with lock:
+            model = self._models.get(name)
+            if model is not None:
+                return model
+            try:
+                log.info(f"Loading model \"{name}\"...")
+                started = time.perf_counter()
+                model = self._factories[name]()
+                elapsed = time.perf_counter() - started
+            except Exception as e:
+                log.error(f'Error while loading model "{name}": {e}')
+                log.error(traceback.format_exc())
+                raise e
+            with self._lock:
+                self._models[name] = model
+                self._load_times[name] = elapsed
+            MODEL_LOAD_SECONDS.set(elapsed, model=name)
+            log.info(f"Loaded model \"{name}\" in {elapsed:.2f}s")
+            return model
+
+    def is_loaded(self, name: str = MODEL_DEFAULT) -> bool:
+        return name in self._models
+
+    def names(self) -> List[str]:
+        return list(self._factories)
+
+    def load_times(self) -> Dict[str, float]:
+        """
+        Seconds spent loading every model loaded so far
+
+        :return: {name: seconds}
+        """
+        with self._lock:
+            return dict(self._load_times)
+
+    def unload(self, name: str) -> None:
+        with self._lock:
+            self._models.pop(name, None)
+            self._load_times.pop(name, None)
+
+
+_registry: ModelRegistry = None
+_registry_lock = threading.Lock()
+
+
+def get_model_registry() -> ModelRegistry:
+    """
+    Returns the process-wide model registry, creating it on first use
+
+    :return: model registry
+    """
+    global _registry
+    if _registry is None:
+        with _registry_lock:
+            if _registry is None:
+                _registry = ModelRegistry()
+    return _registry
+
+
+def set_model_registry(registry: ModelRegistry) -> None:
+    """
+    Replaces the process-wide model registry, e.g. with one holding stand-in models
+
+    :param registry: model registry
+    """
+    global _registry
+    with _registry_lock:
+        _registry = registry
+
+
+def get_model(name: str = MODEL_DEFAULT) -> Any:
+    """
+    Returns a model of the process-wide registry, loading it on first use
+
+    :param name: model name, defaults to MODEL_DEFAULT
+    :return: model
+    """
+    return get_model_registry().get(name)
+
+
+def get_collection_model(collection_name: str) -> Any:
+    """
+    Returns the encoder of a collection (MODEL_COLLECTIONS), the default model for unmapped collections.
+    Ingestion and queries of a collection must encode with the same model.
+
+    :param collection_name: collection name
+    :return: model
+    """
+    return get_model(MODEL_COLLECTIONS.get(collection_name, MODEL_DEFAULT))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Local model registry")
+    commands = parser.add_subparsers(dest="command", required=True)
+    download = commands.add_parser("download", help="download models into MODEL_PATHS and write their manifests")
+    download.add_argument("names", nargs="*", help="models to download, defaults to every model of MODEL_NAMES")
+    download.add_argument("--revision", default=None, help="revision to download instead of the pinned one")
+    verify = commands.add_parser("verify", help="verify local models against their manifests")
+    verify.add_argument("names", nargs="*", help="models to verify, defaults to every model of MODEL_PATHS")
+    args = parser.parse_args()
+    try:
+        if args.command == "download":
+            for __name in args.names or list(MODEL_NAMES):
+                __manifest = download_model(__name, revision=args.revision)
+                print(f"{__name}: {__manifest['repo_id']}@{__manifest['revision']} ({len(__manifest['files'])} files)")
+        else:
+            for __name in args.names or list(MODEL_PATHS):
+                __manifest = verify_model_dir(MODEL_PATHS[__name], MODEL_REVISIONS.get(__name))
+                print(f"{__name}: {__manifest['repo_id']}@{__manifest['revision']} ok")
+    except Exception as e:
+        log.error(f'Error while managing models: {e}')
+        log.error(traceback.format_exc())
+        raise e
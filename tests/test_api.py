@@ -0,0 +1,52 @@
+import pytest
+from fastapi.testclient import TestClient
+
+import api
+import milvus.warmup as warmup
+from benchmarks.serving import build_service, synthetic_corpus
+from benchmarks.stand_ins import HashingEncoder
+from dependencies import async_query_service
+from milvus.async_service import AsyncQueryService
+
+
+@pytest.fixture
+def client():
+    questions, answers = synthetic_corpus(50)
+    service = AsyncQueryService(service=build_service(questions, answers, HashingEncoder(dim=32)))
+    api.app.dependency_overrides[async_query_service] = lambda: service
+    # no context manager: the lifespan warm-up would target the real services
+    yield TestClient(api.app), service, questions
+    api.app.dependency_overrides.clear()
+    service.shutdown(wait=False)
+    service.service.close()
+
+
+def test_health_and_readiness(client, monkeypatch):
+    test_client, service, _ = client
+    monkeypatch.setattr(warmup, "_ready", warmup.threading.Event())
+    assert test_client.get("/health").json() == {"status": "ok"}
+    assert test_client.get("/ready").status_code == 503
+    warmup.warm_up(service.service, lengths=[4], batch_sizes=[1])
+    response = test_client.get("/ready")
+    assert response.status_code == 200 and "total" in response.json()["warmup_s"]
+
+
+def test_answer_explains_and_rejects_unknown_profiles(client):
+    test_client, _, questions = client
+    response = test_client.post("/answer", json={"question": questions[0], "explain": True})
+    assert response.status_code == 200
+    body = response.json()
+    assert body["answers"] and body["answer"] == body["answers"][0]["answer"]
+    assert {"encode", "search", "metadata"} <= set(body["explain"]["stages_ms"])
+    assert test_client.post("/answer", json={"question": questions[0]}).json()["explain"] is None
+    assert test_client.post("/answer", json={"question": questions[0], "profile": "nope"}).status_code == 400
+
+
+def test_search_answers_batches_up_to_the_limit(client, monkeypatch):
+    test_client, _, questions = client
+    response = test_client.post("/search", json={"questions": questions[:3], "profile": "fast"})
+    assert response.status_code == 200
+    assert [result["question"] for result in response.json()["results"]] == questions[:3]
+    monkeypatch.setattr(api, "API_MAX_BATCH_SIZE", 2)
+    assert test_client.post("/search", json={"questions": questions[:3]}).status_code == 413
+    assert test_client.post("/search", json={"questions": []}).status_code == 422
@@ -0,0 +1,43 @@
+import asyncio
+
+import milvus.async_service as async_service
+from milvus.async_service import QuerySuperseded, async_stream_response_handler
+from milvus.question_answering import SEARCHING
+
+
+class SupersedingService:
+    """Answers the newest question of a session; the pending older one is superseded"""
+
+    def __init__(self):
+        self.pending = None
+
+    async def search_latest_answers(self, session, question):
+        if self.pending is not None:
+            self.pending.set_exception(QuerySuperseded(question))
+        self.pending = asyncio.get_running_loop().create_future()
+        if question == "old":
+            return await self.pending
+        return [{"id": 1, "question": "new?", "answer": "the new answer", "distance": 0.9}]
+
+
+async def drain(handler):
+    return [update async for update in handler]
+
+
+def test_superseded_stream_removes_its_own_entry(monkeypatch):
+    monkeypatch.setattr(async_service, "_async_service", SupersedingService())
+
+    async def chat():
+        state = []
+        old = async_stream_response_handler("old", state, session="s")
+        await old.__anext__()
+        rest_of_old = asyncio.ensure_future(drain(old))
+        await asyncio.sleep(0)
+        # the newer message is posted while the old one is still searching
+        await drain(async_stream_response_handler("new", state, session="s"))
+        await rest_of_old
+        return state
+
+    state = asyncio.run(chat())
+    assert [message for message, _ in state] == ["new"]
+    assert state[0][1].startswith("the new answer") and state[0][1] != SEARCHING
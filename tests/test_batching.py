@@ -0,0 +1,92 @@
+import threading
+
+from milvus.batching import QueryBatcher
+from milvus.tracing import trace_distances, trace_request, trace_stage
+
+
+def test_query_batcher_merges_concurrent_questions():
+    seen = []
+
+    def handler(questions):
+        seen.append(list(questions))
+        return [q.upper() for q in questions]
+
+    batcher = QueryBatcher(handler=handler, window_ms=50, max_batch_size=8)
+    results = {}
+
+    def ask(question):
+        results[question] = batcher(question, timeout=5)
+
+    threads = [threading.Thread(target=ask, args=(f"q{i}",)) for i in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    batcher.stop()
+
+    assert results == {f"q{i}": f"Q{i}" for i in range(8)}
+    assert sum(len(batch) for batch in seen) == 8
+    assert len(seen) < 8
+    stats = batcher.stats()
+    assert stats["queries"] == 8
+    assert stats["max_batch_size"] <= 8
+
+
+def test_query_batcher_propagates_errors():
+    def handler(questions):
+        raise ValueError("boom")
+
+    batcher = QueryBatcher(handler=handler, window_ms=1, max_batch_size=4)
+    future = batcher.submit("q")
+    try:
+        future.result(timeout=5)
+        assert False, "expected the handler error"
+    except ValueError as e:
+        assert str(e) == "boom"
+    finally:
+        batcher.stop()
+
+
+class Hit:
+    def __init__(self, distance):
+        self.distance = distance
+
+
+def test_callers_traces_get_the_stages_of_their_batch():
+    def handler(questions):
+        with trace_stage("encode"):
+            pass
+        with trace_stage("search"):
+            trace_distances([[Hit(0.9 - i / 10)] for i, _ in enumerate(questions)])
+        return questions
+
+    batcher = QueryBatcher(handler=handler, window_ms=1, max_batch_size=1)
+    try:
+        with trace_request("q", slow_ms=-1) as trace:
+            assert batcher("q", timeout=5) == "q"
+    finally:
+        batcher.stop()
+    report = trace.to_dict()
+    assert {"encode", "search"} <= set(report["stages_ms"])
+    assert report["distances"] == [[0.9]]
+
+
+def test_micro_batched_chatbot_requests_are_counted(monkeypatch):
+    from milvus import batching, query_service, question_answering
+    from utils.metrics import REQUESTS
+
+    class Service:
+        def cached_answers(self, question):
+            return None
+
+    batcher = QueryBatcher(handler=lambda questions: [[{"answer": q.upper()}] for q in questions],
+                           window_ms=1, max_batch_size=1)
+    monkeypatch.setattr(question_answering, "QA_MICRO_BATCHING", True)
+    monkeypatch.setattr(query_service, "get_query_service", lambda: Service())
+    monkeypatch.setattr(batching, "get_query_batcher", lambda: batcher)
+    before = REQUESTS.value(outcome="ok")
+    try:
+        assert question_answering.chatbot_handler("q") == "Q"
+    finally:
+        batcher.stop()
+    assert REQUESTS.value(outcome="ok") == before + 1
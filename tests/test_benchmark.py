@@ -0,0 +1,44 @@
+import numpy as np
+
+from benchmarks.encoders import compare_encoders
+from benchmarks.serving import run_benchmark, compare
+from benchmarks.stand_ins import HashingEncoder, SQLitePool
+
+
+def test_sqlite_pool_translates_mysql_placeholders():
+    pool = SQLitePool()
+    with pool.cursor() as cursor:
+        cursor.execute("CREATE TABLE qa (id VARCHAR(128) PRIMARY KEY, question TEXT, answer TEXT);")
+        cursor.executemany("insert into qa (id, question, answer) values (%s, %s, %s);",
+                           [("1", "q1", "a1"), ("2", "q2", "a2")])
+        cursor.execute("select id, answer from qa where id in (%s, %s);", ["2", "1"])
+        assert sorted(cursor.fetchall()) == [("1", "a1"), ("2", "a2")]
+    pool.close()
+
+
+def test_run_benchmark_reports_percentiles_for_every_scenario():
+    report = run_benchmark(corpus_size=200, queries=40, batch_size=8, clients=4, warmup=2,
+                           model=HashingEncoder(dim=64))
+    assert set(report["results"]) == {"single", "batched", "concurrent", "microbatched"}
+    for result in report["results"].values():
+        assert result["questions"] == 40
+        assert 0 < result["p50_ms"] <= result["p95_ms"] <= result["p99_ms"] <= result["max_ms"]
+        assert result["qps"] > 0
+    assert report["results"]["batched"]["requests"] == 5
+    assert compare(report, report)["single"]["p99_ms"] == 0
+
+
+def test_compare_encoders_reports_speedup_and_agreement():
+    class Noisy(HashingEncoder):
+        def encode(self, sentences, batch_size=32, **kwargs):
+            embeddings = super().encode(sentences, batch_size=batch_size, **kwargs)
+            return embeddings + np.random.default_rng(0).normal(0, 0.01, embeddings.shape).astype(np.float32)
+
+    texts = [f"answer about term{i} and term{i + 1}" for i in range(50)]
+    results = compare_encoders({"fp32": lambda: HashingEncoder(dim=64), "noisy": lambda: Noisy(dim=64)},
+                               texts, texts[:10], batch_size=8, k=3)
+    assert results["fp32"]["agreement"]["cosine_min"] > 0.9999
+    assert results["fp32"]["speedup"] == 1.0
+    assert 0.9 < results["noisy"]["agreement"]["cosine_mean"] < 1.0
+    assert results["noisy"]["agreement"]["recall_at_3"] > 0.5
+    assert results["noisy"]["texts_per_s"] > 0
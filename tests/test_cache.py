@@ -0,0 +1,136 @@
+import time
+
+import numpy as np
+
+from benchmarks.serving import build_service
+from benchmarks.stand_ins import HashingEncoder, SQLitePool
+from milvus.cache import AnswerCache, EmbeddingCache, SemanticCache, normalize_question
+import utils.corpus as corpus
+from utils.corpus import CorpusVersionWatcher, bump_corpus_version, get_corpus_version, publish_corpus_change, \
+    read_shared_corpus_version
+
+
+def test_normalize_question():
+    assert normalize_question("  What   is\tAAA? ") == "what is aaa?"
+    assert normalize_question("What is the AAA?", clean=True) == "what aaa"
+
+
+def test_embedding_cache_hits_and_misses():
+    cache = EmbeddingCache(max_bytes=1024)
+    calls = []
+
+    def compute(question):
+        calls.append(question)
+        return np.ones(4)
+
+    first = cache.get_or_compute("What is AAA?", compute)
+    second = cache.get_or_compute("what  is aaa?", compute)
+    assert calls == ["What is AAA?"]
+    assert first.dtype == np.float32
+    assert np.array_equal(first, second)
+    stats = cache.stats()
+    assert stats["hits"] == 1 and stats["misses"] == 1
+    assert stats["bytes"] == 16
+
+
+def test_embedding_cache_evicts_least_recently_used():
+    cache = EmbeddingCache(max_bytes=32)  # room for two 4-dim float32 vectors
+    cache.put("a", np.zeros(4))
+    cache.put("b", np.zeros(4))
+    assert cache.get("a") is not None
+    cache.put("c", np.zeros(4))
+    assert cache.get("b") is None
+    assert cache.get("a") is not None
+    assert cache.stats()["evictions"] == 1
+    assert cache.nbytes <= cache.max_bytes
+
+
+def test_answer_cache_ttl_and_negative_entries():
+    cache = AnswerCache(max_entries=10, ttl=60, negative_ttl=0.05)
+    answers = [{"id": "1", "question": "q", "answer": "a", "distance": 0.9}]
+    cache.put("What is AAA?", answers)
+    cache.put("unknown", [])
+    assert cache.get("what is aaa?") == answers
+    assert cache.get("unknown") == []
+    time.sleep(0.1)
+    assert cache.get("unknown") is None
+    stats = cache.stats()
+    assert stats["negative_hits"] == 1 and stats["expired"] == 1
+
+
+def test_answer_cache_drops_entries_from_older_corpus():
+    cache = AnswerCache(max_entries=10, ttl=60)
+    version = get_corpus_version()
+    cache.put("q", [{"answer": "a"}], version=version)
+    assert cache.get("q") is not None
+    bump_corpus_version("test")
+    assert cache.get("q") is None
+    # a value computed before the bump is never served afterwards
+    cache.put("q", [{"answer": "a"}], version=version)
+    assert cache.get("q") is None
+
+
+def test_watchers_pick_up_changes_published_by_other_processes():
+    pool = SQLitePool()
+    try:
+        watcher = CorpusVersionWatcher(pool, interval=0)
+        cache = AnswerCache(max_entries=10, ttl=60)
+        assert not watcher.poll()
+        with pool.cursor() as cursor:
+            # polls never create the table, a missing one reads as version 0
+            assert read_shared_corpus_version(cursor) == 0
+            cursor.execute("SELECT name FROM sqlite_master WHERE name = 'corpus_version';")
+            assert cursor.fetchone() is None
+        cache.put("q", [{"answer": "a"}])
+        # another process loads the corpus: only the shared row tells this one
+        with pool.cursor() as cursor:
+            publish_corpus_change(cursor, "test")
+            publish_corpus_change(cursor, "test")
+            assert read_shared_corpus_version(cursor) == 2
+        version = get_corpus_version()
+        cache.put("q", [{"answer": "a"}])
+        assert watcher.poll() and get_corpus_version() == version + 1
+        assert cache.get("q") is None
+        assert not watcher.poll()
+        throttled = CorpusVersionWatcher(pool, interval=60)
+        assert not throttled.poll()
+        with pool.cursor() as cursor:
+            publish_corpus_change(cursor, "test")
+        assert not throttled.poll()
+    finally:
+        pool.close()
+
+
+def test_closed_services_stop_listening_to_corpus_changes():
+    listeners = len(corpus._listeners)
+    service = build_service(["q"], ["a"], HashingEncoder(dim=8), hybrid=True)
+    assert len(corpus._listeners) > listeners
+    service.close()
+    assert len(corpus._listeners) == listeners
+
+
+def _unit(vector):
+    vector = np.asarray(vector, dtype=np.float32)
+    return vector / np.linalg.norm(vector)
+
+
+def test_semantic_cache_matches_near_duplicates():
+    cache = SemanticCache(capacity=2, dim=3, threshold=0.95)
+    answers = [{"answer": "a"}]
+    cache.put(_unit([1, 0, 0]), answers)
+    assert cache.lookup(_unit([1, 0.1, 0])) == answers
+    assert cache.lookup(_unit([0, 1, 0])) is None
+    stats = cache.stats()
+    assert stats["hits"] == 1 and stats["misses"] == 1
+
+
+def test_semantic_cache_evicts_and_invalidates():
+    cache = SemanticCache(capacity=2, dim=3, threshold=0.95)
+    cache.put(_unit([1, 0, 0]), ["x"])
+    cache.put(_unit([0, 1, 0]), ["y"])
+    assert cache.lookup(_unit([1, 0, 0])) == ["x"]
+    cache.put(_unit([0, 0, 1]), ["z"])  # overwrites the least recently used entry ("y")
+    assert len(cache) == 2 and cache.evictions == 1
+    assert cache.lookup(_unit([0, 1, 0])) is None
+    bump_corpus_version("test")
+    assert cache.lookup(_unit([1, 0, 0])) is None
@@ -0,0 +1,91 @@
+import milvus.collection_state as collection_state
+import milvus.search_profiles as search_profiles
+from database.index_advisor import recommend_index
+from milvus.collection_state import CollectionState, build_index, get_collection_state, mark_collection_released, \
+    release_collection
+
+
+class FakeCollection:
+    """Collection whose loading progress errors until it is loaded, like a Milvus server"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.loaded = False
+        self.loads = 0
+
+    def load(self, *args, **kwargs):
+        self.loaded = True
+        self.loads += 1
+
+    def release(self, *args, **kwargs):
+        self.loaded = False
+
+
+def fake_progress(collections):
+    def loading_progress(name, using="default"):
+        if not collections[name].loaded:
+            raise RuntimeError(f"collection {name} not loaded")
+        return {"loading_progress": "100%"}
+    return loading_progress
+
+
+def test_ensure_loaded_loads_a_never_loaded_collection(monkeypatch):
+    collection = FakeCollection("never_loaded")
+    monkeypatch.setattr(collection_state.utility, "loading_progress", fake_progress({collection.name: collection}))
+    state = CollectionState(collection, timeout=1, poll_interval=0.01)
+    assert state.ensure_loaded() and state.ready
+    assert collection.loads == 1
+
+
+def test_released_collections_are_reloaded(monkeypatch):
+    collection = FakeCollection("released")
+    monkeypatch.setattr(collection_state.utility, "loading_progress", fake_progress({collection.name: collection}))
+    state = get_collection_state(collection)
+    state.timeout, state.poll_interval = 1, 0.01
+    state.ensure_loaded()
+    release_collection(collection)
+    assert not state.ready
+    assert state.ensure_loaded() and collection.loads == 2
+    collection.release()
+    mark_collection_released(collection.name)
+    assert not state.ready
+    state.ensure_loaded()
+    assert collection.loaded and collection.loads == 3
+
+
+def test_rebuilding_an_index_reloads_the_collection(monkeypatch, tmp_path):
+    class IndexedCollection:
+        name = "rebuilt"
+
+        def __init__(self):
+            self.loaded, self.index, self.calls = False, {"index_type": "FLAT"}, []
+
+        def has_index(self):
+            return self.index is not None
+
+        def release(self):
+            self.calls.append("release")
+            self.loaded = False
+
+        def drop_index(self):
+            self.calls.append("drop_index")
+            self.index = None
+
+        def create_index(self, field_name, index_params):
+            self.calls.append("create_index")
+            self.index = index_params
+
+        def load(self, *args, **kwargs):
+            self.calls.append("load")
+            self.loaded = True
+
+    collection = IndexedCollection()
+    monkeypatch.setattr(collection_state.utility, "loading_progress",
+                        lambda name, using="default": "100%" if collection.loaded else "0%")
+    monkeypatch.setattr(search_profiles, "_profiles", search_profiles.SearchProfiles(str(tmp_path / "p.json")))
+    state = get_collection_state(collection)
+    state.poll_interval = 0.01
+    state.ensure_loaded()
+    advice = build_index(collection, recommend_index(50000, 64, memory_budget_mb=2048))
+    assert collection.calls == ["load", "release", "drop_index", "create_index", "load"]
+    assert collection.index == advice["index_params"] and state.ready and collection.loaded
@@ -0,0 +1,52 @@
+import os
+
+import numpy as np
+import pytest
+
+from benchmarks.stand_ins import HashingEncoder
+from milvus.embedding_store import EmbeddingStore, get_embedding_store
+from milvus.ingestion import encode_cached
+
+
+class CountingEncoder(HashingEncoder):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.encoded = []
+
+    def encode(self, sentences, batch_size=32, **kwargs):
+        self.encoded.extend(sentences)
+        return super().encode(sentences, batch_size=batch_size, **kwargs)
+
+
+def test_reingestion_encodes_only_new_or_changed_texts(tmp_path):
+    model = CountingEncoder(dim=16)
+    # models without a pinned revision are never cached
+    assert get_embedding_store(model, root=str(tmp_path)) is None
+    model.model_id = "hashing-encoder@1"
+    store = get_embedding_store(model, root=str(tmp_path))
+    texts = ["first answer", "second answer", "third answer"]
+    first = encode_cached(model, texts, store=store)
+    assert sorted(model.encoded) == sorted(texts)
+    model.encoded.clear()
+    changed = ["first answer", "second answer, revised", "third answer", "fourth answer"]
+    second = encode_cached(model, changed, store=store)
+    assert sorted(model.encoded) == ["fourth answer", "second answer, revised"]
+    assert np.allclose(second, model.encode(changed))
+    assert np.allclose(second[[0, 2]], first[[0, 2]])
+    # a fresh process reads the same rows from disk
+    reopened = EmbeddingStore(store.directory, store.model_name)
+    assert len(reopened) == 5
+    assert reopened.get_many(changed)[1] == []
+    assert reopened.compact(changed) == 1 and len(EmbeddingStore(store.directory, store.model_name)) == 4
+
+
+def test_store_recovers_from_a_torn_append_and_rejects_other_models(tmp_path):
+    store = EmbeddingStore(str(tmp_path), "model-a")
+    store.put_many(["a", "b"], np.ones((2, 4), dtype=np.float32))
+    with open(os.path.join(str(tmp_path), "vectors.f32"), "ab") as f:
+        f.write(np.zeros(4, dtype=np.float32).tobytes())
+    recovered = EmbeddingStore(str(tmp_path), "model-a")
+    assert len(recovered) == 2
+    assert os.path.getsize(os.path.join(str(tmp_path), "vectors.f32")) == 2 * 4 * 4
+    with pytest.raises(ValueError):
+        EmbeddingStore(str(tmp_path), "model-b")
@@ -0,0 +1,20 @@
+import pytest
+
+from utils.encoder_backends import apply_backend, with_backend
+
+
+def test_unknown_backends_are_rejected():
+    with pytest.raises(ValueError):
+        with_backend(lambda: None, "fp16")
+    model = object()
+    assert apply_backend(model, "fp32") is model
+
+
+def test_int8_quantizes_linear_layers_of_a_copy():
+    torch = pytest.importorskip("torch")
+    model = torch.nn.Sequential(torch.nn.Linear(16, 16), torch.nn.ReLU(), torch.nn.Linear(16, 4))
+    quantized = apply_backend(model, "int8")
+    assert isinstance(model[0], torch.nn.Linear)
+    assert "quantized" in type(quantized[0]).__module__
+    x = torch.randn(8, 16)
+    assert torch.nn.functional.cosine_similarity(model(x), quantized(x)).min() > 0.95
@@ -0,0 +1,36 @@
+import pytest
+
+from database.index_advisor import candidates, recommend_index, size_nlist
+
+
+def test_small_collections_stay_flat():
+    advice = recommend_index(5000, 768, index_type="AUTO")
+    assert advice["index_params"] == {"index_type": "FLAT", "metric_type": "IP", "params": {}}
+    assert advice["memory_bytes"] == 5000 * (768 * 4 + 8)
+
+
+def test_advice_follows_the_memory_budget():
+    assert recommend_index(100000, 768, memory_budget_mb=2048, index_type="AUTO")["index_type"] == "HNSW"
+    assert recommend_index(1000000, 768, memory_budget_mb=3000, index_type="AUTO")["index_type"] == "IVF_FLAT"
+    assert recommend_index(1000000, 768, memory_budget_mb=1024, index_type="AUTO")["index_type"] == "IVF_SQ8"
+    advice = recommend_index(10000000, 768, memory_budget_mb=2048, index_type="AUTO")
+    assert advice["index_type"] == "IVF_PQ"
+    assert 768 % advice["index_params"]["params"]["m"] == 0
+    assert advice["memory_bytes"] <= 2048 * 2 ** 20
+    with pytest.raises(ValueError):
+        recommend_index(10000000, 768, memory_budget_mb=64, index_type="AUTO")
+
+
+def test_estimates_and_sizing():
+    assert size_nlist(100) == 2
+    assert size_nlist(1000000) == 4096
+    by_type = {advice["index_type"]: advice for advice in candidates(1000000, 768)}
+    assert by_type["IVF_SQ8"]["memory_bytes"] < by_type["IVF_FLAT"]["memory_bytes"] < by_type["HNSW"]["memory_bytes"]
+    assert by_type["FLAT"]["build_seconds"] == 0.0 < by_type["IVF_FLAT"]["build_seconds"]
+    assert by_type["HNSW"]["search_profiles"]["balanced"] == {"ef": 64}
+
+
+def test_configured_index_type_is_sized_not_chosen():
+    advice = recommend_index(1000000, 768, memory_budget_mb=16, index_type="IVF_FLAT")
+    assert advice["index_params"]["params"] == {"nlist": 4096}
+    assert advice["reason"] == "configured"
@@ -0,0 +1,93 @@
+import contextlib
+
+import numpy as np
+
+from benchmarks.stand_ins import HashingEncoder
+from milvus.ingestion import encode_bucketed, token_budget_batches, token_lengths
+from milvus import question_answering
+from milvus.question_answering import load_data_to_mysql, store_embeddings
+from utils.corpus import get_corpus_version
+
+
+def test_batches_respect_the_token_budget():
+    lengths = np.array([10, 200, 12, 180, 11, 9, 50])
+    batches = token_budget_batches(lengths, max_tokens=400, max_batch_size=4)
+    assert sorted(np.concatenate(batches).tolist()) == list(range(len(lengths)))
+    for batch in batches:
+        assert len(batch) == 1 or len(batch) * lengths[batch].max() <= 400
+        assert len(batch) <= 4
+    assert batches[0].tolist() == [1, 3]
+    # a text longer than the budget still gets a batch of its own
+    assert [b.tolist() for b in token_budget_batches([500, 5], max_tokens=100)] == [[0], [1]]
+
+
+def test_encode_bucketed_restores_the_original_order():
+    model = HashingEncoder(dim=32, max_seq_length=16)
+    texts = ["short", "a much longer text " * 10, "mid length text here", "x"]
+    assert token_lengths(model, texts).tolist() == [3, 16, 6, 3]
+    embeddings = encode_bucketed(model, texts, max_tokens=20, max_batch_size=8)
+    assert np.allclose(embeddings, model.encode(texts))
+
+
+class RecordingCursor:
+    def __init__(self):
+        self.rows = []
+        self.statements = []
+
+    def execute(self, sql, args=None):
+        self.statements.append(sql)
+        return 1 if sql.startswith("SHOW TABLES") else 0
+
+    def executemany(self, sql, rows):
+        self.rows.extend(rows)
+        return len(rows)
+
+    def fetchone(self):
+        return None
+
+
+class RecordingConnection:
+    commits = 0
+
+    def commit(self):
+        self.commits += 1
+
+
+def test_mysql_load_inserts_every_row_once_and_publishes_the_change():
+    cursor, conn = RecordingCursor(), RecordingConnection()
+    data = [(str(i), f"question {i}", f"answer {i}") for i in range(2500)]
+    version = get_corpus_version()
+    load_data_to_mysql(cursor, conn, "qa", data)
+    assert cursor.rows == data
+    assert conn.commits == 4
+    assert any(sql.startswith("INSERT INTO corpus_version") for sql in cursor.statements)
+    assert get_corpus_version() == version + 1
+
+
+class RecordingCollection:
+    name = "qa"
+    num_entities = 0
+
+    def insert(self, data):
+        return type("MutationResult", (), {"primary_keys": list(range(len(data[0])))})()
+
+
+def test_milvus_only_ingestion_publishes_the_change(monkeypatch):
+    cursor = RecordingCursor()
+
+    class Connection(RecordingConnection):
+        closed = False
+
+        def cursor(self):
+            return contextlib.nullcontext(cursor)
+
+        def close(self):
+            self.closed = True
+
+    conn = Connection()
+    monkeypatch.setattr(question_answering.pymysql, "connect", lambda **kwargs: conn)
+    version = get_corpus_version()
+    assert store_embeddings(RecordingCollection(), [[0.0, 1.0], [1.0, 0.0]]) == [0, 1]
+    assert any(sql.startswith("INSERT INTO corpus_version") for sql in cursor.statements)
+    assert conn.commits == 1 and conn.closed
+    assert get_corpus_version() == version + 1
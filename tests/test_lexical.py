@@ -0,0 +1,93 @@
+from contextlib import contextmanager
+
+from benchmarks.serving import build_service
+from benchmarks.stand_ins import HashingEncoder
+from milvus.lexical import BM25Index, Hit, reciprocal_rank_fusion
+
+QUESTIONS = ["Does Medicare cover flu shots?",
+             "How do I file a claim for dental work?",
+             "What is the deductible for Medicare Part B?",
+             "Can I change my life insurance beneficiary?"]
+
+
+def test_bm25_ranks_keyword_matches_first():
+    index = BM25Index(ids=[10, 11, 12, 13], texts=QUESTIONS)
+    hits = index.search(["medicare deductible", "beneficiary", "weather forecast"], limit=3)
+    assert [hit.id for hit in hits[0]] == ["12", "10"]
+    assert [hit.id for hit in hits[1]] == ["13"]
+    assert hits[2] == []
+    assert index.search(["medicare deductible"], limit=3)[0][0].distance > hits[0][1].distance
+    strict = BM25Index(ids=[10, 11, 12, 13], texts=QUESTIONS, min_match=1.0)
+    assert [hit.id for hit in strict.search(["medicare deductible"])[0]] == ["12"]
+
+
+def test_reciprocal_rank_fusion_rewards_agreement():
+    dense = [Hit(1, 0.9), Hit(2, 0.8), Hit(3, 0.7)]
+    lexical = [Hit("3", 12.0), Hit("4", 9.0)]
+    fused = reciprocal_rank_fusion([dense, lexical], k=60, limit=3)
+    assert [hit.id for hit in fused] == ["3", "1", "2"]
+    assert fused[0].distance == 1 / 63 + 1 / 61
+
+
+def test_hybrid_service_ranks_keyword_matches_first():
+    answers = ["Yes, once a year.", "Send the form to the claims office.", "It is set every year.",
+               "Yes, by contacting your agent."]
+    service = build_service(QUESTIONS, answers, HashingEncoder(dim=32), hybrid=True)
+    # the hashed answers barely resemble the question: keep every dense hit and let BM25 rank them
+    service.score_threshold = service.score_margin = None
+    try:
+        ranked = service.search_answers("beneficiary change")
+    finally:
+        service.close()
+    assert ranked[0]["question"] == QUESTIONS[3]
+
+
+def test_hybrid_service_never_nests_pooled_connections():
+    service = build_service(QUESTIONS, ["a", "b", "c", "d"], HashingEncoder(dim=32), hybrid=True)
+    pool, depth = service.pool, []
+    checkout = pool.cursor
+
+    @contextmanager
+    def cursor():
+        # a pool of one connection would block on a nested checkout
+        assert not depth, "nested pooled cursor checkout"
+        depth.append(1)
+        try:
+            with checkout() as c:
+                yield c
+        finally:
+            depth.pop()
+    pool.cursor = cursor
+    try:
+        service._drop_lexical_index()
+        service.search_answers("beneficiary change")
+        service._drop_lexical_index()
+        service.search_answers_batch(["medicare deductible", "flu shots"])
+    finally:
+        service.close()
+
+
+def test_hybrid_service_needs_a_dense_hit_above_the_cutoff():
+    service = build_service(QUESTIONS, ["a", "b", "c", "d"], HashingEncoder(dim=32), hybrid=True)
+    # inner products of normalized vectors never pass this cutoff
+    service.score_threshold = 1.01
+    pool, lookups = service.pool, []
+    checkout = pool.cursor
+
+    @contextmanager
+    def cursor():
+        with checkout() as c:
+            execute = c.execute
+
+            def recording(sql, args=None):
+                if " where id in " in sql:
+                    lookups.append(sql)
+                return execute(sql, args)
+            c.execute = recording
+            yield c
+    pool.cursor = cursor
+    try:
+        assert service.search_answers("beneficiary change") == []
+    finally:
+        service.close()
+    assert not lookups
@@ -0,0 +1,32 @@
+from utils.metrics import MetricsRegistry, track_ingestion, INGESTED_ROWS
+
+
+def test_registry_renders_prometheus_text():
+    registry = MetricsRegistry()
+    requests = registry.counter("qa_test_requests_total", "Requests", labelnames=("outcome",))
+    in_flight = registry.gauge("qa_test_in_flight", "In flight")
+    latency = registry.histogram("qa_test_latency_seconds", "Latency", buckets=(0.1, 1.0))
+    requests.inc(outcome="ok")
+    requests.inc(2, outcome="ok")
+    in_flight.inc()
+    latency.observe(0.05)
+    latency.observe(0.5)
+    latency.observe(5)
+    registry.register_collector(lambda: [("qa_test_ratio", "gauge", "Ratio", [({"cache": "answer"}, 0.25)])])
+    text = registry.render()
+    assert "# TYPE qa_test_requests_total counter" in text
+    assert 'qa_test_requests_total{outcome="ok"} 3' in text
+    assert "qa_test_in_flight 1" in text
+    assert 'qa_test_latency_seconds_bucket{le="0.1"} 1' in text
+    assert 'qa_test_latency_seconds_bucket{le="1"} 2' in text
+    assert 'qa_test_latency_seconds_bucket{le="+Inf"} 3' in text
+    assert "qa_test_latency_seconds_count 3" in text
+    assert 'qa_test_ratio{cache="answer"} 0.25' in text
+
+
+def test_track_ingestion_counts_rows():
+    before = INGESTED_ROWS.value(store="test")
+    with track_ingestion("test") as rows:
+        rows.append(10)
+        rows.append(5)
+    assert INGESTED_ROWS.value(store="test") == before + 15
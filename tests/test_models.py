@@ -0,0 +1,67 @@
+import threading
+import time
+
+import pytest
+
+from utils.models import ModelRegistry, local_sentence_transformer, model_files, verify_model_dir, write_manifest
+
+
+def test_models_load_once_on_first_use():
+    loads = []
+
+    def load():
+        loads.append(1)
+        time.sleep(0.05)
+        return object()
+
+    registry = ModelRegistry({"encoder": load})
+    assert not registry.is_loaded("encoder") and loads == []
+    models = []
+    threads = [threading.Thread(target=lambda: models.append(registry.get("encoder"))) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(loads) == 1
+    assert len({id(model) for model in models}) == 1
+    assert registry.load_times()["encoder"] >= 0.05
+
+
+def test_unknown_models_and_failed_loads():
+    def broken():
+        raise OSError("no weights")
+
+    registry = ModelRegistry({"broken": broken})
+    with pytest.raises(KeyError):
+        registry.get("missing")
+    with pytest.raises(OSError):
+        registry.get("broken")
+    assert not registry.is_loaded("broken")
+    registry.register("broken", lambda: "model")
+    assert registry.get("broken") == "model"
+
+
+def test_local_models_are_verified_against_their_manifest(tmp_path):
+    (tmp_path / "1_Pooling").mkdir()
+    (tmp_path / "config.json").write_text('{"hidden_size": 768}')
+    (tmp_path / "1_Pooling" / "config.json").write_text('{"pooling_mode_mean_tokens": true}')
+    manifest = write_manifest(str(tmp_path), "sentence-transformers/all-mpnet-base-v2", "abc123")
+    assert sorted(manifest["files"]) == ["1_Pooling/config.json", "config.json"]
+    assert verify_model_dir(str(tmp_path), "abc123")["revision"] == "abc123"
+    with pytest.raises(ValueError):
+        verify_model_dir(str(tmp_path), "def456")
+    (tmp_path / "config.json").write_text('{"hidden_size": 1024}')
+    with pytest.raises(ValueError):
+        verify_model_dir(str(tmp_path))
+    registry = ModelRegistry({"missing": local_sentence_transformer(str(tmp_path / "missing"))})
+    with pytest.raises(FileNotFoundError):
+        registry.get("missing")
+
+
+def test_only_the_files_sentence_transformers_loads_are_downloaded():
+    repository = ["config.json", "modules.json", "tokenizer.json", "vocab.txt", "1_Pooling/config.json",
+                  "model.safetensors", "pytorch_model.bin", "tf_model.h5", "flax_model.msgpack", "rust_model.ot",
+                  "onnx/model.onnx", "onnx/config.json", "openvino/openvino_model.xml"]
+    assert model_files(repository) == ["config.json", "modules.json", "tokenizer.json", "vocab.txt",
+                                       "1_Pooling/config.json", "model.safetensors"]
+    assert "pytorch_model.bin" in model_files(["config.json", "pytorch_model.bin", "tf_model.h5"])
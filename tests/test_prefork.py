@@ -0,0 +1,81 @@
+import gc
+import os
+import sys
+from types import SimpleNamespace
+
+import pytest
+
+import internals.prefork as prefork
+from internals.prefork import STARTUP_FAILED, RestartBackoff, Supervisor, threads_per_worker
+
+
+def test_threads_per_worker_splits_the_cores():
+    cores = os.cpu_count() or 1
+    assert threads_per_worker(1, 0) == cores
+    assert threads_per_worker(cores * 2, 0) == 1
+    assert threads_per_worker(4, 3) == 3
+
+
+def test_backoff_doubles_on_startup_failures_and_gives_up():
+    backoff = RestartBackoff(delay=1.0, max_delay=3.0, max_failures=4, min_uptime=10.0)
+    failed = STARTUP_FAILED << 8
+    assert [backoff.next_delay(0, failed, 60.0) for _ in range(3)] == [1.0, 2.0, 3.0]
+    assert backoff.next_delay(1, 0, 0.5) == 1.0
+    assert backoff.next_delay(0, 0, 60.0) == 1.0
+    assert [backoff.next_delay(0, 0, 0.5) for _ in range(4)] == [1.0, 2.0, 3.0, None]
+
+
+def fork(exit_status: int) -> int:
+    pid = os.fork()
+    if pid == 0:
+        os._exit(exit_status)
+    return pid
+
+
+def test_supervisor_stops_after_repeated_startup_failures():
+    spawned = []
+
+    def spawn(index):
+        spawned.append(index)
+        return fork(STARTUP_FAILED)
+    supervisor = Supervisor(spawn, 2, RestartBackoff(delay=0.01, max_delay=0.02, max_failures=3, min_uptime=0.0))
+    with pytest.raises(RuntimeError):
+        supervisor.run()
+    assert spawned.count(0) <= 3 and spawned.count(1) <= 3 and 3 in (spawned.count(0), spawned.count(1))
+    assert not supervisor.children
+
+
+def test_supervisor_restarts_workers_until_stopped():
+    spawned = []
+    supervisor = None
+
+    def spawn(index):
+        spawned.append(index)
+        if len(spawned) == 3:
+            supervisor.stop()
+        return fork(0)
+    supervisor = Supervisor(spawn, 1, RestartBackoff(delay=0.01, min_uptime=0.0))
+    supervisor.run()
+    assert spawned == [0, 0, 0]
+    assert not supervisor.children and not supervisor.restarts
+
+
+def test_shared_model_is_the_encoder_of_the_served_collection(monkeypatch):
+    loaded = []
+
+    class Model:
+        def eval(self):
+            return self
+
+        def parameters(self):
+            return []
+
+    monkeypatch.setitem(sys.modules, "torch", SimpleNamespace(set_grad_enabled=lambda enabled: None))
+    monkeypatch.setattr(prefork, "MODEL_COLLECTIONS", {prefork.MILVUS_COLLECTION: "multilingual"})
+    monkeypatch.setattr(prefork, "get_model", lambda name: loaded.append(name) or Model())
+    try:
+        prefork.load_shared_model()
+    finally:
+        if hasattr(gc, "unfreeze"):
+            gc.unfreeze()
+    assert loaded == ["multilingual"]
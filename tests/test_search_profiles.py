@@ -0,0 +1,77 @@
+from types import SimpleNamespace
+
+import numpy as np
+
+from milvus.lexical import Hit
+from milvus.search_profiles import SearchProfiles, autotune, exact_top_k, get_search_params, recall_at_k
+
+
+class ProbedCollection:
+    """IVF-like stand-in: with nprobe < 8 only every other vector is reachable"""
+    name = "qa_profiles"
+    indexes = [SimpleNamespace(field_name="embedding", params={"index_type": "IVF_FLAT", "params": {"nlist": 16}})]
+
+    def __init__(self, vectors):
+        self.vectors = vectors
+
+    def search(self, data, anns_field, param, limit):
+        reachable = np.arange(len(self.vectors))
+        if param["params"]["nprobe"] < 8:
+            reachable = reachable[::2]
+        scores = np.asarray(data) @ self.vectors[reachable].T
+        return [[Hit(int(reachable[i]), float(row[i])) for i in np.argsort(-row)[:limit]] for row in scores]
+
+
+def test_exact_top_k_and_recall():
+    vectors = np.eye(4, dtype=np.float32)
+    truth = exact_top_k([10, 11, 12, 13], vectors, vectors[[2]], k=1)
+    assert truth == [[12]]
+    assert recall_at_k([[12, 10]], truth, k=1) == 1.0
+    assert recall_at_k([[10]], truth, k=1) == 0.0
+
+
+def test_autotune_picks_cheapest_nprobe_per_recall_target():
+    rng = np.random.default_rng(0)
+    vectors = rng.standard_normal((200, 16)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    collection = ProbedCollection(vectors)
+    report = autotune(collection, vectors[:40], k=5, corpus=(list(range(200)), vectors), repeats=1,
+                      targets={"fast": 0.4, "accurate": 0.99})
+    assert report["param"] == "nprobe"
+    assert [point["value"] for point in report["sweep"]] == [1, 2, 4, 8]
+    assert report["profiles"] == {"fast": {"nprobe": 1}, "accurate": {"nprobe": 8}}
+
+
+def test_profiles_fall_back_to_defaults_and_persist(tmp_path):
+    path = str(tmp_path / "profiles.json")
+    profiles = SearchProfiles(path)
+    assert profiles.get("qa", "balanced") == {"nprobe": 16}
+    profiles.set("qa", {"balanced": {"nprobe": 32}})
+    profiles.save()
+    assert SearchProfiles(path).get("qa", "balanced") == {"nprobe": 32}
+    assert SearchProfiles(path).get("other", "balanced") == {"nprobe": 16}
+
+
+def test_untuned_collections_get_the_params_of_their_index(monkeypatch, tmp_path):
+    import milvus.search_profiles as search_profiles
+
+    class HNSWCollection:
+        name = "qa_hnsw"
+        indexes = [SimpleNamespace(field_name="embedding",
+                                   params={"index_type": "HNSW", "params": {"M": 16, "efConstruction": 200}})]
+
+    monkeypatch.setattr(search_profiles, "_profiles", SearchProfiles(str(tmp_path / "profiles.json")))
+    assert get_search_params(HNSWCollection(), "balanced") == {"metric_type": "IP", "params": {"ef": 64}}
+    assert get_search_params(ProbedCollection(None), "accurate")["params"] == {"nprobe": 16}
+
+
+def test_profiles_are_reloaded_when_the_file_changes(tmp_path):
+    path = str(tmp_path / "profiles.json")
+    profiles = SearchProfiles(path)
+    assert not profiles.refresh()
+    # e.g. autotune in another process
+    other = SearchProfiles(path)
+    other.set("qa", {"balanced": {"nprobe": 48}})
+    other.save()
+    assert profiles.refresh() and profiles.get("qa", "balanced") == {"nprobe": 48}
+    assert not profiles.refresh()
@@ -0,0 +1,28 @@
+import time
+
+from milvus.tracing import current_trace, trace_cache, trace_request, trace_stage
+
+
+def test_trace_records_stages_and_cache_hits():
+    with trace_request("What is AAA?", slow_ms=-1) as trace:
+        with trace_stage("encode"):
+            time.sleep(0.01)
+        with trace_stage("search"):
+            pass
+        trace_cache("answer", False)
+        with trace_request("nested") as nested:
+            assert nested is trace
+    assert current_trace() is None
+    report = trace.to_dict()
+    assert report["question"] == "What is AAA?"
+    assert report["stages_ms"]["encode"] >= 10
+    assert set(report["stages_ms"]) == {"encode", "search"}
+    assert report["cache"] == {"answer": False}
+    assert report["total_ms"] >= report["stages_ms"]["encode"]
+
+
+def test_stages_outside_a_request_are_ignored():
+    with trace_stage("encode") as trace:
+        assert trace is None
+    trace_cache("answer", True)
+    assert current_trace() is None
@@ -0,0 +1,15 @@
+from benchmarks.serving import build_service, synthetic_corpus
+from benchmarks.stand_ins import HashingEncoder
+from milvus.warmup import is_ready, warm_up, warmup_report
+
+
+def test_warm_up_runs_every_step_before_reporting_ready():
+    questions, answers = synthetic_corpus(50)
+    service = build_service(questions, answers, HashingEncoder(dim=32))
+    try:
+        timings = warm_up(service, lengths=[4, 16], batch_sizes=[1, 4])
+    finally:
+        service.close()
+    assert set(timings) == {"encoder", "collection", "search", "mysql", "metadata", "total"}
+    assert is_ready()
+    assert warmup_report() == timings